@@ -0,0 +1,281 @@
+from array import array # Importing array for typed columns when NumPy is not installed
+from records import NO_DEPARTURE, normalize_station  # Importing station normalization and the unknown-departure key
+
+numpy = None    # Set by load_numpy(); without NumPy the same results come from plain loops over array columns
+numpy_checked = False
+
+
+GROUPS = ("route", "train", "hour", "station")
+UNKNOWN_HOUR = 24   # Hour group of trains whose timings could not be parsed
+COLUMNS = {
+    "train": ("train_id", "source", "destination", "hour", "capacity", "bookings", "seats_sold", "load_factor",
+              "revenue"),
+    "route": ("source", "destination", "trains", "capacity", "bookings", "seats_sold", "load_factor", "revenue"),
+    "hour": ("hour", "trains", "capacity", "bookings", "seats_sold", "load_factor", "revenue"),
+    "station": ("station", "boardings", "alightings", "passengers"),
+}
+
+
+def load_numpy():
+    """Imports NumPy on the first analytics build; returns whether it is installed."""
+    # Not at module import: reservation imports this module, and NumPy costs more than the rest of startup
+    global numpy, numpy_checked
+    if not numpy_checked:
+        try:
+            import numpy    # Importing numpy for vectorized column aggregates (optional)
+        except ImportError:
+            numpy = None
+        numpy_checked = True
+    return numpy is not None
+
+
+class Column:
+    """Growable typed column: a NumPy array when NumPy is installed, otherwise an array.array."""
+
+    __slots__ = ("data", "size")
+
+    def __init__(self, typecode):
+        self.size = 0
+        if numpy is not None:
+            self.data = numpy.zeros(64, dtype=numpy.float64 if typecode == "d" else numpy.int64)
+        else:
+            self.data = array(typecode)
+
+    def append(self, value):
+        if numpy is None:
+            self.data.append(value)
+        else:
+            if self.size == len(self.data):
+                self.data = numpy.concatenate([self.data, numpy.zeros_like(self.data)])
+            self.data[self.size] = value
+        self.size += 1
+
+    def add(self, index, value):
+        self.data[index] += value
+
+    def values(self):
+        return self.data[:self.size] if numpy is not None else self.data
+
+    def __len__(self):
+        return self.size
+
+
+def codes_column(values, count):
+    """Integer column of `count` values from an iterable, built in one pass."""
+    if numpy is not None:
+        return numpy.fromiter(values, dtype=numpy.int64, count=count)
+    return array("q", values)
+
+
+def group_sum(codes, weights, groups):
+    """Sum of `weights` per code in range(groups): numpy.bincount, or one loop without NumPy."""
+    if numpy is not None:
+        return numpy.bincount(codes, weights=weights, minlength=groups)[:groups]
+    totals = [0.0] * groups
+    for code, weight in zip(codes, weights):
+        totals[code] += weight
+    return totals
+
+
+def ratio(numerators, denominators):
+    if numpy is not None:
+        numerators, denominators = numpy.asarray(numerators, dtype=float), numpy.asarray(denominators, dtype=float)
+        return numpy.divide(numerators, denominators, out=numpy.zeros_like(numerators), where=denominators > 0)
+    return [numerator / denominator if denominator else 0.0
+            for numerator, denominator in zip(numerators, denominators)]
+
+
+def top_order(values, top=None):
+    """Indexes of `values` from largest to smallest (ties keep their order), at most `top` of them."""
+    if numpy is not None:
+        order = numpy.argsort(-numpy.asarray(values, dtype=float), kind="stable")
+    else:
+        order = sorted(range(len(values)), key=lambda index: -values[index])
+    return order[:top] if top is not None else order
+
+
+class OccupancyAnalytics:
+    """Load factor, revenue and ticket sales aggregated by train, route, departure hour and station.
+
+    Trains are rows of typed columns (capacity, fare, route and hour codes)
+    plus running per-train and per-station totals. ``rebuild`` fills the
+    totals from the whole booking history in vectorized passes; after that
+    ``record_booking`` adds or subtracts single bookings as the core applies
+    them, so history is never rescanned. Route and hour aggregates are
+    grouped from the per-train totals when asked for.
+
+    Load factor is seat-segments sold over seat-segments offered, so a seat
+    sold for half of a train's run counts half. Revenue is the train's fare
+    per seat booked.
+    """
+
+    def __init__(self):
+        load_numpy()
+        self.train_index = {}   # train ID -> row
+        self.train_ids = []
+        self.route_index = {}   # (source key, destination key) -> route code
+        self.routes = []        # (source, destination) display names by route code
+        self.station_index = {}     # station key -> station code
+        self.stations = []
+        self.train_stations = []    # station codes of every train's stops, by row
+        self.capacity = Column("q")
+        self.segments = Column("q")
+        self.price = Column("d")
+        self.route = Column("q")
+        self.hour = Column("q")
+        self.bookings = Column("q")
+        self.seats_sold = Column("q")
+        self.seat_segments = Column("q")
+        self.revenue = Column("d")
+        self.boardings = Column("q")
+        self.alightings = Column("q")
+
+    def station_code(self, name):
+        key = normalize_station(name)
+        code = self.station_index.get(key)
+        if code is None:
+            code = self.station_index[key] = len(self.stations)
+            self.stations.append(name)
+            self.boardings.append(0)
+            self.alightings.append(0)
+        return code
+
+    def add_train(self, train_id, train):
+        if train_id in self.train_index:
+            return
+        self.train_index[train_id] = len(self.train_ids)
+        self.train_ids.append(train_id)
+        route_key = (normalize_station(train.source), normalize_station(train.destination))
+        route = self.route_index.get(route_key)
+        if route is None:
+            route = self.route_index[route_key] = len(self.routes)
+            self.routes.append((train.source, train.destination))
+        self.train_stations.append([self.station_code(stop) for stop in train.stops])
+        self.capacity.append(train.capacity)
+        self.segments.append(train.segment_count)
+        self.price.append(train.price_value or 0.0)
+        self.route.append(route)
+        self.hour.append(UNKNOWN_HOUR if train.departure >= NO_DEPARTURE else train.departure // 60)
+        for column in (self.bookings, self.seats_sold, self.seat_segments, self.revenue):
+            column.append(0)
+
+    def rebuild(self, trains, bookings):
+        """Loads every train, then totals all bookings in one vectorized pass per column."""
+        for train_id, train in trains.items():
+            self.add_train(train_id, train)
+        train_index, segments = self.train_index, self.segments.data
+        legs = [(row, booking.seats) + (booking.leg or (0, segments[row]))
+                for booking in bookings for row in (train_index.get(booking.train_id),) if row is not None]
+        count = len(legs)
+        if not count:
+            return
+        trains_count, stations_count = len(self.train_ids), len(self.stations)
+        rows, seats, starts, stops = (codes_column((leg[field] for leg in legs), count) for field in range(4))
+        if numpy is not None:
+            lengths = stops - starts
+            ones = numpy.ones(count)
+            # Stop station codes of all trains laid end to end, so a leg's end stations are one gather
+            flat = numpy.fromiter((code for codes in self.train_stations for code in codes), dtype=numpy.int64)
+            first = numpy.cumsum([0] + [len(codes) for codes in self.train_stations])[:-1]
+            board, alight = flat[first[rows] + starts], flat[first[rows] + stops]
+            seat_segments = seats * lengths
+        else:
+            ones = [1] * count
+            board = array("q", (self.train_stations[row][start] for row, start in zip(rows, starts)))
+            alight = array("q", (self.train_stations[row][stop] for row, stop in zip(rows, stops)))
+            seat_segments = [seat * (stop - start) for seat, start, stop in zip(seats, starts, stops)]
+        for column, totals in ((self.bookings, group_sum(rows, ones, trains_count)),
+                               (self.seats_sold, group_sum(rows, seats, trains_count)),
+                               (self.seat_segments, group_sum(rows, seat_segments, trains_count)),
+                               (self.boardings, group_sum(board, seats, stations_count)),
+                               (self.alightings, group_sum(alight, seats, stations_count))):
+            if numpy is not None:
+                column.values()[:] += numpy.rint(totals).astype(numpy.int64)
+            else:
+                for index, total in enumerate(totals):
+                    column.data[index] += int(total)
+        if numpy is not None:
+            self.revenue.values()[:] = self.seats_sold.values() * self.price.values()
+        else:
+            self.revenue.data = array("d", (sold * price for sold, price in zip(self.seats_sold.data,
+                                                                                 self.price.data)))
+
+    def record_booking(self, train_id, seats, leg, bookings=1):
+        """Adds a booking (or, with negative seats and bookings, takes back a cancellation)."""
+        row = self.train_index.get(train_id)
+        if row is None:
+            return
+        start, stop = leg if leg is not None else (0, self.segments.data[row])
+        self.bookings.add(row, bookings)
+        self.seats_sold.add(row, seats)
+        self.seat_segments.add(row, seats * (stop - start))
+        self.revenue.add(row, seats * self.price.data[row])
+        self.boardings.add(self.train_stations[row][start], seats)
+        self.alightings.add(self.train_stations[row][stop], seats)
+
+    def aggregate(self, group_by="route"):
+        """Column lists of one grouping (see COLUMNS), in group order."""
+        if group_by not in GROUPS:
+            raise ValueError(f"Cannot group analytics by {group_by!r}.")
+        if group_by == "station":
+            boardings, alightings = list(self.boardings.values()), list(self.alightings.values())
+            return {"station": self.stations, "boardings": boardings, "alightings": alightings,
+                    "passengers": [a + b for a, b in zip(boardings, alightings)]}
+        offered = (self.capacity.values() * self.segments.values() if numpy is not None else
+                   [a * b for a, b in zip(self.capacity.values(), self.segments.values())])
+        if group_by == "train":
+            routes = [self.routes[route] for route in self.route.values()]
+            return {"train_id": self.train_ids, "source": [route[0] for route in routes],
+                    "destination": [route[1] for route in routes], "hour": list(self.hour.values()),
+                    "capacity": list(self.capacity.values()), "bookings": list(self.bookings.values()),
+                    "seats_sold": list(self.seats_sold.values()),
+                    "load_factor": list(ratio(self.seat_segments.values(), offered)),
+                    "revenue": list(self.revenue.values())}
+        codes, size = ((self.route.values(), len(self.routes)) if group_by == "route" else
+                       (self.hour.values(), UNKNOWN_HOUR + 1))
+        columns = {
+            "trains": group_sum(codes, [1] * len(self.train_ids), size),
+            "capacity": group_sum(codes, self.capacity.values(), size),
+            "bookings": group_sum(codes, self.bookings.values(), size),
+            "seats_sold": group_sum(codes, self.seats_sold.values(), size),
+            "load_factor": ratio(group_sum(codes, self.seat_segments.values(), size), group_sum(codes, offered, size)),
+            "revenue": group_sum(codes, self.revenue.values(), size),
+        }
+        # Sums come back as floats; the counts among them are reported as ints
+        columns = {name: list(values) if name in ("load_factor", "revenue") else [round(value) for value in values]
+                   for name, values in columns.items()}
+        if group_by == "route":
+            columns["source"] = [route[0] for route in self.routes]
+            columns["destination"] = [route[1] for route in self.routes]
+        else:
+            columns["hour"] = list(range(size))
+        return columns
+
+    def rows(self, group_by="route", top=None):
+        """Rows (tuples in COLUMNS order) of a grouping, best-selling first; hours stay in clock order."""
+        columns = self.aggregate(group_by)
+        names = COLUMNS[group_by]
+        if group_by == "hour":
+            order = [hour for hour, trains in enumerate(columns["trains"]) if trains][:top]
+        else:
+            order = top_order(columns["passengers" if group_by == "station" else "revenue"], top)
+        for index in order:
+            yield tuple(plain(columns[name][index]) for name in names)
+
+    def write_csv(self, file, group_by="route", top=None):
+        """Streams one grouping to an open text file as CSV; returns the number of rows written."""
+        import csv  # Imported on first export, like NumPy
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS[group_by])
+        count = 0
+        for row in self.rows(group_by, top):
+            writer.writerow(row)
+            count += 1
+        return count
+
+
+def plain(value):
+    """Python scalar of a column value (NumPy scalars do not format or pickle like ints and floats)."""
+    if numpy is not None and isinstance(value, numpy.generic):
+        return value.item()
+    return value
@@ -0,0 +1,538 @@
+import os   # Importing os for file sizes and paths
+import sys  # Importing sys for the Python version in the results
+import time # Importing time for wall-clock measurements
+import json # Importing json for the machine-readable results file
+import random   # Importing random for seeded workloads
+import shutil   # Importing shutil for copying datasets between scenarios
+import tempfile # Importing tempfile for scratch directories
+import tracemalloc  # Importing tracemalloc for peak memory measurements
+import subprocess   # Importing subprocess for recording the git revision
+import argparse # Importing argparse for the command line
+from datagen import generate_dataset, write_snapshot    # Importing the synthetic dataset generator
+from reservation import TrainTicketManagementSystem, ReservationError, ADMIN_EMAIL  # Importing the headless reservation core
+from storage import SQLiteStorage  # Importing the SQLite backend
+from seatmap import SeatMap # Importing SeatMap for raw seat allocation measurements
+from records import Train   # Importing the train record for timetable update measurements
+from journey import OPTIMIZE    # Importing the journey planner criteria
+from metrics import percentiles  # Importing the latency summary
+from server import ShardedSystem, split_snapshot    # Importing the sharded multi-process server
+import analytics    # Importing the analytics module to record whether NumPy was used
+from tracing import replay  # Importing the trace replay driver
+
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Registers a benchmark scenario; it receives a BenchmarkContext and returns a dict of metrics."""
+    def register(function):
+        SCENARIOS[name] = function
+        return function
+    return register
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+class BenchmarkContext:
+    """Dataset, workload parameters and fresh-system factory shared by the scenarios."""
+
+    def __init__(self, dataset, workdir, backend="pickle", operations=1000, seed=42):
+        self.dataset = dataset
+        self.workdir = workdir
+        self.backend = backend
+        self.operations = operations
+        self.seed = seed
+        self.snapshot_file = os.path.join(workdir, "dataset.pkl")
+        write_snapshot(dataset, self.snapshot_file)
+        self.db_file = None
+        if backend == "sqlite":
+            self.db_file = os.path.join(workdir, "dataset.db")
+            storage = SQLiteStorage(self.db_file)
+            system = TrainTicketManagementSystem(storage=storage)
+            storage.import_data(dataset["users"], dataset["trains"], dataset["bookings"])
+            system.close()
+        self.runs = 0
+        self.users = [email for email in dataset["users"] if email != ADMIN_EMAIL]
+        self.routes = [details["route"] for details in dataset["trains"].values()]
+        self.train_ids = list(dataset["trains"])
+
+    def rng(self):
+        return random.Random(self.seed)
+
+    def fresh_paths(self):
+        """Copies the dataset so every scenario starts from the same state."""
+        self.runs += 1
+        base = os.path.join(self.workdir, f"run{self.runs}")
+        if self.backend == "sqlite":
+            shutil.copy(self.db_file, base + ".db")
+        else:
+            shutil.copy(self.snapshot_file, base + ".pkl")
+        return base
+
+    def open_system(self, base=None, **options):
+        base = base or self.fresh_paths()
+        if self.backend == "sqlite":
+            return TrainTicketManagementSystem(storage=SQLiteStorage(base + ".db"), **options)
+        return TrainTicketManagementSystem(data_file=base + ".pkl", journal_file=base + ".journal", **options)
+
+    def bookable(self, system, rng):
+        """A random (user, train) pair with seats left, skewed like the dataset."""
+        for _ in range(100):
+            train_id = rng.choice(self.train_ids)
+            if int(system.trains[train_id]["availability"]) > 0:
+                return rng.choice(self.users), train_id
+        return rng.choice(self.users), self.train_ids[0]
+
+
+@scenario("startup")
+def startup_scenario(context):
+    base = context.fresh_paths()
+    seconds, system = timed(context.open_system, base)
+    system.close()
+    return {"load_seconds": seconds, "trains": len(context.dataset["trains"]),
+            "bookings": len(context.dataset["bookings"])}
+
+
+@scenario("cold_start")
+def cold_start_scenario(context):
+    """Wall time of fresh interpreters: the headless CLI opening the dataset, and importing the GUI."""
+    package = os.path.dirname(os.path.abspath(__file__))
+    base = context.fresh_paths()
+    storage = ["--db", base + ".db"] if context.backend == "sqlite" else ["--data-file", base + ".pkl",
+                                                                          "--journal", base + ".journal"]
+    samples, stats = [], None
+    for _ in range(5):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, os.path.join(package, "cli.py"), *storage, "stats"],
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(time.perf_counter() - start)
+        stats = json.loads(output)
+    result = {"cli_stats": percentiles(samples), "cli_import_seconds": stats["import_seconds"],
+              "cli_load_seconds": stats["load_seconds"], "cli_gui_loaded": stats["gui_loaded"]}
+    start = time.perf_counter()
+    gui = subprocess.run([sys.executable, "-c", "import train"], cwd=package, capture_output=True, text=True)
+    if gui.returncode == 0:
+        result["gui_import_seconds"] = time.perf_counter() - start
+    else:
+        result["gui_import_error"] = gui.stderr.strip().splitlines()[-1]   # e.g. no tkinter or PIL here
+    return result
+
+
+@scenario("memory")
+def memory_scenario(context):
+    base = context.fresh_paths()
+    tracemalloc.start()
+    system = context.open_system(base)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    bookings = max(1, len(context.dataset["bookings"]))
+    system.close()
+    return {"resident_bytes": current, "peak_bytes": peak, "bytes_per_booking": current / bookings}
+
+
+@scenario("search")
+def search_scenario(context):
+    system = context.open_system()
+    rng = context.rng()
+    query_samples, search_samples, filtered_samples = [], [], []
+    for _ in range(context.operations):
+        source, destination = rng.choice(context.routes)
+        query_samples.append(timed(system.query_trains, source, destination, limit=20)[0])
+        search_samples.append(timed(system.search_trains, source, destination)[0])
+        filtered_samples.append(timed(system.query_trains, source, destination, min_seats=2, max_price=1000,
+                                      depart_after="06:00", depart_before="18:00", limit=20)[0])
+    system.close()
+    return {"query_trains": percentiles(query_samples), "search_trains": percentiles(search_samples),
+            "query_trains_filtered": percentiles(filtered_samples)}
+
+
+@scenario("booking")
+def booking_scenario(context):
+    rng = context.rng()
+    system = context.open_system()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(context.operations):
+        user_email, train_id = context.bookable(system, rng)
+        try:
+            samples.append(timed(system.book_ticket, user_email, train_id, 1)[0])
+        except ReservationError:
+            pass
+    per_call_seconds = time.perf_counter() - start
+    system.close()
+
+    system = context.open_system()
+    user_email = context.users[0]
+    items = [context.bookable(system, rng)[1] for _ in range(context.operations)]
+    batch = system.book_many(user_email, [(train_id, 1) for train_id in items], atomic=False)
+    system.close()
+    return {"per_call": dict(percentiles(samples), throughput=len(samples) / per_call_seconds),
+            "book_many": {"items": len(items), "committed": batch.committed, "seconds": batch.elapsed,
+                          "throughput": batch.throughput}}
+
+
+@scenario("cancel")
+def cancel_scenario(context):
+    rng = context.rng()
+    system = context.open_system()
+    held = []
+    for _ in range(context.operations):
+        user_email, train_id = context.bookable(system, rng)
+        try:
+            system.book_ticket(user_email, train_id, 1)
+            held.append((user_email, train_id))
+        except ReservationError:
+            pass
+    samples = [timed(system.cancel_ticket, user_email, train_id, 1)[0] for user_email, train_id in held]
+    system.close()
+    return percentiles(samples)
+
+
+@scenario("seat_allocation")
+def seat_allocation_scenario(context, seats=2000, stops=40):
+    """Seat allocation on long multi-stop trains, on a bare SeatMap and through book_ticket."""
+    rng = context.rng()
+    seat_map = SeatMap(seats, stops - 1)
+    legs = []
+    for _ in range(context.operations * 10):
+        start = rng.randrange(stops - 1)
+        legs.append((rng.randint(1, 6), start, rng.randint(start + 1, min(stops - 1, start + 10))))
+    allocated = 0
+    elapsed = time.perf_counter()
+    for group, start, stop in legs:
+        if seat_map.allocate(group, start, stop) is not None:
+            allocated += 1
+    elapsed = time.perf_counter() - elapsed
+    # Share of seat-segments sold: above what whole-route selling could reach once legs are reused
+    sold = sum(segment.bit_count() for segment in seat_map.segments) / (seats * (stops - 1))
+    availability_samples = [timed(seat_map.available, start, stop)[0] for _, start, stop in legs[:context.operations]]
+
+    system = context.open_system()
+    train_id = system.add_train(ADMIN_EMAIL, "bench-origin", "bench-terminus", seats, "08:00", "100",
+                                stops=[f"bench-stop-{number}" for number in range(stops - 2)])
+    stations = system.trains[train_id]["stops"]
+    samples = []
+    for group, start, stop in legs[:context.operations]:
+        try:
+            samples.append(timed(system.book_ticket, context.users[0], train_id, group,
+                                 stations[start], stations[stop])[0])
+        except ReservationError:
+            pass
+    system.close()
+    return {"seats": seats, "stops": stops,
+            "seat_map": {"allocations": len(legs), "allocated": allocated,
+                         "throughput": len(legs) / elapsed if elapsed else float("inf"), "sold_ratio": sold},
+            "availability": percentiles(availability_samples),
+            "book_ticket": percentiles(samples)}
+
+
+@scenario("journey")
+def journey_scenario(context):
+    """Multi-leg journey planning per criterion, plus incremental timetable updates."""
+    rng = context.rng()
+    system = context.open_system()
+    stations = sorted({station for details in context.dataset["trains"].values()
+                       for station in details.get("stops", details["route"])})
+    build_seconds, planner = timed(system.journey_planner)
+    results = {"build_seconds": build_seconds, "stations": len(stations)}
+    for optimize in OPTIMIZE:
+        samples, found = [], 0
+        for _ in range(context.operations):
+            source, destination = rng.sample(stations, 2)
+            seconds, journey = timed(system.plan_journey, source, destination,
+                                     rng.choice(("06:00", "12:00", "18:00")), optimize)
+            samples.append(seconds)
+            found += journey is not None
+        results[optimize] = dict(percentiles(samples), found=found)
+    additions = [Train(*rng.sample(stations, 2), 100, f"{rng.randint(0, 23):02d}:00", "100")
+                 for _ in range(min(1000, context.operations))]
+    results["add_train"] = percentiles([timed(planner.add_train, f"bench-{number}", train)[0]
+                                        for number, train in enumerate(additions)])
+    system.close()
+    return results
+
+
+@scenario("instrumentation")
+def instrumentation_scenario(context):
+    """Cost of the metrics layer: the same searches and bookings with it off and on."""
+    results = {}
+    for mode in ("disabled", "enabled"):
+        rng = context.rng()
+        system = context.open_system(instrument=mode == "enabled")
+        search = [timed(system.query_trains, *rng.choice(context.routes), limit=20)[0]
+                  for _ in range(context.operations)]
+        booking = []
+        for _ in range(context.operations):
+            user_email, train_id = context.bookable(system, rng)
+            try:
+                booking.append(timed(system.book_ticket, user_email, train_id, 1)[0])
+            except ReservationError:
+                pass
+        system.close()
+        results[mode] = {"query_trains": percentiles(search), "book_ticket": percentiles(booking)}
+    return results
+
+
+@scenario("result_cache")
+def result_cache_scenario(context):
+    """Repeated popular searches and report reloads, with every tenth request a booking, cache off and on."""
+    results = {}
+    for mode, size in (("uncached", 0), ("cached", 1024)):
+        rng = context.rng()
+        system = context.open_system(cache_size=size)
+        routes = context.routes[:50]    # The popular routes
+        users = context.users[:50]
+        search, report = [], []
+        for index in range(context.operations):
+            if index % 10 == 9:
+                user_email, train_id = context.bookable(system, rng)
+                try:
+                    system.book_ticket(user_email, train_id, 1)
+                except ReservationError:
+                    pass
+            search.append(timed(system.search_trains, *rng.choice(routes))[0])
+            report.append(timed(system.generate_report, rng.choice(users))[0])
+        results[mode] = {"search_trains": percentiles(search), "generate_report": percentiles(report),
+                         "cache": system.cache_stats()}
+        system.close()
+    return results
+
+
+@scenario("bulk_import")
+def bulk_import_scenario(context):
+    """Trains per second through add_train one at a time versus a streamed CSV timetable import."""
+    rng = context.rng()
+    path = os.path.join(context.workdir, "timetable.csv")
+    rows = context.operations * 10
+    with open(path, "w", newline="") as file:
+        file.write("source,destination,availability,timings,price\n")
+        for _ in range(rows):
+            source, destination = rng.choice(context.routes)
+            file.write(f"{source},{destination},{rng.randint(100, 1000)},"
+                       f"{rng.randint(0, 23):02d}:{rng.choice((0, 30)):02d},{rng.randint(5, 200) * 10}\n")
+    system = context.open_system()
+    start = time.perf_counter()
+    for _ in range(context.operations):
+        source, destination = rng.choice(context.routes)
+        system.add_train(ADMIN_EMAIL, source, destination, 500, "08:00", "1000")
+    one_at_a_time = context.operations / (time.perf_counter() - start)
+    seconds, result = timed(system.import_timetable, ADMIN_EMAIL, path)
+    system.close()
+    return {"add_train_per_second": one_at_a_time, "import_rows": rows, "import_seconds": seconds,
+            "import_per_second": result.imported / seconds, "rejected": result.failed}
+
+
+@scenario("sharding")
+def sharding_scenario(context):
+    """Booking throughput of the sharded server with 1, 2 and 4 worker processes, requests pipelined."""
+    results = {}
+    for shards in (1, 2, 4):
+        rng = context.rng()
+        base = context.fresh_paths()
+        if context.backend == "sqlite":
+            shutil.copy(context.snapshot_file, base + ".pkl")
+        split_snapshot(base + ".pkl", base + ".journal", base, shards, context.backend)
+        router = ShardedSystem(shards, base, context.backend)
+        requests = [(rng.choice(context.users), rng.choice(context.train_ids)) for _ in range(context.operations)]
+        start = time.perf_counter()
+        futures = [router.submit("book_ticket", user_email, train_id, 1) for user_email, train_id in requests]
+        booked = sum(1 for future in futures if future.exception() is None)
+        elapsed = time.perf_counter() - start
+        search = [timed(router.search_trains, *rng.choice(context.routes))[0] for _ in range(100)]
+        router.close()
+        results[f"{shards}_shards"] = {"bookings_per_second": booked / elapsed, "booked": booked,
+                                       "search_trains": percentiles(search)}
+    return results
+
+
+@scenario("analytics")
+def analytics_scenario(context):
+    """Analytics column build, grouped aggregates per grouping, a per-booking Python scan for comparison,
+    and bookings with the columns kept current."""
+    rng = context.rng()
+    system = context.open_system()
+    build, _ = timed(system.analytics_report, ADMIN_EMAIL, "route", 20)
+    groupings = {group_by: percentiles([timed(system.analytics_report, ADMIN_EMAIL, group_by, 20)[0]
+                                        for _ in range(20)])
+                 for group_by in analytics.GROUPS}
+
+    def route_revenue_scan():
+        revenue = {}
+        for booking in system.bookings:
+            train = system.trains.get(booking.train_id)
+            if train is not None:
+                revenue[train["route"]] = revenue.get(train["route"], 0.0) + booking.seats * (train.price_value or 0.0)
+        return revenue
+
+    scan, _ = timed(route_revenue_scan)
+    booking = []
+    for _ in range(context.operations):
+        user_email, train_id = context.bookable(system, rng)
+        try:
+            booking.append(timed(system.book_ticket, user_email, train_id, 1)[0])
+        except ReservationError:
+            pass
+    after, _ = timed(system.analytics_report, ADMIN_EMAIL, "route", 20)
+    system.close()
+    return {"numpy": analytics.numpy is not None, "build_seconds": build, "groupings": groupings,
+            "python_scan_seconds": scan, "book_ticket": percentiles(booking), "route_after_bookings_seconds": after}
+
+
+@scenario("replay")
+def replay_scenario(context):
+    """A recorded mix of searches, bookings, cancellations and reports replayed with 1 and 4 workers."""
+    rng = context.rng()
+    trace_file = os.path.join(context.workdir, "trace.jsonl")
+    base = context.fresh_paths()
+    if context.backend == "sqlite":
+        shutil.copy(base + ".db", base + ".original.db")
+    else:
+        shutil.copy(base + ".pkl", base + ".original.pkl")
+    system = context.open_system(base, trace_file=trace_file)
+    for _ in range(context.operations):
+        choice = rng.random()
+        user_email, train_id = context.bookable(system, rng)
+        try:
+            if choice < 0.4:
+                system.search_trains(*rng.choice(context.routes))
+            elif choice < 0.8:
+                system.book_ticket(user_email, train_id, rng.randint(1, 3))
+            elif choice < 0.9:
+                system.cancel_ticket(user_email, train_id, 1)
+            else:
+                system.generate_report(user_email)
+        except ReservationError:
+            pass
+    system.close()
+    results = {}
+    for concurrency in (1, 4):
+        replayed = context.fresh_paths()
+        extension = ".db" if context.backend == "sqlite" else ".pkl"
+        shutil.copy(base + ".original" + extension, replayed + extension)
+        system = context.open_system(replayed)
+        result = replay(system, trace_file, concurrency=concurrency)
+        system.close()
+        results[f"{concurrency}_workers"] = {"operations_per_second": result.throughput,
+                                             "latency": result.latency["all"], "mismatches": result.mismatches,
+                                             "problems": len(result.problems)}
+    return results
+
+
+@scenario("report")
+def report_scenario(context):
+    rng = context.rng()
+    system = context.open_system()
+    samples = [timed(system.generate_report, rng.choice(context.users))[0] for _ in range(context.operations)]
+    system.close()
+    return percentiles(samples)
+
+
+@scenario("persistence")
+def persistence_scenario(context):
+    """Cost per mutation of the journal (or SQLite commit) versus full snapshot rewrites."""
+    rng = context.rng()
+    results = {}
+    modes = [("journal", {})]
+    if context.backend == "pickle":
+        # Full rewrites are slow on big datasets, so they get a smaller sample.
+        modes.append(("snapshot_rewrite", {"use_journal": False}))
+    for mode, options in modes:
+        base = context.fresh_paths()
+        system = context.open_system(base, compact_every=0, **options)
+        count = context.operations if mode == "journal" else max(1, min(50, context.operations // 20))
+        samples = []
+        for _ in range(count):
+            user_email, train_id = context.bookable(system, rng)
+            try:
+                samples.append(timed(system.book_ticket, user_email, train_id, 1)[0])
+            except ReservationError:
+                pass
+        result = percentiles(samples)
+        if mode == "journal" and context.backend == "pickle":
+            result["bytes_per_mutation"] = os.path.getsize(base + ".journal") / max(1, len(samples))
+            result["compaction_seconds"] = timed(system.compact)[0]
+        elif mode == "snapshot_rewrite":
+            result["bytes_per_mutation"] = os.path.getsize(base + ".pkl")
+        system.close()
+        results[mode] = result
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(trains=10000, stations=200, users=2000, bookings=50000, operations=1000, seed=42,
+                   backend="pickle", scenarios=None, max_stops=2):
+    """Runs the selected scenarios on a generated dataset and returns the results document."""
+    dataset = generate_dataset(trains, stations, users, bookings, seed, max_stops=max_stops)
+    workdir = tempfile.mkdtemp(prefix="train-bench-")
+    try:
+        context = BenchmarkContext(dataset, workdir, backend, operations, seed)
+        results = {}
+        for name in scenarios or SCENARIOS:
+            results[name] = SCENARIOS[name](context)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {"revision": git_revision(), "timestamp": time.time(), "python": sys.version.split()[0],
+                 "backend": backend},
+        "parameters": {"trains": trains, "stations": stations, "users": users, "bookings": bookings,
+                       "operations": operations, "seed": seed, "max_stops": max_stops},
+        "results": results,
+    }
+
+
+def flatten(results, prefix=""):
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            metrics[prefix + key] = value
+    return metrics
+
+
+def compare(baseline, current):
+    """Prints every shared metric with its relative change against a baseline run."""
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    for metric in sorted(old.keys() & new.keys()):
+        change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+        print(f"{metric:60} {old[metric]:>14.4f} {new[metric]:>14.4f} {change:+8.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless benchmarks for the train reservation core.")
+    parser.add_argument("--trains", type=int, default=10000)
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--bookings", type=int, default=50000)
+    parser.add_argument("--operations", type=int, default=1000, help="Operations per scenario.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-stops", type=int, default=2, help="Stations a generated train may call at.")
+    parser.add_argument("--backend", choices=("pickle", "sqlite"), default="pickle")
+    parser.add_argument("--scenarios", help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare this run against.")
+    arguments = parser.parse_args()
+    selected = arguments.scenarios.split(",") if arguments.scenarios else None
+    unknown = set(selected or ()) - SCENARIOS.keys()
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    document = run_benchmarks(arguments.trains, arguments.stations, arguments.users, arguments.bookings,
+                              arguments.operations, arguments.seed, arguments.backend, selected,
+                              arguments.max_stops)
+    with open(arguments.output, "w") as file:
+        json.dump(document, file, indent=2)
+    print(json.dumps(document["results"], indent=2))
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            compare(json.load(file), document)
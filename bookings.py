@@ -0,0 +1,83 @@
+from records import Booking, train_key  # Importing the compact booking record
+
+
+class BookingStore:
+    """Bookings keyed by a stable booking ID with secondary indexes.
+
+    ``by_user`` and ``by_train`` map an email / train ID to the list of that
+    owner's bookings, which keeps cancellation, per-user reports and per-train
+    manifests proportional to the owner's own bookings instead of the whole
+    booking history. Bookings are kept as compact Booking records keyed by
+    interned email / integer train, and the secondary indexes are plain lists
+    to keep the per-booking overhead small.
+    """
+
+    def __init__(self):
+        self.bookings = {}
+        self.by_user = {}
+        self.by_train = {}
+        self.next_booking_id = 1
+
+    @classmethod
+    def from_snapshot(cls, bookings):
+        """Builds the store from a pickled booking list (old pickles hold ID-less dicts)."""
+        store = cls()
+        if isinstance(bookings, dict):
+            bookings = bookings.values()
+        for booking in bookings:
+            store.insert(booking)
+        return store
+
+    def snapshot(self):
+        return list(self.bookings.values())
+
+    def insert(self, booking):
+        booking = Booking.from_details(booking)
+        booking_id = booking.booking_id
+        if booking_id is None:
+            booking_id = booking.booking_id = self.next_booking_id
+        self.next_booking_id = max(self.next_booking_id, booking_id + 1)
+        self.bookings[booking_id] = booking
+        self.by_user.setdefault(booking.user_email, []).append(booking)
+        self.by_train.setdefault(booking.train, []).append(booking)
+        return booking
+
+    def add(self, user_email, train_id, seats):
+        return self.insert({"user_email": user_email, "train_id": train_id, "seats": seats})
+
+    def update(self, booking):
+        pass  # Records are changed in place; stores that copy them write the change back
+
+    def remove(self, booking_id):
+        booking = self.bookings.pop(booking_id)
+        for index, key in ((self.by_user, booking.user_email), (self.by_train, booking.train)):
+            owned = index[key]
+            owned.remove(booking)
+            if not owned:
+                del index[key]
+        return booking
+
+    def get(self, booking_id):
+        return self.bookings.get(booking_id)
+
+    def for_user(self, user_email):
+        return list(self.by_user.get(user_email, ()))
+
+    def for_train(self, train_id):
+        return list(self.by_train.get(train_key(train_id), ()))
+
+    def find(self, user_email, train_id, seats):
+        """First booking of the user on the train holding at least `seats` seats."""
+        # Iterate over a copy: bookings on other trains may be added for the
+        # same user concurrently.
+        train = train_key(train_id)
+        for booking in list(self.by_user.get(user_email, ())):
+            if booking.train == train and booking.seats >= seats:
+                return booking
+        return None
+
+    def __len__(self):
+        return len(self.bookings)
+
+    def __iter__(self):
+        return iter(self.bookings.values())
@@ -0,0 +1,159 @@
+import time # Importing time for measuring startup
+STARTED = time.perf_counter()   # Before the core is imported, so stats include import time
+import os   # Importing os for the password environment variable
+import sys  # Importing sys for exit codes and error output
+import csv  # Importing csv for the errors of unreadable timetables (already loaded by the core)
+import json # Importing json for the stats output
+import argparse # Importing argparse for the command line
+from reservation import TrainTicketManagementSystem, ReservationError, ADMIN_EMAIL  # Importing the headless reservation core
+from storage import DATA_FILE, JOURNAL_FILE, SQLiteStorage  # Importing the storage backends
+from timetable import FORMATS   # Importing the timetable formats the import command accepts
+from analytics import GROUPS    # Importing the analytics groupings
+
+
+IMPORTED = time.perf_counter()
+PASSWORD_VARIABLE = "TRAIN_RESERVATION_PASSWORD"    # Read when --password is not given
+
+
+def open_system(arguments):
+    # stats reports metrics, so it is instrumented from startup on (snapshot load and journal replay included)
+    options = {"trace_file": arguments.trace, "instrument": arguments.command == "stats"}
+    if arguments.db:
+        return TrainTicketManagementSystem(storage=SQLiteStorage(arguments.db), **options)
+    return TrainTicketManagementSystem(arguments.data_file, arguments.journal, **options)
+
+
+def login(system, arguments):
+    if not arguments.user:
+        raise ReservationError("This command needs --user (and --password).")
+    return system.login_user(arguments.user, arguments.password or os.environ.get(PASSWORD_VARIABLE, ""))
+
+
+def search_command(system, arguments):
+    print(system.search_trains(arguments.source, arguments.destination))
+
+
+def book_command(system, arguments):
+    result = system.book_ticket(login(system, arguments), arguments.train_id, arguments.seats,
+                                arguments.origin, arguments.to)
+    print(f"Booked {result.seats} seats on {result.train_id} (booking {result.booking_id}, seat numbers: "
+          f"{', '.join(map(str, result.seat_numbers))}).")
+
+
+def cancel_command(system, arguments):
+    result = system.cancel_ticket(login(system, arguments), arguments.train_id, arguments.seats)
+    print(f"Cancelled {result.seats} seats on {result.train_id}.")
+
+
+def report_command(system, arguments):
+    print(system.generate_report(login(system, arguments)))
+
+
+def import_command(system, arguments):
+    result = system.import_timetable(login(system, arguments), arguments.timetable, arguments.format,
+                                     chunk_size=arguments.chunk_size)
+    for line, message in result.errors:
+        print(f"line {line}: {message}", file=sys.stderr)
+    if result.failed > len(result.errors):
+        print(f"... {result.failed - len(result.errors)} more rows rejected", file=sys.stderr)
+    imported = f" ({result.first_train_id} to {result.last_train_id})" if result.imported else ""
+    print(f"Imported {result.imported} trains{imported}, rejected {result.failed} rows in {result.elapsed:.2f}s.")
+
+
+def analytics_command(system, arguments):
+    user = login(system, arguments)
+    if arguments.output:
+        count = system.export_analytics(user, arguments.output, arguments.group_by, arguments.top)
+        print(f"Wrote {count} rows to {arguments.output}.")
+    else:
+        system.export_analytics(user, sys.stdout, arguments.group_by, arguments.top)
+
+
+def stats_command(system, arguments):
+    stats = {
+        "backend": type(system.storage).__name__,
+        "users": len(system.users),
+        "trains": len(system.trains),
+        "bookings": len(system.bookings),
+        "next_train_id": f"Train-{system.next_train_id}",
+        "import_seconds": IMPORTED - STARTED,
+        "load_seconds": system.startup_seconds,
+        "startup_seconds": arguments.opened - STARTED,
+        "gui_loaded": "tkinter" in sys.modules,
+    }
+    if arguments.user == ADMIN_EMAIL:
+        login(system, arguments)
+        stats["metrics"] = json.loads(system.metrics_snapshot(ADMIN_EMAIL))
+    print(json.dumps(stats, indent=2))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless train reservation commands.")
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--journal", default=JOURNAL_FILE)
+    parser.add_argument("--db", help="Use this SQLite database instead of the pickle snapshot.")
+    parser.add_argument("--user", help="Email to log in as.")
+    parser.add_argument("--password", help=f"Defaults to ${PASSWORD_VARIABLE}.")
+    parser.add_argument("--trace", help="Append the requests made to this JSONL trace (see tracing.py).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search = commands.add_parser("search", help="Trains (or a connection) between two stations.")
+    search.add_argument("source")
+    search.add_argument("destination")
+    search.set_defaults(handler=search_command)
+
+    book = commands.add_parser("book", help="Book seats on a train.")
+    book.add_argument("train_id")
+    book.add_argument("seats")
+    book.add_argument("--from", dest="origin", help="Boarding stop (defaults to the train's source).")
+    book.add_argument("--to", help="Alighting stop (defaults to the train's destination).")
+    book.set_defaults(handler=book_command)
+
+    cancel = commands.add_parser("cancel", help="Cancel seats of a booking.")
+    cancel.add_argument("train_id")
+    cancel.add_argument("seats")
+    cancel.set_defaults(handler=cancel_command)
+
+    report = commands.add_parser("report", help="The logged-in user's bookings.")
+    report.set_defaults(handler=report_command)
+
+    bulk = commands.add_parser("import", help="Bulk-import a CSV or JSONL timetable (admin).")
+    bulk.add_argument("timetable")
+    bulk.add_argument("--format", choices=FORMATS, help="Defaults to the file extension (CSV otherwise).")
+    bulk.add_argument("--chunk-size", type=int, default=5000, help="Trains applied and persisted together.")
+    bulk.set_defaults(handler=import_command)
+
+    analytics = commands.add_parser("analytics", help="Load factor, bookings and revenue as CSV (admin).")
+    analytics.add_argument("--group-by", choices=GROUPS, default="route")
+    analytics.add_argument("--top", type=int, help="Only the best-selling rows (all by default).")
+    analytics.add_argument("--output", help="CSV file to write (standard output by default).")
+    analytics.set_defaults(handler=analytics_command)
+
+    stats = commands.add_parser("stats", help="Dataset size and startup timings (plus metrics for admin).")
+    stats.set_defaults(handler=stats_command)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    arguments = parser.parse_args(argv)
+    try:
+        system = open_system(arguments)
+    except OSError as error:
+        parser.exit(1, f"{error}\n")
+    arguments.opened = time.perf_counter()
+    try:
+        arguments.handler(system, arguments)
+    except (ReservationError, OSError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    except (UnicodeDecodeError, csv.Error) as error:
+        print(f"Cannot read the timetable: {error}", file=sys.stderr)
+        return 1
+    finally:
+        system.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
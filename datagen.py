@@ -0,0 +1,88 @@
+import random   # Importing random for seeded dataset generation
+import pickle   # Importing pickle for writing snapshot files
+import itertools    # Importing itertools for cumulative popularity weights
+import argparse # Importing argparse for the command line
+from storage import ADMIN_EMAIL, default_users  # Importing the admin account every dataset needs
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights where item i is (i+1)^-skew as popular as the first."""
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def generate_dataset(trains=1000, stations=50, users=500, bookings=5000, seed=42, skew=1.1,
+                     min_capacity=100, max_capacity=1000, max_stops=2):
+    """Builds a realistic snapshot dict (same shape as train_ticket_data.pkl).
+
+    Station and train popularity follow a Zipf-like curve, so a few routes and
+    trains receive most bookings, like a real network. With ``max_stops``
+    above 2, trains call at up to that many stations. The same seed always
+    produces the same dataset.
+    """
+    rng = random.Random(seed)
+    station_names = [f"station-{number}" for number in range(stations)]
+    station_weights = zipf_weights(stations, skew)
+
+    dataset = {"users": default_users(), "trains": {}, "bookings": [], "next_train_id": trains + 1}
+    user_emails = [f"user{number}@example.com" for number in range(users)]
+    for email in user_emails:
+        dataset["users"][email] = {"password": "password", "profile": {}}
+
+    for number in range(1, trains + 1):
+        source, destination = rng.choices(station_names, cum_weights=station_weights, k=2)
+        while destination == source:
+            destination = rng.choice(station_names)
+        train = dataset["trains"][f"Train-{number}"] = {
+            "route": (source, destination),
+            "availability": rng.randint(min_capacity, max_capacity),
+            "timings": f"{rng.randint(0, 23):02d}:{rng.choice((0, 15, 30, 45)):02d}",
+            "price": str(rng.randint(5, 200) * 10),
+        }
+        if max_stops > 2:
+            # Extra draws only happen here, so two-stop datasets stay identical for a seed
+            # Source and destination count towards max_stops, so at most max_stops - 2 calls in between
+            others = [station for station in station_names if station not in (source, destination)]
+            calls = rng.sample(others, min(len(others), rng.randint(0, max_stops - 2)))
+            train["stops"] = (source, *calls, destination)
+
+    train_ids = list(dataset["trains"])
+    rng.shuffle(train_ids)  # Popularity must not follow train number
+    train_weights = zipf_weights(len(train_ids), skew)
+    user_weights = zipf_weights(users, skew / 2) if users else []
+    booking_id = 1
+    attempts = 0
+    while len(dataset["bookings"]) < bookings and train_ids and users and attempts < bookings * 10:
+        attempts += 1
+        train_id = rng.choices(train_ids, cum_weights=train_weights)[0]
+        train = dataset["trains"][train_id]
+        seats = rng.randint(1, 4)
+        if train["availability"] < seats:
+            continue    # Sold out; popular trains fill up just like in production
+        train["availability"] -= seats
+        dataset["bookings"].append({"user_email": rng.choices(user_emails, cum_weights=user_weights)[0],
+                                    "train_id": train_id, "seats": seats, "booking_id": booking_id})
+        booking_id += 1
+    return dataset
+
+
+def write_snapshot(dataset, path):
+    with open(path, "wb") as file:
+        pickle.dump(dataset, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic train reservation dataset.")
+    parser.add_argument("--trains", type=int, default=1000)
+    parser.add_argument("--stations", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--max-stops", type=int, default=2, help="Stations a train may call at (2 = direct).")
+    parser.add_argument("--output", default="synthetic_data.pkl")
+    arguments = parser.parse_args()
+    data = generate_dataset(arguments.trains, arguments.stations, arguments.users, arguments.bookings,
+                            arguments.seed, arguments.skew, max_stops=arguments.max_stops)
+    write_snapshot(data, arguments.output)
+    print(f"Wrote {len(data['trains'])} trains, {len(data['users'])} users and "
+          f"{len(data['bookings'])} bookings to {arguments.output} (admin: {ADMIN_EMAIL}).")
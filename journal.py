@@ -0,0 +1,127 @@
+import os   # Importing os for fsync/truncate on the journal file
+import pickle   # Importing pickle for record serialization
+import struct   # Importing struct for the fixed-size record header
+import threading    # Importing threading so concurrent writers do not interleave records
+import zlib     # Importing zlib for CRC32 checksums
+
+
+# Every record is framed as <payload length><crc32 of payload><pickled payload>
+RECORD_HEADER = struct.Struct("<II")
+
+
+class Journal:
+    """Append-only write-ahead log of mutations kept next to the pickle snapshot.
+
+    Each mutation is written as one small framed record instead of re-pickling
+    the whole dataset. ``fsync_every`` controls how many records are batched
+    between fsyncs (1 = every record, 0 = leave it to the OS).
+
+    ``write`` only buffers the record into the file; ``sync_if_due`` performs
+    the fsync outside the write lock, so threads waiting on the disk do not
+    block other writers and one fsync covers every record written before it.
+    """
+
+    def __init__(self, path, fsync_every=1):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.file = None
+        self.pending = 0  # Records written since the last fsync
+        self.records = 0  # Records currently in the journal (since last compaction)
+        self.lock = threading.Lock()
+
+    def replay(self):
+        """Returns every intact record and cuts off a half-written tail."""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        good_offset = 0
+        with open(self.path, "rb") as file:
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, checksum = RECORD_HEADER.unpack(header)
+                payload = file.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                try:
+                    records.append(pickle.loads(payload))
+                except Exception:
+                    break
+                good_offset = file.tell()
+            file.seek(0, os.SEEK_END)
+            torn = file.tell() > good_offset
+        if torn:
+            # A crash mid-append left a partial record; drop it so new records
+            # are not written after garbage.
+            with open(self.path, "r+b") as file:
+                file.truncate(good_offset)
+                file.flush()
+                os.fsync(file.fileno())
+        self.records = len(records)
+        return records
+
+    def open(self):
+        if self.file is None:
+            self.file = open(self.path, "ab")
+
+    def write(self, record):
+        """Buffers one record into the file and returns the number of bytes written.
+
+        If the write fails, whatever part of the record reached the file is
+        cut off again, so later records are not appended after garbage.
+        """
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.open()
+            offset = self.file.tell()
+            try:
+                self.file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+                self.file.flush()
+            except BaseException:
+                self.truncate(offset)
+                raise
+            self.records += 1
+            self.pending += 1
+        return RECORD_HEADER.size + len(payload)
+
+    def truncate(self, offset):
+        """Drops everything after `offset`, including bytes still buffered; the caller holds the lock."""
+        try:
+            self.file.close()
+        except OSError:
+            pass    # The buffered tail could not be flushed either, which is what is wanted
+        self.file = None
+        with open(self.path, "r+b") as file:
+            file.truncate(offset)
+            os.fsync(file.fileno())  # Also covers the records still waiting for sync()
+        self.pending = 0
+
+    def sync_if_due(self):
+        if self.fsync_every and self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        with self.lock:
+            if self.file is None or not self.pending:
+                return
+            self.pending = 0
+            fileno = self.file.fileno()
+        os.fsync(fileno)
+
+    def reset(self):
+        """Empties the journal once its records have been folded into a snapshot."""
+        with self.lock:
+            self.open()
+            self.file.truncate(0)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+            self.records = 0
+
+    def close(self):
+        self.sync()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
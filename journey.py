@@ -0,0 +1,237 @@
+import bisect   # Importing bisect for keeping station departures sorted by time
+import heapq    # Importing heapq for the label-setting search
+import itertools    # Importing itertools for heap tie-breaking counters
+import threading    # Importing threading to serialize timetable updates
+from collections import namedtuple  # Importing namedtuple for journey results
+from records import DAY_MINUTES, normalize_station  # Importing station normalization and day length
+
+
+OPTIMIZE = ("earliest", "cheapest", "fewest_transfers")
+MIN_CONNECTION_MINUTES = 10 # Default time needed to change trains at a station
+HORIZON_DAYS = 2    # Daily timetables are unrolled this many days so journeys can run past midnight
+
+JourneyLeg = namedtuple("JourneyLeg", "train_id origin destination departure arrival price")
+Journey = namedtuple("Journey", "legs departure arrival duration transfers price")
+
+
+def format_minutes(minutes):
+    """"HH:MM" for minutes after midnight, with "+N" for later days."""
+    day, minutes = divmod(minutes, DAY_MINUTES)
+    text = f"{minutes // 60:02d}:{minutes % 60:02d}"
+    return f"{text} +{day}" if day else text
+
+
+def add_label(labels, arrival, trips, cost, fares=True):
+    """Adds [arrival, trips, cost, live] to a station's labels, or returns None if one is at least as good.
+
+    Without ``fares`` a label's fare only counts against labels with the same
+    arrival and trips. Labels the new one is at least as good as are marked
+    dead and dropped, so no label in `labels` is as good as another.
+    """
+    for other in labels:
+        if other[0] <= arrival and other[1] <= trips and (
+                other[2] <= cost or not fares and (other[0] < arrival or other[1] < trips)):
+            return None
+    entry = [arrival, trips, cost, True]
+    kept = [entry]
+    for other in labels:
+        if arrival <= other[0] and trips <= other[1] and (
+                cost <= other[2] or not fares and (arrival < other[0] or trips < other[1])):
+            other[3] = False
+        else:
+            kept.append(other)
+    labels[:] = kept
+    return entry
+
+
+class StationDepartures:
+    """Departure events at one station ordered by time (with parallel trip references)."""
+
+    __slots__ = ("times", "events")
+
+    def __init__(self):
+        self.times = []     # Sorted departure minutes over the whole horizon
+        self.events = []    # (TrainRun, stop index) parallel to times
+
+    def insert(self, time, event):
+        position = bisect.bisect_right(self.times, time)
+        self.times.insert(position, time)
+        self.events.insert(position, event)
+
+
+class TrainRun:
+    """One day's run of a train: stop keys and names, stop times on that day and fare."""
+
+    __slots__ = ("train_id", "keys", "stops", "times", "price")
+
+    def __init__(self, train_id, keys, stops, times, price):
+        self.train_id = train_id
+        self.keys = keys
+        self.stops = stops
+        self.times = times
+        self.price = price
+
+
+class JourneyPlanner:
+    """Multi-leg journey search over a time-expanded connection graph.
+
+    The graph's nodes are departure events: every station keeps its
+    departures sorted by time over a HORIZON_DAYS window, and every train run
+    links the events of its stops. ``add_train`` inserts a train's events with
+    binary searches, so the timetable never has to be rebuilt.
+
+    ``plan`` is a label-setting search (Dijkstra over train boardings) whose
+    priority depends on what is optimized. A station keeps every label no
+    other one there beats on arrival, trains taken and (when optimizing for
+    it) fare, so a later label that used fewer trains can still connect
+    within ``max_transfers``. A run is not boarded again at a later stop by a
+    label an earlier boarding beats, and once the destination is queued
+    anything that cannot beat it is pruned.
+    """
+
+    def __init__(self, min_connection=MIN_CONNECTION_MINUTES):
+        self.min_connection = min_connection
+        self.departures = {}    # station key -> StationDepartures
+        self.lock = threading.Lock()
+
+    def rebuild(self, trains):
+        with self.lock:
+            self.departures = {}
+        for train_id, train in trains:
+            self.add_train(train_id, train)
+
+    def add_train(self, train_id, train):
+        times = train.stop_times()
+        if times is None:
+            return  # Without a departure time the train cannot be scheduled
+        keys = tuple(normalize_station(stop) for stop in train.stops)
+        price = train.price_value or 0.0
+        # Queries copy the departures they scan under the lock, so they never see half an insert
+        with self.lock:
+            for day in range(HORIZON_DAYS):
+                offset = day * DAY_MINUTES
+                run = TrainRun(train_id, keys, train.stops, tuple(time + offset for time in times), price)
+                for index, key in enumerate(keys[:-1]):
+                    departures = self.departures.get(key)
+                    if departures is None:
+                        departures = self.departures[key] = StationDepartures()
+                    departures.insert(run.times[index], (run, index))
+
+    def plan(self, source, destination, depart_after=0, optimize="earliest", min_connection=None,
+             max_transfers=3, seats=0, seat_map=None):
+        """Best Journey from `source` to `destination` leaving at or after `depart_after`, or None.
+
+        ``optimize`` is "earliest" (arrival), "cheapest" (sum of train fares)
+        or "fewest_transfers"; the other criteria break ties, although fares
+        only do so between routes that reach each station as early with as
+        many trains unless they are optimized. With ``seats``, only legs with
+        that many seats free on every segment are used; ``seat_map(train_id)``
+        supplies the train's current SeatMap.
+        """
+        if optimize not in OPTIMIZE:
+            raise ValueError(f"Cannot optimize journeys for {optimize!r}.")
+        source, destination = normalize_station(source), normalize_station(destination)
+        if source == destination or source not in self.departures:
+            return None
+        min_connection = self.min_connection if min_connection is None else min_connection
+        if optimize == "earliest":
+            def priority(arrival, trips, cost):
+                return (arrival, trips, cost)
+        elif optimize == "cheapest":
+            def priority(arrival, trips, cost):
+                return (cost, arrival, trips)
+        else:
+            def priority(arrival, trips, cost):
+                return (trips, arrival, cost)
+
+        fares = optimize == "cheapest"  # Otherwise fares only break ties, see add_label
+        counter = itertools.count()
+        start = [depart_after, 0, 0.0, True]
+        # Labels: (priority, tie, station, arrival, trips, cost, parent, entry); parent = (label, run, board,
+        # alight) and entry is the label's [arrival, trips, cost, live] in `labels`
+        heap = [(priority(depart_after, 0, 0.0), next(counter), source, depart_after, 0, 0.0, None, start)]
+        labels = {source: [start]}  # station -> entries of the labels queued or settled there
+        boarded = {}    # TrainRun -> [board, trips, cost, reached every stop] of each boarding of it
+        bound = None    # Priority of the best label queued for the destination
+        while heap:
+            label = heapq.heappop(heap)
+            _, _, station, arrival, trips, cost, _, entry = label
+            if station == destination:
+                return self.journey(label)
+            if not entry[3]:
+                continue    # A label at least as good reached the station after this one was queued
+            if trips > max_transfers:
+                continue
+            ready = arrival + (min_connection if trips else 0)
+            last_trip = trips == max_transfers
+            with self.lock:
+                departures = self.departures.get(station)
+                if departures is None:
+                    continue
+                first = bisect.bisect_left(departures.times, ready)
+                last = bisect.bisect_right(departures.times, ready + DAY_MINUTES)
+                times, events = departures.times[first:last], departures.events[first:last]
+            for time, (run, board) in zip(times, events):
+                next_cost = cost + run.price
+                # Every stop of this boarding is reached no earlier, by no fewer
+                # trains and for no less than this.
+                if bound is not None and priority(time, trips + 1, next_cost) >= bound:
+                    if optimize == "earliest" and time > bound[0]:
+                        break   # Later departures cannot arrive earlier either
+                    continue
+                # A boarding by no more trains for no more fare already reached the
+                # stops past its own; one at an earlier stop reached every stop, unless
+                # it (or a boarding it relied on) ran out of seats, which boarding
+                # later may not.
+                end, complete, skip = len(run.keys), True, False
+                for earlier, earlier_trips, earlier_cost, reached in boarded.get(run, ()):
+                    if earlier_trips > trips or earlier_cost > cost and (fares or earlier_trips == trips):
+                        continue
+                    if earlier <= board and reached:
+                        skip = True
+                        break
+                    if board < earlier < end - 1 or (earlier == end - 1 and reached):
+                        end, complete = earlier + 1, reached
+                if skip:
+                    continue
+                boarding = [board, trips, cost, complete]
+                boarded.setdefault(run, []).append(boarding)
+                free = None
+                if seats:
+                    train_seats = seat_map(run.train_id)
+                    free = train_seats.all_seats()
+                    segments = train_seats.segments
+                for alight in range(board + 1, end):
+                    if free is not None:
+                        free &= ~segments[alight - 1]
+                        if free.bit_count() < seats:
+                            boarding[3] = False
+                            break
+                    stop = run.keys[alight]
+                    if last_trip and stop != destination:
+                        continue    # No train can be boarded from there
+                    stop_arrival = run.times[alight]
+                    rank = priority(stop_arrival, trips + 1, next_cost)
+                    if bound is not None and rank >= bound:
+                        continue
+                    stop_labels = labels.get(stop)
+                    if stop_labels is None:
+                        stop_labels = labels[stop] = []
+                    stop_entry = add_label(stop_labels, stop_arrival, trips + 1, next_cost, fares)
+                    if stop_entry is None:
+                        continue
+                    if stop == destination:
+                        bound = rank
+                    heapq.heappush(heap, (rank, next(counter), stop, stop_arrival, trips + 1, next_cost,
+                                          (label, run, board, alight), stop_entry))
+        return None
+
+    def journey(self, label):
+        legs = []
+        while label[6] is not None:
+            label, run, board, alight = label[6]
+            legs.append(JourneyLeg(run.train_id, run.stops[board], run.stops[alight], run.times[board],
+                                   run.times[alight], run.price))
+        legs.reverse()
+        return Journey(legs, legs[0].departure, legs[-1].arrival, legs[-1].arrival - legs[0].departure,
+                       len(legs) - 1, sum(leg.price for leg in legs))
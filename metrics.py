@@ -0,0 +1,256 @@
+import json # Importing json for the JSON snapshot export
+import time # Importing time for latency measurements
+import bisect   # Importing bisect for histogram bucket lookup
+import threading    # Importing threading for the stats lock and per-thread operation context
+import functools    # Importing functools for preserving wrapped method metadata
+
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels); the last bucket is +Inf
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+# Storage and index internals timed next to the public operations
+STORAGE_OPERATIONS = ("open", "load_snapshot", "recover", "persist", "sync", "compact", "save_snapshot")
+INDEX_OPERATIONS = ("query", "page")
+
+
+def percentiles(samples):
+    """Latency summary in milliseconds of exact samples (seconds)."""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    def pick(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000
+    return {"count": len(samples), "mean_ms": sum(samples) / len(samples) * 1000, "p50_ms": pick(0.50),
+            "p90_ms": pick(0.90), "p99_ms": pick(0.99), "max_ms": samples[-1] * 1000}
+
+
+class OperationStats:
+    """Count, errors, latency histogram and bytes persisted of one operation."""
+
+    __slots__ = ("count", "errors", "total", "maximum", "buckets", "bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = {}    # exception class name -> count
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.bytes = 0
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile (None past the last bound)."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        cumulative, seen = [], 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.buckets):
+            seen += count
+            cumulative.append(["+Inf" if bound == float("inf") else bound, seen])
+        return {"count": self.count, "errors": dict(self.errors), "seconds_total": self.total,
+                "mean_seconds": self.total / self.count if self.count else 0.0, "max_seconds": self.maximum,
+                "p50_seconds": self.quantile(0.5), "p90_seconds": self.quantile(0.9),
+                "p99_seconds": self.quantile(0.99), "bytes_persisted": self.bytes, "buckets": cumulative}
+
+
+class Metrics:
+    """Opt-in instrumentation of a TrainTicketManagementSystem.
+
+    ``enable`` replaces the system's public methods, and the timed storage
+    and route index methods, with timing wrappers on those instances;
+    ``disable`` removes them again. While disabled nothing is wrapped, so
+    the core runs at full speed.
+
+    The core measures the storage's bytes_written growth under its commit
+    lock and reports it through ``charge_bytes``, which charges it to the
+    outermost operation running on that thread.
+    """
+
+    def __init__(self, operations=()):
+        self.operations = operations    # Public method names of the system
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.started = time.time()
+        self.installed = {}     # (id(target), name) -> (target, name, instance attribute it covered)
+        self.local = threading.local()
+        self.capture_requests = {}  # operation -> {"profile", "memory", "calls"}
+        self.captures = []
+        self.counters = {}  # name -> function returning a dict of counters (e.g. cache hits)
+
+    def register(self, name, function):
+        """Adds the counters `function()` returns to every snapshot under `name`."""
+        self.counters[name] = function
+
+    def enable(self, system):
+        """Instruments `system` (again covering containers it replaced since)."""
+        self.enabled = True
+        for name in self.operations:
+            self.install(system, name, name)
+        for name in STORAGE_OPERATIONS:
+            self.install(system.storage, name, "storage." + name)
+        route_index = getattr(system, "route_index", None)
+        if route_index is not None:
+            for name in INDEX_OPERATIONS:
+                self.install(route_index, name, "route_index." + name)
+
+    def disable(self):
+        self.enabled = False
+        for target, name, covered in self.installed.values():
+            if covered is not None:
+                setattr(target, name, covered)  # E.g. the trace recorder's wrapper
+                continue
+            try:
+                delattr(target, name)   # Uncovers the class method again
+            except AttributeError:
+                pass
+        self.installed = {}
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+            self.captures = []
+            self.started = time.time()
+
+    def install(self, target, name, operation):
+        key = (id(target), name)
+        if key in self.installed or not hasattr(target, name):
+            return
+        covered = getattr(target, "__dict__", {}).get(name)
+        setattr(target, name, self.wrap(getattr(target, name), operation))
+        self.installed[key] = (target, name, covered)
+
+    def wrap(self, function, operation):
+        local = self.local
+
+        @functools.wraps(function)
+        def instrumented(*args, **kwargs):
+            stack = getattr(local, "stack", None)
+            if stack is None:
+                stack = local.stack = []
+            stack.append(operation)
+            capture = self.capture_requests.get(operation) if self.capture_requests else None
+            error = None
+            start = time.perf_counter()
+            try:
+                if capture is not None:
+                    return self.run_captured(capture, operation, function, args, kwargs)
+                return function(*args, **kwargs)
+            except Exception as exception:
+                error = type(exception).__name__
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                self.record(operation, elapsed, error)
+        return instrumented
+
+    def record(self, operation, elapsed, error=None):
+        with self.lock:
+            stats = self.stats.get(operation)
+            if stats is None:
+                stats = self.stats[operation] = OperationStats()
+            stats.count += 1
+            stats.total += elapsed
+            stats.maximum = max(stats.maximum, elapsed)
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            if error is not None:
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+
+    def charge_bytes(self, written, default="commit"):
+        """Adds bytes persisted to the outermost operation running on this thread."""
+        if not written:
+            return
+        stack = getattr(self.local, "stack", None)
+        operation = stack[0] if stack else default
+        with self.lock:
+            stats = self.stats.get(operation)
+            if stats is None:
+                stats = self.stats[operation] = OperationStats()
+            stats.bytes += written
+
+    def capture(self, operation, profile=True, memory=False, calls=1):
+        """Profiles (cProfile) and/or traces allocations (tracemalloc) of the next `calls` calls of `operation`."""
+        with self.lock:
+            self.capture_requests[operation] = {"profile": profile, "memory": memory, "calls": calls}
+
+    def run_captured(self, capture, operation, function, args, kwargs):
+        # The profilers are imported on first capture; importing them costs more than the rest of startup
+        import io
+        import pstats
+        import cProfile
+        import tracemalloc
+        with self.lock:
+            capture["calls"] -= 1
+            if capture["calls"] <= 0:
+                self.capture_requests.pop(operation, None)
+        profiler = cProfile.Profile() if capture["profile"] else None
+        tracing = capture["memory"] and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        result = {"operation": operation, "timestamp": time.time()}
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                return profiler.runcall(function, *args, **kwargs)
+            return function(*args, **kwargs)
+        finally:
+            result["seconds"] = time.perf_counter() - start
+            if capture["memory"] and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+                result["memory"] = {"current_bytes": current, "peak_bytes": peak,
+                                    "top": [str(statistic) for statistic in top]}
+                if tracing:
+                    tracemalloc.stop()
+            if profiler is not None:
+                report = io.StringIO()
+                pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(20)
+                result["profile"] = report.getvalue()
+            with self.lock:
+                self.captures.append(result)
+
+    def snapshot(self):
+        with self.lock:
+            operations = {name: stats.to_dict() for name, stats in sorted(self.stats.items())}
+            captures = list(self.captures)
+        counters = {name: function() for name, function in self.counters.items()}
+        return {"enabled": self.enabled, "since": self.started, "operations": operations, "counters": counters,
+                "captures": captures}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        operations = snapshot["operations"]
+        lines = ["# HELP reservation_operation_seconds Latency of reservation core operations.",
+                 "# TYPE reservation_operation_seconds histogram"]
+        for name, stats in operations.items():
+            for bound, count in stats["buckets"]:
+                lines.append(f'reservation_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {count}')
+            lines.append(f'reservation_operation_seconds_sum{{operation="{name}"}} {stats["seconds_total"]}')
+            lines.append(f'reservation_operation_seconds_count{{operation="{name}"}} {stats["count"]}')
+        lines += ["# HELP reservation_operation_errors_total Operations that raised, by exception type.",
+                  "# TYPE reservation_operation_errors_total counter"]
+        for name, stats in operations.items():
+            for error, count in sorted(stats["errors"].items()):
+                lines.append(f'reservation_operation_errors_total{{operation="{name}",error="{error}"}} {count}')
+        lines += ["# HELP reservation_persisted_bytes_total Bytes handed to storage, by operation.",
+                  "# TYPE reservation_persisted_bytes_total counter"]
+        for name, stats in operations.items():
+            if stats["bytes_persisted"]:
+                lines.append(f'reservation_persisted_bytes_total{{operation="{name}"}} {stats["bytes_persisted"]}')
+        for name, counters in snapshot["counters"].items():
+            for field, value in counters.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines += [f"# TYPE reservation_{name}_{field} gauge", f"reservation_{name}_{field} {value}"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,312 @@
+import sys  # Importing sys for string interning
+from seatmap import SeatMap # Importing SeatMap for per-seat, per-segment occupancy
+
+
+NO_DEPARTURE = 24 * 60  # Sort key for trains whose timings could not be parsed (after every real time)
+DAY_MINUTES = 24 * 60
+DEFAULT_SEGMENT_MINUTES = 60    # Assumed running time between stops when no stop times are known
+
+
+def intern_text(value):
+    """Shares one string object for every repeat of a station name or email."""
+    return sys.intern(value) if type(value) is str else value
+
+
+def normalize_station(name):
+    """Collapses whitespace and case so "Lahore " and "lahore" share a route."""
+    return " ".join(str(name).split()).lower()
+
+
+def parse_departure(timings):
+    """Parses "HH:MM" (or minutes after midnight) into minutes; None if unparseable or out of range."""
+    if type(timings) is int:
+        return timings if 0 <= timings < DAY_MINUTES else None
+    try:
+        hours, minutes = str(timings).strip().split(":")[:2]
+        hours, minutes = int(hours), int(minutes)
+    except ValueError:
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+
+def parse_price(price):
+    try:
+        return float(price)
+    except (TypeError, ValueError):
+        return None
+
+
+def stop_offsets(times):
+    """Minutes after departure at every stop, from per-stop times (None where unknown).
+
+    A time earlier than the one before it is taken to be on the next day.
+    Unknown stops are spaced evenly between known ones, and
+    DEFAULT_SEGMENT_MINUTES apart after the last known one.
+    """
+    minutes = [None if time is None else parse_departure(time) for time in times]
+    if minutes[0] is None:
+        return None
+    known = [(0, 0)]
+    for index, value in enumerate(minutes[1:], 1):
+        if value is not None:
+            value -= minutes[0]
+            while value < known[-1][1]:
+                value += DAY_MINUTES
+            known.append((index, value))
+    offsets = [0] * len(minutes)
+    for (start, first), (stop, last) in zip(known, known[1:]):
+        for index in range(start, stop + 1):
+            offsets[index] = first + (last - first) * (index - start) // (stop - start)
+    start, first = known[-1]
+    for index in range(start, len(minutes)):
+        offsets[index] = first + DEFAULT_SEGMENT_MINUTES * (index - start)
+    return tuple(offsets)
+
+
+def train_key(train_id):
+    """Compact key for a train ID: the integer N of "Train-N", else the interned string."""
+    if type(train_id) is str and train_id.startswith("Train-") and train_id[6:].isdigit():
+        return int(train_id[6:])
+    return intern_text(train_id)
+
+
+def train_label(key):
+    return f"Train-{key}" if type(key) is int else key
+
+
+class Train:
+    """Compact train record.
+
+    Station names are interned and departure/price are parsed once when the
+    train is created. ``stops`` is the ordered stop list (source first,
+    destination last) and ``seat_map`` tracks which seat is taken on which
+    segment between consecutive stops; ``availability`` caches the seats free
+    for the whole route. ``schedule`` holds the minutes after departure at
+    each stop (None: DEFAULT_SEGMENT_MINUTES between stops). Item access ("route", "availability", "timings",
+    "price") keeps it interchangeable with the dicts older pickles contain.
+    """
+
+    __slots__ = ("source", "destination", "availability", "timings", "price", "departure", "price_value",
+                 "stops", "seat_map", "schedule")
+    KEYS = ("route", "availability", "timings", "price")
+
+    def __init__(self, source, destination, availability, timings, price, stops=None, seat_map=None,
+                 schedule=None):
+        self.stops = tuple(map(intern_text, stops)) if stops else (intern_text(source), intern_text(destination))
+        self.source = self.stops[0]
+        self.destination = self.stops[-1]
+        # A new train starts empty, so its availability is its capacity
+        self.seat_map = seat_map if seat_map is not None else SeatMap(int(availability), len(self.stops) - 1)
+        self.availability = self.seat_map.available()
+        self.schedule = tuple(schedule) if schedule else None
+        self.set_timings(timings)
+        self.set_price(price)
+
+    @classmethod
+    def from_details(cls, details):
+        if isinstance(details, cls):
+            return details
+        source, destination = details["route"]
+        return cls(source, destination, details["availability"], details["timings"], details["price"],
+                   details.get("stops"), schedule=details.get("schedule"))
+
+    @property
+    def capacity(self):
+        return self.seat_map.capacity
+
+    @property
+    def segment_count(self):
+        return len(self.stops) - 1
+
+    def leg(self, origin=None, destination=None):
+        """Segment range (start, stop) travelled from `origin` to `destination` (whole route by default)."""
+        keys = [normalize_station(stop) for stop in self.stops]
+        start, stop = 0, len(keys) - 1
+        try:
+            if origin is not None:
+                start = keys.index(normalize_station(origin))
+            if destination is not None:
+                stop = keys.index(normalize_station(destination), start + 1)
+        except ValueError:
+            raise ValueError(f"This train does not run from {origin or self.source} "
+                             f"to {destination or self.destination}.") from None
+        if start >= stop:
+            raise ValueError(f"This train does not run from {origin or self.source} "
+                             f"to {destination or self.destination}.")
+        return start, stop
+
+    def stop_times(self):
+        """Minutes after midnight (of the departure day) at each stop; None if timings are unparseable."""
+        if self.departure == NO_DEPARTURE:
+            return None
+        if self.schedule is None:
+            return tuple(self.departure + DEFAULT_SEGMENT_MINUTES * index for index in range(len(self.stops)))
+        return tuple(self.departure + offset for offset in self.schedule)
+
+    def update_availability(self):
+        self.availability = self.seat_map.available()
+        return self.availability
+
+    def set_timings(self, timings):
+        self.timings = timings
+        departure = parse_departure(timings)
+        self.departure = NO_DEPARTURE if departure is None else departure
+
+    def set_price(self, price):
+        self.price = price
+        self.price_value = parse_price(price)
+
+    def __getitem__(self, key):
+        if key == "route":
+            return (self.source, self.destination)
+        if key in ("availability", "timings", "price", "stops", "capacity", "schedule"):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == "timings":
+            self.set_timings(value)
+        elif key == "price":
+            self.set_price(value)
+        else:
+            # Route and availability follow from the stop list and seat map
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.KEYS
+
+    def to_dict(self):
+        details = {key: self[key] for key in self.KEYS}
+        if len(self.stops) > 2:
+            details["stops"] = self.stops
+        return details
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __getstate__(self):
+        return (self.source, self.destination, self.availability, self.timings, self.price,
+                self.departure, self.price_value, self.stops, self.seat_map, self.schedule)
+
+    def __setstate__(self, state):
+        if len(state) == 7:
+            # Records pickled before seat maps: an empty two-stop train of the remaining seats
+            state += (None, SeatMap(state[2], 1))
+        if len(state) == 9:
+            state += (None,)    # Pickled before stop schedules
+        (source, destination, self.availability, self.timings, self.price,
+         self.departure, self.price_value, stops, self.seat_map, self.schedule) = state
+        self.source = intern_text(source)
+        self.destination = intern_text(destination)
+        self.stops = tuple(map(intern_text, stops)) if stops else (self.source, self.destination)
+
+
+class Booking:
+    """Compact booking record: interned user email, integer train key and the seats held.
+
+    ``seat_mask`` has bit i set for seat i + 1 and ``leg`` is the segment range
+    (start, stop) the seats are held for; both are None for bookings from
+    older data until seats are assigned to them.
+    """
+
+    __slots__ = ("booking_id", "user_email", "train", "seats", "seat_mask", "leg_start", "leg_stop")
+    KEYS = ("user_email", "train_id", "seats", "booking_id", "seat_mask", "leg")
+
+    def __init__(self, booking_id, user_email, train_id, seats, seat_mask=None, leg=None):
+        self.booking_id = booking_id
+        self.user_email = intern_text(user_email)
+        self.train = train_key(train_id)
+        self.seats = seats
+        self.seat_mask = seat_mask
+        self.leg = leg
+
+    @classmethod
+    def from_details(cls, details):
+        if isinstance(details, cls):
+            return details
+        return cls(details.get("booking_id"), details["user_email"], details["train_id"], details["seats"],
+                   details.get("seat_mask"), details.get("leg"))
+
+    @property
+    def train_id(self):
+        return train_label(self.train)
+
+    @property
+    def leg(self):
+        return None if self.leg_start is None else (self.leg_start, self.leg_stop)
+
+    @leg.setter
+    def leg(self, leg):
+        # Two small ints instead of a tuple per booking
+        self.leg_start, self.leg_stop = leg if leg is not None else (None, None)
+
+    @property
+    def seat_numbers(self):
+        return SeatMap.seat_numbers(self.seat_mask or 0)
+
+    def __getitem__(self, key):
+        if key in self.KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in ("seats", "booking_id", "seat_mask", "leg"):
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.KEYS
+
+    def to_dict(self):
+        return {key: self[key] for key in self.KEYS}
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __getstate__(self):
+        return (self.booking_id, self.user_email, self.train, self.seats, self.seat_mask,
+                self.leg_start, self.leg_stop)
+
+    def __setstate__(self, state):
+        if len(state) == 4:
+            state += (None, None, None)  # Pickled before seat assignment
+        self.booking_id, user_email, self.train, self.seats, self.seat_mask, self.leg_start, self.leg_stop = state
+        self.user_email = intern_text(user_email)
+
+
+def assign_seats(trains, bookings):
+    """Gives bookings from older data, which only recorded a seat count, concrete seats.
+
+    Older data only knows how many seats a train has left, so the train grows
+    by the seats such bookings hold and each gets free seats for the whole
+    route. Returns the IDs of the trains that changed.
+    """
+    changed = set()
+    for booking in bookings:
+        if booking.seat_mask is not None:
+            continue
+        train = trains.get(booking.train_id)
+        if train is None:
+            continue
+        train.seat_map.add_seats(booking.seats)
+        booking.seat_mask = train.seat_map.allocate(booking.seats)
+        booking.leg = (0, train.segment_count)
+        changed.add(booking.train_id)
+    for train_id in changed:
+        trains[train_id].update_availability()
+    return changed
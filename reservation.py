@@ -0,0 +1,840 @@
+import re   # Importing re for regular expressions
+import threading    # Importing threading for per-train locks
+import time # Importing time for batch throughput measurements
+from contextlib import ExitStack    # Importing ExitStack for holding several train locks at once
+from collections import namedtuple  # Importing namedtuple for lightweight result objects
+from storage import PickleStorage, DATA_FILE, JOURNAL_FILE, ADMIN_EMAIL    # Importing the storage backends
+from records import Train, Booking, intern_text, normalize_station, parse_departure, stop_offsets # Importing the compact records and timetable parsers
+from journey import JourneyPlanner, format_minutes  # Importing the multi-leg journey planner
+from metrics import Metrics # Importing the opt-in instrumentation layer
+from tracing import TraceRecorder   # Importing the opt-in request trace recorder
+from timetable import read_timetable, timetable_format, timetable_rows   # Importing the streaming timetable reader
+from analytics import OccupancyAnalytics, COLUMNS as ANALYTICS_COLUMNS # Importing the admin occupancy and revenue analytics
+from resultcache import ResultCache, DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS  # Importing the search and report result cache
+from seatmap import SeatMap # Importing SeatMap for seat numbers and partial cancellations
+
+
+class ReservationError(Exception):
+    """Base class for every error the reservation core reports to its callers."""
+
+
+class ValidationError(ReservationError):
+    pass
+
+
+class AlreadyExistsError(ReservationError):
+    pass
+
+
+class AuthenticationError(ReservationError):
+    pass
+
+
+class PermissionDeniedError(ReservationError):
+    pass
+
+
+class NotFoundError(ReservationError):
+    pass
+
+
+class InsufficientSeatsError(ReservationError):
+    pass
+
+
+class BatchError(ReservationError):
+    """Raised by an all-or-nothing batch; ``errors`` lists (item index, error) pairs."""
+
+    def __init__(self, errors, size):
+        super().__init__(f"{len(errors)} of {size} batch items failed; nothing was committed.")
+        self.errors = errors
+
+
+BookingResult = namedtuple("BookingResult", "booking_id user_email train_id seats availability seat_numbers")
+CancelResult = namedtuple("CancelResult", "booking_id user_email train_id seats remaining_seats availability")
+# results holds one BookingResult/CancelResult or ReservationError per submitted item; throughput is
+# committed items per second
+BatchResult = namedtuple("BatchResult", "results committed elapsed throughput")
+# errors holds (line number, message) pairs for the first rejected rows; failed counts them all
+ImportResult = namedtuple("ImportResult", "imported failed errors first_train_id last_train_id elapsed")
+
+IMPORT_CHUNK_SIZE = 5000    # Trains applied and persisted as one journal record
+MAX_IMPORT_ERRORS = 1000    # Rejected rows reported individually
+
+# Requests timed when instrumentation is enabled
+PUBLIC_OPERATIONS = ("load_data", "register_user", "login_user", "add_train", "search_trains", "query_trains",
+                     "list_trains", "plan_journey", "seat_availability", "book_ticket", "cancel_ticket",
+                     "book_many", "cancel_many", "import_timetable", "generate_report", "analytics_report", "export_analytics", "cache_stats", "train_manifest", "compact",
+                     "close")
+
+
+def format_trains(results):
+    """search_trains lines for query_trains results."""
+    return "\n".join(f"{train['train_id']}: {train['details']}" for train in results)
+
+
+def journey_arguments(depart_after, seats):
+    """plan_journey's departure in minutes and seat count, validated."""
+    after = 0
+    if depart_after is not None:
+        after = parse_departure(depart_after)
+        if after is None:
+            raise ValidationError("Please enter the departure time as HH:MM.")
+    try:
+        seats = int(seats)
+    except (TypeError, ValueError):
+        raise ValidationError("Please enter a valid number of seats.") from None
+    return after, seats
+
+
+def departure_window(depart_after, depart_before):
+    """query_trains' departure bounds in minutes (None where open), validated."""
+    bounds = []
+    for value in (depart_after, depart_before):
+        if value is not None:
+            value = parse_departure(value)
+            if value is None:
+                raise ValidationError("Please enter departure times as HH:MM.")
+        bounds.append(value)
+    return bounds
+
+
+def format_connection(journey):
+    """search_trains' suggestion for a Journey (None when there is no connection)."""
+    if journey is None:
+        return "No trains available for this route."
+    return "No direct trains. Suggested connection:\n" + "\n".join(
+        f"{leg.train_id}: {leg.origin} {format_minutes(leg.departure)} -> "
+        f"{leg.destination} {format_minutes(leg.arrival)}" for leg in journey.legs)
+
+
+class TrainTicketManagementSystem:
+    """Headless reservation core.
+
+    Every request names its caller explicitly and either returns a result or
+    raises a ReservationError subclass. Seat changes on one train are
+    serialized by that train's lock, so requests on different trains proceed
+    independently; ``submit`` runs any request on a shared thread pool.
+
+    Data lives in a Storage backend (see storage.py); by default the pickle
+    snapshot with its append-only journal.
+
+    With ``instrument`` every public request is timed from startup on (see
+    metrics.py); ``metrics.enable(system)``/``metrics.disable()`` switch it
+    at runtime.
+
+    Formatted ``search_trains`` and ``generate_report`` answers are kept in a
+    ResultCache of ``cache_size`` entries for ``cache_ttl`` seconds (0
+    entries turns it off); the apply methods invalidate exactly the routes,
+    trains and users a mutation touches.
+
+    With ``trace_file`` every request is appended to that JSONL trace (see
+    tracing.py), which ``python tracing.py`` replays as a load test.
+    """
+
+    def __init__(self, data_file=DATA_FILE, journal_file=JOURNAL_FILE, use_journal=True,
+                 fsync_every=1, compact_every=1000, max_workers=None, storage=None, instrument=False,
+                 cache_size=DEFAULT_MAX_ENTRIES, cache_ttl=DEFAULT_TTL_SECONDS, trace_file=None):
+        if storage is None:
+            storage = PickleStorage(data_file, journal_file if use_journal else None, fsync_every, compact_every)
+        self.storage = storage
+        self.train_locks = {}
+        self.train_locks_guard = threading.Lock()
+        self.users_lock = threading.Lock()     # Serializes registrations
+        self.train_id_lock = threading.Lock()  # Serializes train ID assignment
+        # Held only while a mutation is applied and handed to storage, so the
+        # persisted order always matches the in-memory order.
+        self.commit_lock = threading.RLock()
+        self.max_workers = max_workers
+        self.executor = None
+        self.result_cache = ResultCache(cache_size, cache_ttl)
+        self.metrics = Metrics(PUBLIC_OPERATIONS)
+        self.metrics.register("result_cache", self.result_cache.stats)
+        self.tracer = None
+        if trace_file:
+            self.tracer = TraceRecorder(trace_file)
+            self.tracer.enable(self)    # Before metrics, so disabling metrics keeps the trace wrappers
+        if instrument:
+            self.metrics.enable(self)   # Before loading, so snapshot load and journal replay are timed
+        start = time.perf_counter()
+        self.load_data()
+        self.startup_seconds = time.perf_counter() - start
+
+    @property
+    def next_train_id(self):
+        """Next free train number, kept by the storage backend so it is persisted with the data."""
+        return self.storage.next_train_id
+
+    @next_train_id.setter
+    def next_train_id(self, number):
+        self.storage.next_train_id = number
+
+    def is_valid_email(self, email):
+        return re.match(r"[^@]+@[^@]+\.[^@]+", email) is not None
+
+    def train_lock(self, train_id):
+        lock = self.train_locks.get(train_id)
+        if lock is None:
+            with self.train_locks_guard:
+                lock = self.train_locks.setdefault(train_id, threading.Lock())
+        return lock
+
+    def parse_seats(self, seats):
+        try:
+            seats = int(seats)
+        except (TypeError, ValueError):
+            raise ValidationError("Please enter a valid number of seats.") from None
+        if seats <= 0:
+            raise ValidationError("Please enter a valid number of seats.")
+        return seats
+
+    def require_user(self, user_email):
+        if user_email not in self.users:
+            raise AuthenticationError("Please log in first.")
+
+    def register_user(self, email, password):
+        if not self.is_valid_email(email):
+            raise ValidationError("Invalid email format.")
+        with self.users_lock:
+            if email in self.users:
+                raise AlreadyExistsError("Email is already registered.")
+            self.commit("register_user", email, password)
+        return email
+
+    def login_user(self, email, password):
+        """Checks the credentials and returns the email to use as caller identity."""
+        if not self.is_valid_email(email):
+            raise ValidationError("Invalid email format.")
+        if email not in self.users:
+            raise AuthenticationError("Email is not registered.")
+        if self.users[email]["password"] != password:
+            raise AuthenticationError("Incorrect password.")
+        return email
+
+    def add_train(self, user_email, source, destination, availability, timings, price, stops=(), arrival=None,
+                  train_id=None):
+        """Adds a train with `availability` seats.
+
+        ``stops`` lists intermediate stations in running order, each a name or
+        a (name, "HH:MM") pair; ``arrival`` is the time at the destination.
+        Stop times that are not given are interpolated for journey planning.
+        ``train_id`` is only given by callers that number trains themselves
+        (the sharded server).
+        """
+        if user_email != ADMIN_EMAIL:
+            raise PermissionDeniedError("Only admin can add trains.")
+        details = self.train_details(source, destination, availability, timings, price, stops, arrival)
+        with self.train_id_lock:
+            if train_id is None:
+                train_id = f"Train-{self.next_train_id}"
+            elif train_id in self.trains:
+                raise AlreadyExistsError(f"{train_id} already exists.")
+            self.commit("add_train", train_id, details)
+        return train_id
+
+    def train_details(self, source, destination, availability, timings, price, stops=(), arrival=None):
+        """Validated add_train details of a new train."""
+        try:
+            availability = int(availability)
+        except (TypeError, ValueError):
+            raise ValidationError("Please enter a valid number of available seats.") from None
+        if availability < 0:
+            raise ValidationError("Please enter a valid number of available seats.")
+        details = {
+            "route": (source, destination),
+            "availability": availability,
+            "timings": timings,
+            "price": price,
+        }
+        names, times = [], [timings]
+        for stop in stops:
+            name, time = (stop, None) if isinstance(stop, str) else stop
+            if name.strip():
+                names.append(name.strip())
+                times.append(time or None)
+        times.append(arrival or None)
+        if any(time is not None and parse_departure(time) is None for time in times[1:]):
+            raise ValidationError("Please enter stop times as HH:MM.")
+        if names:
+            details["stops"] = (source, *names, destination)
+        if any(time is not None for time in times[1:]):
+            details["schedule"] = stop_offsets(times)
+        return details
+
+    def import_timetable(self, user_email, timetable, format=None, chunk_size=IMPORT_CHUNK_SIZE,
+                         max_errors=MAX_IMPORT_ERRORS):
+        """Bulk-adds the trains of a CSV or JSONL timetable (a path or an open text file).
+
+        Rows are read, validated and normalized one at a time, so memory is
+        bounded by `chunk_size` whatever the file size. Each chunk of valid
+        rows gets a block of consecutive train IDs and is applied and
+        persisted as a single "import_trains" mutation; rejected rows are
+        reported in the ImportResult instead of stopping the import.
+        """
+        if user_email != ADMIN_EMAIL:
+            raise PermissionDeniedError("Only admin can add trains.")
+        try:
+            format = timetable_format(getattr(timetable, "name", timetable), format)
+        except ValueError as error:
+            raise ValidationError(str(error)) from None
+        start = time.perf_counter()
+        imported = failed = 0
+        errors = []
+        first_train_id = last_train_id = None
+
+        def reject(line, message):
+            nonlocal failed
+            failed += 1
+            if len(errors) < max_errors:
+                errors.append((line, message))
+
+        def flush(chunk):
+            nonlocal imported, first_train_id, last_train_id
+            with self.train_id_lock:
+                first = self.next_train_id
+                train_ids = [f"Train-{number}" for number in range(first, first + len(chunk))]
+                self.commit("import_trains", train_ids, chunk)
+            imported += len(chunk)
+            first_train_id = first_train_id or train_ids[0]
+            last_train_id = train_ids[-1]
+
+        with ExitStack() as stack:
+            if isinstance(timetable, str):
+                timetable = stack.enter_context(open(timetable, newline="", encoding="utf-8"))
+            chunk = []
+            for line, row, error in timetable_rows(read_timetable(timetable, format)):
+                if error is None:
+                    try:
+                        row = self.train_details(**row)
+                    except ValidationError as invalid:
+                        error = str(invalid)
+                if error is not None:
+                    reject(line, error)
+                    continue
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    flush(chunk)
+                    chunk = []
+            if chunk:
+                flush(chunk)
+        if imported:
+            self.compact()  # Folds the imported chunks into the snapshot in one rewrite
+        return ImportResult(imported, failed, errors, first_train_id, last_train_id, time.perf_counter() - start)
+
+    def search_trains(self, source, destination):
+        route = (normalize_station(source), normalize_station(destination))
+        return self.cached(("search",) + route, lambda: self.format_search(source, destination, route))
+
+    def format_search(self, source, destination, route):
+        """search_trains' answer and the cache tags of the data it shows."""
+        results = self.query_trains(source, destination)["results"]
+        if results:
+            return format_trains(results), [("route", route)] + [("train", train["train_id"]) for train in results]
+        # No direct train: suggest the earliest connection with seats left. Any
+        # new train or freed seat may offer a better one.
+        journey = self.plan_journey(source, destination, seats=1)
+        legs = journey.legs if journey is not None else ()
+        return format_connection(journey), [("route", route), "connections"] + [("train", leg.train_id)
+                                                                               for leg in legs]
+
+    def cached(self, key, compute):
+        """Serves `key` from the result cache, or stores what compute() returns as (value, tags)."""
+        if not self.result_cache.enabled:
+            return compute()[0]
+        value, generation = self.result_cache.get(key)
+        if generation is None:
+            return value
+        value, tags = compute()
+        self.result_cache.put(key, value, tags, generation)
+        return value
+
+    def cache_stats(self):
+        """Hit, miss, eviction and invalidation counters of the result cache."""
+        return self.result_cache.stats()
+
+    def plan_journey(self, source, destination, depart_after=None, optimize="earliest", min_connection=None,
+                     max_transfers=3, seats=0):
+        """Best multi-leg Journey from `source` to `destination`, or None if there is none.
+
+        ``optimize`` is "earliest", "cheapest" or "fewest_transfers";
+        ``depart_after`` is an "HH:MM" time and ``seats`` the number of seats
+        every leg must still have. See JourneyPlanner.plan.
+        """
+        after, seats = journey_arguments(depart_after, seats)
+        try:
+            return self.journey_planner().plan(source, destination, after, optimize, min_connection,
+                                               max_transfers, seats,
+                                               lambda train_id: self.trains[train_id].seat_map)
+        except ValueError as error:
+            raise ValidationError(str(error)) from None
+
+    def journey_planner(self):
+        """The journey planner, built from the train store on first use and kept current by add_train."""
+        if self.planner is None:
+            with self.commit_lock:
+                if self.planner is None:
+                    planner = JourneyPlanner()
+                    planner.rebuild(self.trains.items())
+                    self.planner = planner
+        return self.planner
+
+    def query_trains(self, source, destination, min_seats=0, min_price=None, max_price=None,
+                     depart_after=None, depart_before=None, limit=None, offset=0):
+        """Structured, paginated route search served from the route index.
+
+        Returns {"total": matches, "offset": ..., "limit": ..., "results": [...]}
+        where each result holds the train ID and its details, ordered by departure.
+        """
+        depart_after, depart_before = departure_window(depart_after, depart_before)
+        total, train_ids = self.route_index.query(
+            source, destination, min_seats=min_seats, min_price=min_price, max_price=max_price,
+            depart_after=depart_after, depart_before=depart_before, limit=limit, offset=offset)
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "results": [{"train_id": train_id, "details": self.trains[train_id]} for train_id in train_ids],
+        }
+
+    def list_trains(self, sort_by="train_id", descending=False, station=None, limit=100, offset=0):
+        """One page of the whole fleet, sorted by train_id, departure, price or availability.
+
+        ``station`` narrows the list to trains whose source or destination
+        starts with it. The result has the same shape as query_trains.
+        """
+        try:
+            total, train_ids = self.route_index.page(sort_by, descending, station, limit, offset)
+        except ValueError as error:
+            raise ValidationError(str(error)) from None
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "results": [{"train_id": train_id, "details": self.trains[train_id]} for train_id in train_ids],
+        }
+
+    def seat_availability(self, train_id, origin=None, destination=None):
+        """Seats free on every segment between two stops of a train (its whole route by default)."""
+        train = self.trains.get(train_id)
+        if train is None:
+            raise NotFoundError("Invalid train ID.")
+        return train.seat_map.available(*self.train_leg(train, origin, destination))
+
+    def train_leg(self, train, origin, destination):
+        try:
+            return train.leg(origin, destination)
+        except ValueError as error:
+            raise ValidationError(str(error)) from None
+
+    def book_ticket(self, user_email, train_id, seats, origin=None, destination=None):
+        """Books `seats` seats, adjacent where possible, from `origin` to `destination` (default: whole route)."""
+        self.require_user(user_email)
+        # Seats are picked and taken under the train's lock, so two bookings
+        # on the same train can never both get the last seats.
+        with self.train_lock(train_id):
+            op, args = self.plan_booking(user_email, train_id, seats, {}, origin, destination)
+            return self.booking_result(args, self.commit(op, *args))
+
+    def cancel_ticket(self, user_email, train_id, seats):
+        with self.train_lock(train_id):
+            op, args = self.plan_cancellation(user_email, train_id, seats, {})
+            return self.cancel_result(args, self.commit(op, *args))
+
+    def book_many(self, user_email, items, atomic=True):
+        """Books many (train_id, seats[, origin, destination]) items with a single durable commit.
+
+        With ``atomic`` the whole batch is validated first and either fully
+        applied or rejected with a BatchError; otherwise valid items are applied
+        and invalid ones come back as errors in ``BatchResult.results``.
+        """
+        self.require_user(user_email)
+        return self.run_batch(self.plan_booking, self.booking_result, user_email, items, atomic)
+
+    def book_requests(self, requests):
+        """Books (user_email, train_id, seats[, origin, destination]) requests of several users in one commit.
+
+        The sharded server group-commits the bookings queued at a shard this
+        way. Never atomic: each result is a BookingResult or the request's
+        ReservationError.
+        """
+        return self.run_batch(self.plan_booking, self.booking_result, None,
+                              [request[1:] for request in requests], False, [request[0] for request in requests])
+
+    def cancel_many(self, user_email, items, atomic=True):
+        """Cancels many (train_id, seats) pairs; see book_many for ``atomic``."""
+        return self.run_batch(self.plan_cancellation, self.cancel_result, user_email, items, atomic, fields=2)
+
+    def run_batch(self, plan, make_result, user_email, items, atomic, users=None, fields=4):
+        """Plans every item under its train's lock and commits the planned ones together.
+
+        ``users`` gives each item its own caller instead of `user_email`.
+        Items are (train_id, seats) plus up to ``fields`` - 2 more arguments
+        of `plan`; malformed ones fail with a ValidationError like any other
+        invalid item.
+        """
+        start = time.perf_counter()
+        try:
+            items = list(items)
+        except TypeError:
+            raise ValidationError("Batch items must be a list.") from None
+        results = [None] * len(items)
+        for index, item in enumerate(items):
+            if (not isinstance(item, (tuple, list)) or not 2 <= len(item) <= fields
+                    or not isinstance(item[0], str)):
+                results[index] = ValidationError(f"Invalid batch item {item!r}.")
+        planned = []
+        with ExitStack() as stack:
+            # Locks are always taken in sorted order so concurrent batches
+            # touching overlapping trains cannot deadlock.
+            for train_id in sorted({item[0] for item, error in zip(items, results)
+                                    if error is None and item[0] in self.trains}):
+                stack.enter_context(self.train_lock(train_id))
+            pending = {}  # Effects of earlier items in this batch, seen by later ones
+            for index, item in enumerate(items):
+                if results[index] is not None:
+                    continue
+                train_id, seats, *leg = item
+                try:
+                    if users is not None:
+                        user_email = users[index]
+                        self.require_user(user_email)
+                    planned.append((index, plan(user_email, train_id, seats, pending, *leg)))
+                except ReservationError as error:
+                    results[index] = error
+            if atomic and len(planned) < len(items):
+                raise BatchError([(index, error) for index, error in enumerate(results) if error is not None],
+                                 len(items))
+            applied = self.commit_many([op for _, op in planned])
+            for (index, (op, args)), outcome in zip(planned, applied):
+                results[index] = make_result(args, outcome)
+        elapsed = time.perf_counter() - start
+        return BatchResult(results, len(planned), elapsed, len(planned) / elapsed if elapsed else float("inf"))
+
+    def plan_booking(self, user_email, train_id, seats, pending, origin=None, destination=None):
+        """Picks the seats for one booking; `pending` holds seat maps with earlier batch items taken."""
+        seats = self.parse_seats(seats)
+        train = self.trains.get(train_id)
+        if train is None:
+            raise NotFoundError("Invalid train ID.")
+        start, stop = self.train_leg(train, origin, destination)
+        seat_map = pending.get(train_id)
+        if seat_map is None:
+            seat_map = pending[train_id] = train.seat_map.copy()
+        seat_mask = seat_map.find(seats, start, stop)
+        if seat_mask is None:
+            raise InsufficientSeatsError("Not enough seats available.")
+        seat_map.occupy(seat_mask, start, stop)
+        return "book_ticket", (user_email, train_id, seats, None, (start, stop), seat_mask)
+
+    def plan_cancellation(self, user_email, train_id, seats, pending):
+        """Picks the booking to cancel from, net of `pending` batch cancellations."""
+        seats = self.parse_seats(seats)
+        for booking in self.bookings.for_user(user_email):
+            booking_id = booking["booking_id"]
+            remaining = booking["seats"] - pending.get(booking_id, 0)
+            if booking["train_id"] == train_id and remaining >= seats:
+                pending[booking_id] = pending.get(booking_id, 0) + seats
+                return "cancel_ticket", (user_email, train_id, seats, booking_id)
+        raise NotFoundError("Booking not found or invalid number of seats to cancel.")
+
+    def booking_result(self, args, booking):
+        user_email, train_id, seats = args[:3]
+        return BookingResult(booking["booking_id"], user_email, train_id, seats,
+                             self.trains[train_id]["availability"], booking.seat_numbers)
+
+    def cancel_result(self, args, booking):
+        user_email, train_id, seats, booking_id = args
+        return CancelResult(booking_id, user_email, train_id, seats, booking["seats"],
+                            self.trains[train_id]["availability"])
+
+    def submit(self, operation, *args):
+        """Runs a request (e.g. ``submit("book_ticket", email, train_id, 2)``) on the thread pool."""
+        if self.executor is None:
+            with self.train_locks_guard:
+                if self.executor is None:
+                    # Imported on first use so headless scripts that never submit start faster
+                    from concurrent.futures import ThreadPoolExecutor
+                    self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self.executor.submit(getattr(self, operation), *args)
+
+    def generate_report(self, user_email):
+        return self.cached(("report", user_email),
+                           lambda: (self.format_report(user_email), [("user", user_email)]))
+
+    def format_report(self, user_email):
+        report_lines = []
+        for booking in self.bookings.for_user(user_email):
+            train_id = booking["train_id"]
+            train_details = self.trains.get(train_id)
+            if train_details:
+                source, destination = train_details["route"]
+                timings = train_details["timings"]
+                seats = booking["seats"]
+                if booking.leg is not None and booking.leg != (0, len(train_details["stops"]) - 1):
+                    source, destination = (train_details["stops"][booking.leg_start],
+                                           train_details["stops"][booking.leg_stop])
+                seat_numbers = ", ".join(map(str, booking.seat_numbers))
+                report_lines.append(f"Train ID: {train_id}, Source: {source}, Destination: {destination}, "f"Timings: {timings}, Seats Booked: {seats}, Seat Numbers: {seat_numbers}")
+        if not report_lines:
+            return "No bookings found."
+        return "\n".join(report_lines)
+
+    def analytics_report(self, user_email, group_by="route", top=20):
+        """Load factor, bookings and revenue grouped by "route", "train", "hour" or "station"; admin only.
+
+        Returns {"columns": [...], "rows": [...]} with the best sellers first
+        (hours in clock order), at most `top` rows.
+        """
+        if user_email != ADMIN_EMAIL:
+            raise PermissionDeniedError("Only admin can view analytics.")
+        try:
+            return {"columns": ANALYTICS_COLUMNS[group_by],
+                    "rows": list(self.occupancy_analytics().rows(group_by, top))}
+        except (KeyError, ValueError):
+            raise ValidationError(f"Cannot group analytics by {group_by!r}.") from None
+
+    def export_analytics(self, user_email, file, group_by="route", top=None):
+        """Streams a grouping (all rows by default) as CSV to a path or open text file; admin only."""
+        if user_email != ADMIN_EMAIL:
+            raise PermissionDeniedError("Only admin can view analytics.")
+        if group_by not in ANALYTICS_COLUMNS:
+            raise ValidationError(f"Cannot group analytics by {group_by!r}.")
+        with ExitStack() as stack:
+            if isinstance(file, str):
+                file = stack.enter_context(open(file, "w", newline="", encoding="utf-8"))
+            return self.occupancy_analytics().write_csv(file, group_by, top)
+
+    def occupancy_analytics(self):
+        """Analytics columns, built from all bookings on first use and kept current by the apply methods."""
+        if self.analytics is None:
+            with self.commit_lock:
+                if self.analytics is None:
+                    analytics = OccupancyAnalytics()
+                    analytics.rebuild(self.trains, self.bookings)
+                    self.analytics = analytics
+        return self.analytics
+
+    def metrics_snapshot(self, user_email, format="json"):
+        """Instrumentation stats as JSON or Prometheus text; admin only."""
+        if user_email != ADMIN_EMAIL:
+            raise PermissionDeniedError("Only admin can view metrics.")
+        if format == "prometheus":
+            return self.metrics.to_prometheus()
+        if format == "json":
+            return self.metrics.to_json()
+        raise ValidationError(f"Unknown metrics format {format!r}.")
+
+    def train_manifest(self, train_id):
+        """Bookings held on one train, looked up through the per-train index."""
+        return self.bookings.for_train(train_id)
+
+    # Mutations are applied through these methods both when a request is served
+    # and when the journal is replayed at startup, so both paths stay identical.
+    def apply_register_user(self, email, password):
+        self.users[intern_text(email)] = {"password": password, "profile": {}}
+
+    def apply_add_train(self, train_id, details):
+        train_id = intern_text(train_id)
+        details = Train.from_details(details)
+        self.trains[train_id] = details
+        self.route_index.add(train_id, details)
+        self.result_cache.invalidate(("route", (normalize_station(details.source),
+                                                normalize_station(details.destination))), "connections")
+        if self.planner is not None:
+            self.planner.add_train(train_id, details)
+        if self.analytics is not None:
+            self.analytics.add_train(train_id, details)
+        self.next_train_id = max(self.next_train_id, int(train_id.split('-')[1]) + 1)
+
+    def apply_import_trains(self, train_ids, chunk):
+        routes = set()
+        for train_id, details in zip(train_ids, chunk):
+            train_id = intern_text(train_id)
+            details = Train.from_details(details)
+            self.trains[train_id] = details
+            self.route_index.add(train_id, details)
+            if self.analytics is not None:
+                self.analytics.add_train(train_id, details)
+            routes.add(("route", (normalize_station(details.source), normalize_station(details.destination))))
+        if train_ids:
+            self.next_train_id = max(self.next_train_id, int(train_ids[-1].split('-')[1]) + 1)
+        # Rebuilding the journey planner once on its next query beats inserting every train into it
+        self.planner = None
+        self.result_cache.invalidate(*routes, "connections")
+
+    def apply_book_ticket(self, user_email, train_id, seats, booking_id=None, leg=None, seat_mask=None):
+        train = self.trains[train_id]
+        start, stop = leg if leg is not None else (0, train.segment_count)
+        if seat_mask is None:
+            # Journals written before seat maps only record the seat count
+            seat_mask = train.seat_map.find(seats, start, stop)
+        train.seat_map.occupy(seat_mask, start, stop)
+        self.save_train(train_id, train)
+        self.result_cache.invalidate(("train", train_id), ("user", user_email))
+        if self.analytics is not None:
+            self.analytics.record_booking(train_id, seats, (start, stop))
+        return self.bookings.insert(Booking(booking_id, user_email, train_id, seats, seat_mask, (start, stop)))
+
+    def apply_cancel_ticket(self, user_email, train_id, seats, booking_id=None):
+        if booking_id is None:
+            booking = self.bookings.find(user_email, train_id, seats)
+        else:
+            booking = self.bookings.get(booking_id)
+        train = self.trains[train_id]
+        released = SeatMap.highest_seats(booking.seat_mask, seats)
+        train.seat_map.release(released, *booking.leg)
+        self.save_train(train_id, train)
+        # Freed seats may also open up a better suggested connection
+        self.result_cache.invalidate(("train", train_id), ("user", booking.user_email), "connections")
+        booking.seat_mask ^= released
+        booking.seats -= seats
+        if self.analytics is not None:
+            self.analytics.record_booking(train_id, -seats, booking.leg, -1 if booking.seats == 0 else 0)
+        if booking.seats == 0:
+            self.bookings.remove(booking.booking_id)
+        else:
+            self.bookings.update(booking)
+        return booking
+
+    # Unless the storage is transactional, each undo_<op> runs before apply_<op> with
+    # the same arguments and returns a function restoring what it changes in memory.
+    def undo_register_user(self, email, password):
+        user = self.users.get(email)
+
+        def restore():
+            if user is None:
+                self.users.pop(email, None)
+            else:
+                self.users[email] = user
+        return restore
+
+    def undo_add_train(self, train_id, details):
+        return self.undo_import_trains([train_id], [details])
+
+    def undo_import_trains(self, train_ids, chunk):
+        next_train_id = self.next_train_id
+        existing = {train_id: self.trains[train_id] for train_id in train_ids if train_id in self.trains}
+
+        def restore():
+            for train_id in train_ids:
+                self.route_index.remove(train_id)
+                if train_id in existing:
+                    self.trains[train_id] = existing[train_id]
+                    self.route_index.add(train_id, existing[train_id])
+                else:
+                    self.trains.pop(train_id, None)
+            self.next_train_id = next_train_id
+        return restore
+
+    def undo_book_ticket(self, user_email, train_id, seats, booking_id=None, leg=None, seat_mask=None):
+        train = self.trains[train_id]
+        segments = list(train.seat_map.segments)
+        next_booking_id = self.bookings.next_booking_id
+        booked_id = next_booking_id if booking_id is None else booking_id
+
+        def restore():
+            train.seat_map.segments = segments
+            self.save_train(train_id, train)
+            if self.bookings.get(booked_id) is not None:
+                self.bookings.remove(booked_id)
+            self.bookings.next_booking_id = next_booking_id
+        return restore
+
+    def undo_cancel_ticket(self, user_email, train_id, seats, booking_id=None):
+        train = self.trains[train_id]
+        segments = list(train.seat_map.segments)
+        if booking_id is None:
+            booking = self.bookings.find(user_email, train_id, seats)
+        else:
+            booking = self.bookings.get(booking_id)
+        held = None if booking is None else (booking.seats, booking.seat_mask)
+
+        def restore():
+            train.seat_map.segments = segments
+            self.save_train(train_id, train)
+            if booking is not None:
+                booking.seats, booking.seat_mask = held
+                if self.bookings.get(booking.booking_id) is None:
+                    self.bookings.insert(booking)
+        return restore
+
+    def save_train(self, train_id, train):
+        availability = train.update_availability()
+        # Assign the record back so write-through stores (SQLite) persist the row.
+        self.trains[train_id] = train
+        self.route_index.update_availability(train_id, availability)
+
+    def apply_batch(self, records):
+        for op, args in records:
+            getattr(self, "apply_" + op)(*args)
+
+    def commit(self, op, *args):
+        """Applies one mutation and persists it through the storage backend."""
+        return self.commit_many([(op, args)])[0]
+
+    def commit_many(self, ops):
+        """Applies (op, args) mutations and hands them to storage in one persist call."""
+        if not ops:
+            return []
+        with self.commit_lock:
+            results = []
+            records = []
+            undo = None if self.storage.transactional else []
+            written = self.storage.bytes_written
+            try:
+                for op, args in ops:
+                    if undo is not None:
+                        undo.append(getattr(self, "undo_" + op)(*args))
+                    result = getattr(self, "apply_" + op)(*args)
+                    if op == "book_ticket":
+                        # Record the assigned booking ID and seats so replay does not
+                        # depend on the order bookings were journaled in.
+                        args = args[:3] + (result.booking_id, result.leg, result.seat_mask)
+                    results.append(result)
+                    records.append((op, args))
+                self.storage.persist(records)
+            except Exception:
+                # Undo the mutations applied so far, so memory matches what storage holds
+                self.storage.rollback()
+                for restore in reversed(undo or ()):
+                    restore()
+                self.planner = None     # Both are rebuilt from the restored data on next use
+                self.analytics = None
+                self.result_cache.clear()
+                raise
+            if self.metrics.enabled:
+                self.metrics.charge_bytes(self.storage.bytes_written - written)
+        # The fsync happens outside the commit lock so other trains keep going.
+        self.storage.sync()
+        return results
+
+    def compact(self):
+        """Folds the journal into a fresh snapshot (pickle storage) and empties it."""
+        with self.commit_lock:
+            written = self.storage.bytes_written
+            self.storage.compact()
+            if self.metrics.enabled:
+                self.metrics.charge_bytes(self.storage.bytes_written - written, "compact")
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.storage.close()
+        if self.tracer is not None:
+            self.tracer.close()
+
+    def load_data(self):
+        state = self.storage.open()
+        self.users = state.users
+        self.trains = state.trains
+        self.bookings = state.bookings
+        self.route_index = state.route_index
+        self.next_train_id = state.next_train_id
+        self.planner = None  # Built on the first journey query
+        self.analytics = None   # Built on the first analytics request
+        self.result_cache.clear()
+        if self.metrics.enabled:
+            self.metrics.enable(self)   # Also covers the route index just opened
+        for op, args in self.storage.recover():
+            getattr(self, "apply_" + op)(*args)
@@ -0,0 +1,108 @@
+import time # Importing time for entry expiry
+import threading    # Importing threading for the cache lock
+from collections import OrderedDict # Importing OrderedDict for least-recently-used ordering
+
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 300.0
+INVALIDATED_TAGS_PER_ENTRY = 4  # Invalidated tags remembered per cache entry before they are all forgotten
+
+
+class ResultCache:
+    """Bounded LRU cache of formatted query results with a time-to-live.
+
+    Every entry carries tags naming the data it was computed from (a route,
+    a train, a user); ``invalidate`` drops exactly the entries holding any of
+    the given tags. A result computed while one of its tags was invalidated
+    may already be stale, so ``put`` refuses it; invalidations of other tags
+    do not matter. Each invalidation is numbered by ``generation`` and the
+    last number of every tag is kept, until there are too many to keep.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl  # Seconds; None keeps entries until evicted or invalidated
+        self.entries = OrderedDict()    # key -> (value, tags, expires)
+        self.tags = {}  # tag -> set of keys
+        self.lock = threading.Lock()
+        self.generation = 0     # Number of the latest invalidation
+        self.invalidated = {}   # tag -> generation of its latest invalidation
+        self.floor = 0  # Results computed before this generation are refused (after clear() or forgetting tags)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """The cached value and None, or None and the generation to pass to ``put``."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[2] is None or entry[2] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0], None
+                self.discard(key)
+                self.expirations += 1
+            self.misses += 1
+            return None, self.generation
+
+    def put(self, key, value, tags, generation):
+        with self.lock:
+            if generation < self.floor or any(self.invalidated.get(tag, 0) > generation for tag in tags):
+                return
+            self.discard(key)
+            expires = None if self.ttl is None else time.monotonic() + self.ttl
+            self.entries[key] = (value, tags, expires)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self.discard(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self.lock:
+            self.generation += 1
+            if len(self.invalidated) >= INVALIDATED_TAGS_PER_ENTRY * max(self.max_entries, 1):
+                # Forgetting which tags changed only makes put refuse results computed before now
+                self.floor = self.generation - 1
+                self.invalidated.clear()
+            for tag in tags:
+                self.invalidated[tag] = self.generation
+                for key in self.tags.pop(tag, ()):
+                    if self.discard(key):
+                        self.invalidations += 1
+
+    def discard(self, key):
+        """Removes one entry and its tag references; the caller holds the lock."""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[1]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.floor = self.generation
+            self.invalidated.clear()
+            self.entries.clear()
+            self.tags.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "max_entries": self.max_entries, "ttl_seconds": self.ttl,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0, "evictions": self.evictions,
+                    "expirations": self.expirations, "invalidations": self.invalidations}
@@ -0,0 +1,163 @@
+import bisect   # Importing bisect for keeping route buckets sorted by departure
+import threading    # Importing threading to keep readers off half-applied updates
+from records import Train, train_key, normalize_station, parse_departure   # Importing the train record and its parsers
+
+
+SORT_KEYS = ("train_id", "departure", "price", "availability")
+
+
+class RouteBucket:
+    """Trains serving one (source, destination) pair, ordered by departure."""
+
+    __slots__ = ("departures", "train_ids", "prices")
+
+    def __init__(self):
+        self.departures = []  # Sorted departure keys
+        self.train_ids = []   # Train IDs parallel to departures
+        self.prices = []      # Parsed prices parallel to departures
+
+    def insert(self, train_id, departure, price):
+        position = bisect.bisect_right(self.departures, departure)
+        self.departures.insert(position, departure)
+        self.train_ids.insert(position, train_id)
+        self.prices.insert(position, price)
+
+
+class RouteIndex:
+    """Maintained index of trains keyed by normalized (source, destination).
+
+    Besides the per-route buckets it references every Train record (whose
+    departure and price are parsed once), so the whole fleet can be paged in
+    price, departure or availability order; sorted orders are built on first
+    use and dropped when they go stale.
+
+    Updates and the reads that walk the dicts or a bucket's parallel lists
+    hold ``lock``; readers copy what they need under it and filter outside.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.train_routes = {}  # train_id -> route key
+        self.trains = {}    # train_id -> Train record, availability kept in sync by the system
+        self.sorted_orders = {}  # sort key -> cached list of train IDs
+
+    def rebuild(self, trains):
+        with self.lock:
+            self.routes = {}
+            self.train_routes = {}
+            self.trains = {}
+            self.sorted_orders = {}
+        for train_id, details in trains.items():
+            self.add(train_id, details)
+
+    def add(self, train_id, details):
+        # Train records carry departure and price already parsed
+        train = Train.from_details(details)
+        key = (normalize_station(train.source), normalize_station(train.destination))
+        with self.lock:
+            bucket = self.routes.get(key)
+            if bucket is None:
+                bucket = self.routes[key] = RouteBucket()
+            bucket.insert(train_id, train.departure, train.price_value)
+            self.train_routes[train_id] = key
+            self.trains[train_id] = train
+            self.sorted_orders.clear()
+
+    def remove(self, train_id):
+        with self.lock:
+            key = self.train_routes.pop(train_id, None)
+            if key is None:
+                return
+            bucket = self.routes[key]
+            for position in reversed(range(len(bucket.train_ids))):
+                if bucket.train_ids[position] == train_id:
+                    del bucket.departures[position], bucket.train_ids[position], bucket.prices[position]
+            if not bucket.train_ids:
+                del self.routes[key]
+            del self.trains[train_id]
+            self.sorted_orders.clear()
+
+    def update_availability(self, train_id, availability):
+        train = self.trains.get(train_id)
+        if train is not None:
+            train.availability = availability
+            with self.lock:
+                self.sorted_orders.pop("availability", None)
+
+    def sort_key(self, sort_by):
+        trains = self.trains
+        if sort_by == "availability":
+            return lambda train_id: trains[train_id].availability
+        if sort_by == "price":
+            # Unparseable prices sort after every real price
+            return lambda train_id: (trains[train_id].price_value is None, trains[train_id].price_value or 0)
+        if sort_by == "departure":
+            return lambda train_id: trains[train_id].departure
+        # Train number order; IDs not of the "Train-N" form sort after them
+        return lambda train_id: (0, key) if type(key := train_key(train_id)) is int else (1, key)
+
+    def page(self, sort_by="train_id", descending=False, station=None, limit=None, offset=0):
+        """Returns (total, train_ids) for one page of the fleet in `sort_by` order.
+
+        ``station`` keeps trains whose normalized source or destination starts
+        with it; only the routes it selects are sorted.
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Cannot sort trains by {sort_by!r}.")
+        station = normalize_station(station) if station else ""
+        if station:
+            with self.lock:
+                train_ids = [train_id for key, bucket in self.routes.items()
+                             if key[0].startswith(station) or key[1].startswith(station)
+                             for train_id in bucket.train_ids]
+            # Stable sorts: ties keep train number order, as in the unfiltered list
+            train_ids.sort(key=self.sort_key("train_id"))
+            train_ids.sort(key=self.sort_key(sort_by))
+        else:
+            # Cached orders are replaced, never changed, so slicing one needs no lock
+            with self.lock:
+                train_ids = self.sorted_orders.get(sort_by)
+                if train_ids is None:
+                    train_ids = self.sorted_orders[sort_by] = sorted(self.trains, key=self.sort_key(sort_by))
+        total = len(train_ids)
+        stop = total if limit is None else min(total, offset + limit)
+        if descending:
+            return total, train_ids[max(0, total - stop):max(0, total - offset)][::-1]
+        return total, train_ids[offset:stop]
+
+    def query(self, source, destination, min_seats=0, min_price=None, max_price=None,
+              depart_after=None, depart_before=None, limit=None, offset=0):
+        """Returns (total, train_ids) for the matching trains ordered by departure.
+
+        ``total`` counts every match so callers can page; ``train_ids`` holds
+        only the requested ``offset``/``limit`` window.
+        """
+        depart_after = parse_departure(depart_after) if depart_after is not None else None
+        depart_before = parse_departure(depart_before) if depart_before is not None else None
+        with self.lock:
+            bucket = self.routes.get((normalize_station(source), normalize_station(destination)))
+            if bucket is None:
+                return 0, []
+            # The departure window is resolved with two binary searches, so only the
+            # trains inside it are copied and visited for the seat and price filters.
+            start, stop = 0, len(bucket.departures)
+            if depart_after is not None:
+                start = bisect.bisect_left(bucket.departures, depart_after)
+            if depart_before is not None:
+                stop = bisect.bisect_right(bucket.departures, depart_before)
+            train_ids, prices = bucket.train_ids[start:stop], bucket.prices[start:stop]
+            trains = self.trains
+        total = 0
+        matches = []
+        for train_id, price in zip(train_ids, prices):
+            if trains[train_id].availability < min_seats:
+                continue
+            if min_price is not None and (price is None or price < min_price):
+                continue
+            if max_price is not None and (price is None or price > max_price):
+                continue
+            if total >= offset and (limit is None or len(matches) < limit):
+                matches.append(train_id)
+            total += 1
+        return total, matches
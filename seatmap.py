@@ -0,0 +1,116 @@
+class SeatMap:
+    """Per-seat, per-segment occupancy of one train.
+
+    ``segments[j]`` is a bitmap of the seats taken between stop j and stop
+    j + 1 (bit i is seat i + 1). The seats free for a leg are the complement
+    of the OR of that leg's segments, so availability and allocation cost
+    O(segments) big-integer operations however many seats the train has, and
+    a seat freed on one leg can be sold again on a non-overlapping leg.
+    """
+
+    __slots__ = ("capacity", "segments")
+
+    def __init__(self, capacity, segment_count=1, segments=None):
+        self.capacity = capacity
+        self.segments = list(segments) if segments is not None else [0] * segment_count
+
+    def copy(self):
+        return SeatMap(self.capacity, segments=self.segments)
+
+    @property
+    def segment_count(self):
+        return len(self.segments)
+
+    def all_seats(self):
+        return (1 << self.capacity) - 1
+
+    def free(self, start=0, stop=None):
+        """Bitmap of seats free on every segment in [start, stop)."""
+        occupied = 0
+        for segment in self.segments[start:stop]:
+            occupied |= segment
+        return self.all_seats() & ~occupied
+
+    def available(self, start=0, stop=None):
+        return self.free(start, stop).bit_count()
+
+    def find(self, seats, start=0, stop=None, contiguous=True):
+        """Bitmap of `seats` free seats for the leg (adjacent if possible), or None."""
+        free = self.free(start, stop)
+        if seats <= 0 or free.bit_count() < seats:
+            return None
+        if contiguous and seats > 1:
+            # runs has bit i set when seats i .. i+covered-1 are all free; each
+            # step doubles `covered`, so a run of k seats takes O(log k) steps.
+            runs, covered = free, 1
+            while covered < seats and runs:
+                step = min(covered, seats - covered)
+                runs &= runs >> step
+                covered += step
+            if runs:
+                lowest = runs & -runs
+                return ((1 << seats) - 1) * lowest
+        # No adjacent block left: take the lowest free seats.
+        mask = 0
+        for _ in range(seats):
+            lowest = free & -free
+            mask |= lowest
+            free ^= lowest
+        return mask
+
+    def occupy(self, mask, start=0, stop=None):
+        stop = len(self.segments) if stop is None else stop
+        for segment in range(start, stop):
+            self.segments[segment] |= mask
+
+    def release(self, mask, start=0, stop=None):
+        stop = len(self.segments) if stop is None else stop
+        for segment in range(start, stop):
+            self.segments[segment] &= ~mask
+
+    def allocate(self, seats, start=0, stop=None, contiguous=True):
+        mask = self.find(seats, start, stop, contiguous)
+        if mask is not None:
+            self.occupy(mask, start, stop)
+        return mask
+
+    def add_seats(self, count):
+        self.capacity += count
+
+    @staticmethod
+    def seat_numbers(mask):
+        numbers = []
+        while mask:
+            lowest = mask & -mask
+            numbers.append(lowest.bit_length())
+            mask ^= lowest
+        return numbers
+
+    @staticmethod
+    def highest_seats(mask, count):
+        """The `count` highest-numbered seats of `mask` (released first on partial cancels)."""
+        released = 0
+        for _ in range(count):
+            if not mask:
+                break
+            highest = 1 << (mask.bit_length() - 1)
+            released |= highest
+            mask ^= highest
+        return released
+
+    def __getstate__(self):
+        return (self.capacity, self.segments)
+
+    def __setstate__(self, state):
+        self.capacity, self.segments = state
+
+
+def mask_to_bytes(mask):
+    """Little-endian bytes of a seat bitmap, for storing it in a BLOB column."""
+    if mask is None:
+        return None
+    return mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+
+
+def mask_from_bytes(data):
+    return None if data is None else int.from_bytes(data, "little")
@@ -0,0 +1,471 @@
+import os   # Importing os for shard file paths
+import zlib # Importing zlib for a train ID hash that is stable across processes
+import heapq    # Importing heapq for merging per-shard search results
+import pickle   # Importing pickle for splitting snapshots and checking error payloads
+import itertools    # Importing itertools for request IDs
+from collections import deque   # Importing deque for requests drained ahead of a group commit
+import threading    # Importing threading for the reply readers and the client listener
+import multiprocessing  # Importing multiprocessing for the shard worker processes
+from concurrent.futures import Future   # Importing Future for pipelined shard requests
+from multiprocessing.connection import Listener, Client # Importing local IPC for the server mode
+from reservation import (TrainTicketManagementSystem, ReservationError, ValidationError, AuthenticationError,
+                         format_trains, format_connection, journey_arguments)    # Importing the headless reservation core
+from journey import JourneyPlanner  # Importing the journey planner the router runs over every shard's trains
+from storage import DATA_FILE, JOURNAL_FILE, SQLiteStorage, ADMIN_EMAIL, migrate_pickle_to_sqlite  # Importing the storage backends
+
+
+SERVER_ADDRESS = "train_reservation.sock"
+GROUP_COMMIT_LIMIT = 256    # Queued bookings a shard commits (and fsyncs) together
+# Requests a shard worker serves; anything else is refused
+SHARD_OPERATIONS = ("register_user", "login_user", "add_train", "query_trains", "seat_availability",
+                    "book_ticket", "cancel_ticket", "book_many", "cancel_many", "generate_report",
+                    "train_manifest", "cache_stats", "compact", "stats", "timetable", "seat_map")
+# Position of the train ID among the arguments of the requests ShardedSystem.submit pipelines
+TRAIN_ARGUMENT = {"seat_availability": 0, "book_ticket": 1, "cancel_ticket": 1}
+# Requests the server mode accepts from clients
+ROUTER_OPERATIONS = ("register_user", "login_user", "add_train", "search_trains", "query_trains", "plan_journey",
+                     "seat_availability", "book_ticket", "cancel_ticket", "generate_report", "stats")
+# Requests made as the user logged in on the connection, who the server passes as their first argument
+SESSION_OPERATIONS = frozenset(("add_train", "book_ticket", "cancel_ticket", "generate_report"))
+AUTHKEY_VARIABLE = "TRAIN_RESERVATION_AUTHKEY"  # Server authkey when none is passed
+
+
+def shard_of(train_id, shards):
+    """Shard owning `train_id` (CRC32, since hash() of a str differs between processes)."""
+    return zlib.crc32(str(train_id).encode()) % shards
+
+
+def shard_paths(base, shard):
+    return f"{base}.shard{shard}.pkl", f"{base}.shard{shard}.journal", f"{base}.shard{shard}.db"
+
+
+def split_snapshot(data_file, journal_file, base, shards, backend="pickle"):
+    """Partitions a single-process pickle dataset into per-shard snapshots (or SQLite databases).
+
+    Trains and their bookings go to the shard owning the train ID; users
+    are copied to every shard so each can authenticate its own requests.
+    """
+    system = TrainTicketManagementSystem(data_file, journal_file)
+    system.compact()    # Fold the journal in, so the snapshot holds everything
+    system.close()
+    with open(data_file, "rb") as file:
+        data = pickle.load(file)
+    parts = [{"users": data["users"], "trains": {}, "bookings": [], "next_train_id": data.get("next_train_id")}
+             for _ in range(shards)]
+    for train_id, train in data["trains"].items():
+        parts[shard_of(train_id, shards)]["trains"][train_id] = train
+    for booking in data["bookings"]:
+        parts[shard_of(booking["train_id"], shards)]["bookings"].append(booking)
+    for shard, part in enumerate(parts):
+        data_file, journal_file, _ = shard_paths(base, shard)
+        with open(data_file, "wb") as file:
+            pickle.dump(part, file)
+        if os.path.exists(journal_file):
+            os.remove(journal_file)
+        if backend == "sqlite":
+            migrate_pickle_to_sqlite(data_file, shard_paths(base, shard)[2], journal_file)
+
+
+def run_shard(connection, shard, base, backend, options):
+    """Worker process: owns one shard's TrainTicketManagementSystem and serves requests in arrival order."""
+    data_file, journal_file, db_file = shard_paths(base, shard)
+    if backend == "sqlite":
+        system = TrainTicketManagementSystem(storage=SQLiteStorage(db_file), **options)
+    else:
+        system = TrainTicketManagementSystem(data_file, journal_file, **options)
+
+    def stats():
+        return {"shard": shard, "pid": os.getpid(), "trains": len(system.trains),
+                "bookings": len(system.bookings), "next_train_id": system.next_train_id}
+
+    def timetable(train_ids=None):
+        """(train ID, Train) pairs of this shard (or of `train_ids`), for the router's journey planner."""
+        if train_ids is None:
+            return list(system.trains.items())
+        return [(train_id, system.trains[train_id]) for train_id in train_ids if train_id in system.trains]
+
+    def seat_map(train_id):
+        return system.trains[train_id].seat_map
+
+    local = {"stats": stats, "timetable": timetable, "seat_map": seat_map}
+
+    def groupable(request):
+        return request[1] == "book_ticket" and not request[3]
+
+    # Bookings already queued behind a booking are drained and committed
+    # together, so a busy shard pays one journal write and fsync per group.
+    queued = deque()
+    try:
+        while True:
+            if not queued:
+                try:
+                    queued.append(connection.recv())
+                except EOFError:
+                    break   # The router went away
+            request_id, operation, args, kwargs = request = queued.popleft()
+            if operation == "close":
+                break
+            if groupable(request):
+                group = [request]
+                while len(group) < GROUP_COMMIT_LIMIT:
+                    if not queued:
+                        if not connection.poll():
+                            break
+                        queued.append(connection.recv())
+                    if not groupable(queued[0]):
+                        break
+                    group.append(queued.popleft())
+                if len(group) > 1:
+                    try:
+                        results = system.book_requests([request[2] for request in group]).results
+                    except Exception:
+                        # The group could not be committed; answer each booking on its own
+                        for request in group:
+                            connection.send(serve_request(system, local, request))
+                        continue
+                    for (request_id, *_), result in zip(group, results):
+                        connection.send((request_id, not isinstance(result, Exception), result))
+                    continue
+            connection.send(serve_request(system, local, request))
+    finally:
+        system.close()
+        connection.close()
+
+
+def serve_request(system, local, request):
+    """Runs one shard request and returns its (request ID, succeeded, result or error) reply.
+
+    ``local`` maps the worker's own operations (stats, timetable, seat_map) to their functions.
+    """
+    request_id, operation, args, kwargs = request
+    try:
+        if operation not in SHARD_OPERATIONS:
+            raise ValidationError(f"Unknown shard operation {operation!r}.")
+        function = local[operation] if operation in local else getattr(system, operation)
+        return request_id, True, function(*args, **kwargs)
+    except Exception as error:
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = ReservationError(f"{type(error).__name__}: {error}")
+        return request_id, False, error
+
+
+class ShardConnection:
+    """Router side of one worker: a pipe, a send lock and a reader thread resolving Futures.
+
+    Once the reader sees the worker go away, every pending Future fails and
+    later requests raise at once instead of waiting for a reply that never comes.
+    """
+
+    def __init__(self, shard, connection, process):
+        self.shard = shard
+        self.connection = connection
+        self.process = process
+        self.send_lock = threading.Lock()
+        self.pending = {}   # request ID -> Future
+        self.request_ids = itertools.count()
+        self.stopped = False
+        self.reader = threading.Thread(target=self.read_replies, daemon=True)
+        self.reader.start()
+
+    def submit(self, operation, *args, **kwargs):
+        future = Future()
+        with self.send_lock:
+            if self.stopped:
+                raise ReservationError(f"Shard {self.shard} stopped.")
+            request_id = next(self.request_ids)
+            self.pending[request_id] = future
+            try:
+                self.connection.send((request_id, operation, args, kwargs))
+            except (OSError, ValueError):
+                del self.pending[request_id]
+                raise ReservationError(f"Shard {self.shard} stopped.") from None
+        return future
+
+    def read_replies(self):
+        while True:
+            try:
+                request_id, ok, value = self.connection.recv()
+            except (EOFError, OSError):
+                break
+            future = self.pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        # Under the send lock, so no request can be registered after the pending ones are failed
+        with self.send_lock:
+            self.stopped = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(ReservationError(f"Shard {self.shard} stopped."))
+
+
+class ShardedSystem:
+    """Front router over worker processes that each own a partition of the trains.
+
+    Trains are assigned to shards by a hash of their ID, and every shard
+    persists its own snapshot/journal (or SQLite database), so bookings on
+    different shards run in parallel on separate cores. Requests naming a
+    train go to its shard; route searches and reports fan out to every
+    shard and are merged. Users are registered on every shard.
+
+    Each method blocks for its answer; ``submit`` returns a Future instead so
+    a caller can keep many requests in flight. Booking IDs are unique per
+    shard only. Connections are planned here, over a JourneyPlanner built
+    from every shard's timetable, so their legs may run on different
+    shards; each leg's seats are checked on the shard owning its train, and
+    a leg is booked there with book_ticket(train, origin, destination).
+    """
+
+    def __init__(self, shards=2, base="train_ticket_data", backend="pickle", **options):
+        context = multiprocessing.get_context("spawn")  # No locks or threads inherited from the router
+        self.shards = []
+        for shard in range(shards):
+            router_end, worker_end = context.Pipe()
+            process = context.Process(target=run_shard, args=(worker_end, shard, base, backend, options),
+                                      name=f"reservation-shard-{shard}", daemon=True)
+            process.start()
+            worker_end.close()
+            self.shards.append(ShardConnection(shard, router_end, process))
+        self.train_id_lock = threading.Lock()
+        self.users_lock = threading.Lock()
+        self.planner = None     # Built from every shard's timetable on the first journey query
+        self.next_train_id = max(stats["next_train_id"] for stats in self.gather("stats"))
+
+    def shard(self, train_id):
+        return self.shards[shard_of(train_id, len(self.shards))]
+
+    def gather(self, operation, *args, **kwargs):
+        """Sends a request to every shard at once and returns their answers in shard order."""
+        futures = [shard.submit(operation, *args, **kwargs) for shard in self.shards]
+        return [future.result() for future in futures]
+
+    def submit(self, operation, *args, **kwargs):
+        """Future of a book_ticket, cancel_ticket or seat_availability request, sent without waiting."""
+        if operation not in TRAIN_ARGUMENT:
+            raise ValidationError(f"Cannot pipeline {operation!r}.")
+        return self.shard(args[TRAIN_ARGUMENT[operation]]).submit(operation, *args, **kwargs)
+
+    def register_user(self, email, password):
+        with self.users_lock:
+            # The first shard validates and rejects duplicates; the rest only copy the account
+            self.shards[0].submit("register_user", email, password).result()
+            for future in [shard.submit("register_user", email, password) for shard in self.shards[1:]]:
+                future.result()
+        return email
+
+    def login_user(self, email, password):
+        return self.shards[0].submit("login_user", email, password).result()
+
+    def add_train(self, user_email, source, destination, availability, timings, price, stops=(), arrival=None):
+        with self.train_id_lock:
+            train_id = f"Train-{self.next_train_id}"
+            shard = self.shard(train_id)
+            shard.submit("add_train", user_email, source, destination, availability, timings, price, stops,
+                         arrival, train_id).result()
+            self.next_train_id += 1
+            if self.planner is not None:
+                for train_id, train in shard.submit("timetable", [train_id]).result():
+                    self.planner.add_train(train_id, train)
+        return train_id
+
+    def search_trains(self, source, destination):
+        results = self.query_trains(source, destination)["results"]
+        if results:
+            return format_trains(results)
+        return format_connection(self.plan_journey(source, destination, seats=1))
+
+    def query_trains(self, source, destination, min_seats=0, min_price=None, max_price=None,
+                     depart_after=None, depart_before=None, limit=None, offset=0):
+        """query_trains across shards: each returns its first offset + limit matches, merged by departure."""
+        answers = self.gather("query_trains", source, destination, min_seats=min_seats, min_price=min_price,
+                              max_price=max_price, depart_after=depart_after, depart_before=depart_before,
+                              limit=None if limit is None else offset + limit, offset=0)
+        merged = heapq.merge(*(answer["results"] for answer in answers),
+                             key=lambda result: result["details"].departure)
+        results = list(itertools.islice(merged, offset, None if limit is None else offset + limit))
+        return {"total": sum(answer["total"] for answer in answers), "offset": offset, "limit": limit,
+                "results": results}
+
+    def plan_journey(self, source, destination, depart_after=None, optimize="earliest", min_connection=None,
+                     max_transfers=3, seats=0):
+        """plan_journey over the trains of every shard; seat maps are fetched from the owning shards as needed."""
+        after, seats = journey_arguments(depart_after, seats)
+        seat_maps = {}
+
+        def seat_map(train_id):
+            if train_id not in seat_maps:
+                seat_maps[train_id] = self.shard(train_id).submit("seat_map", train_id).result()
+            return seat_maps[train_id]
+
+        try:
+            return self.journey_planner().plan(source, destination, after, optimize, min_connection,
+                                               max_transfers, seats, seat_map)
+        except ValueError as error:
+            raise ValidationError(str(error)) from None
+
+    def journey_planner(self):
+        if self.planner is None:
+            with self.train_id_lock:    # No train is added while the timetables are gathered
+                if self.planner is None:
+                    planner = JourneyPlanner()
+                    planner.rebuild(itertools.chain.from_iterable(self.gather("timetable")))
+                    self.planner = planner
+        return self.planner
+
+    def seat_availability(self, train_id, origin=None, destination=None):
+        return self.shard(train_id).submit("seat_availability", train_id, origin, destination).result()
+
+    def book_ticket(self, user_email, train_id, seats, origin=None, destination=None):
+        return self.shard(train_id).submit("book_ticket", user_email, train_id, seats, origin,
+                                           destination).result()
+
+    def cancel_ticket(self, user_email, train_id, seats):
+        return self.shard(train_id).submit("cancel_ticket", user_email, train_id, seats).result()
+
+    def generate_report(self, user_email):
+        reports = [report for report in self.gather("generate_report", user_email)
+                   if report != "No bookings found."]
+        return "\n".join(reports) if reports else "No bookings found."
+
+    def stats(self):
+        return self.gather("stats")
+
+    def close(self):
+        for shard in self.shards:
+            with shard.send_lock:
+                try:
+                    shard.connection.send((None, "close", (), {}))
+                except OSError:
+                    pass
+        for shard in self.shards:
+            shard.process.join()
+            shard.connection.close()
+
+
+def server_authkey(authkey=None):
+    """`authkey` (or the AUTHKEY_VARIABLE environment variable) as bytes; ValueError if there is none."""
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if not authkey:
+        raise ValueError(f"The server needs an authkey (set {AUTHKEY_VARIABLE}).")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+def serve(router, address=SERVER_ADDRESS, authkey=None):
+    """Serves ROUTER_OPERATIONS to ServerClient connections (a Unix socket path or (host, port)) until interrupted.
+
+    Requests arrive pickled, so every client, local or not, must prove it
+    knows the server's authkey (see server_authkey) before anything is
+    unpickled.
+    """
+    family = "AF_UNIX" if isinstance(address, str) else "AF_INET"
+    with Listener(address, family, authkey=server_authkey(authkey)) as listener:
+        while True:
+            try:
+                connection = listener.accept()
+            except (multiprocessing.AuthenticationError, OSError, EOFError):
+                continue    # Wrong authkey or the client left mid-handshake
+            threading.Thread(target=serve_client, args=(router, connection), daemon=True).start()
+
+
+def serve_client(router, connection):
+    """Answers one client's requests.
+
+    SESSION_OPERATIONS run as the user the client last logged in as with
+    login_user, so their arguments leave out the caller's email.
+    """
+    user = None
+    with connection:
+        while True:
+            try:
+                request = connection.recv()
+            except (EOFError, OSError):
+                return
+            except Exception as error:
+                request = error     # Could not be unpickled; answered below
+            try:
+                if isinstance(request, Exception):
+                    raise ValidationError(f"Unreadable request ({type(request).__name__}).")
+                try:
+                    operation, args, kwargs = request
+                except (TypeError, ValueError):
+                    raise ValidationError("Requests are (operation, args, kwargs).") from None
+                if not isinstance(args, (tuple, list)) or not isinstance(kwargs, dict):
+                    raise ValidationError("Requests are (operation, args, kwargs).")
+                if operation not in ROUTER_OPERATIONS:
+                    raise ValidationError(f"Unknown operation {operation!r}.")
+                if operation in SESSION_OPERATIONS:
+                    if user is None:
+                        raise AuthenticationError("Log in first.")
+                    args = (user, *args)
+                elif operation == "login_user":
+                    user = None     # A failed login leaves the connection logged out
+                result = getattr(router, operation)(*args, **kwargs)
+                if operation == "login_user":
+                    user = result
+                reply = (True, result)
+            except ReservationError as error:
+                reply = (False, error)
+            except Exception as error:
+                # Any other failure (e.g. wrong arguments) is reported instead of dropping the client
+                reply = (False, ReservationError(f"{type(error).__name__}: {error}"))
+            try:
+                connection.send(reply)
+            except OSError:
+                return
+
+
+class ServerClient:
+    """Blocking client of ``serve``.
+
+    ``client.call("login_user", email, password)`` once, then requests such as
+    ``client.call("book_ticket", train_id, 2)`` run as that user.
+    """
+
+    def __init__(self, address=SERVER_ADDRESS, authkey=None):
+        self.connection = Client(address, "AF_UNIX" if isinstance(address, str) else "AF_INET",
+                                 authkey=server_authkey(authkey))
+
+    def call(self, operation, *args, **kwargs):
+        self.connection.send((operation, args, kwargs))
+        ok, value = self.connection.recv()
+        if not ok:
+            raise value
+        return value
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    import argparse # Importing argparse for the server command
+
+    parser = argparse.ArgumentParser(description="Run the reservation core as a sharded multi-process server.")
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--base", default=os.path.splitext(DATA_FILE)[0], help="Prefix of the shard data files.")
+    parser.add_argument("--backend", choices=("pickle", "sqlite"), default="pickle")
+    parser.add_argument("--split", action="store_true",
+                        help=f"First partition the single-process data ({DATA_FILE}) into shard files.")
+    parser.add_argument("--address", default=SERVER_ADDRESS, help="Unix socket path clients connect to.")
+    arguments = parser.parse_args()
+    try:
+        authkey = server_authkey()
+    except ValueError as error:
+        parser.error(str(error))
+    if arguments.split:
+        split_snapshot(DATA_FILE, JOURNAL_FILE, arguments.base, arguments.shards, arguments.backend)
+    router = ShardedSystem(arguments.shards, arguments.base, arguments.backend)
+    print(f"Serving {arguments.shards} shards on {arguments.address} (admin: {ADMIN_EMAIL}).")
+    try:
+        serve(router, arguments.address, authkey)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        router.close()
+        if os.path.exists(arguments.address):
+            os.remove(arguments.address)
@@ -0,0 +1,545 @@
+import os   # Importing os for interacting with the operating system
+import pickle   # Importing pickle for object serialization
+import threading    # Importing threading to serialize access to the shared SQLite connection
+from collections import namedtuple  # Importing namedtuple for the opened storage state
+from collections.abc import MutableMapping  # Importing MutableMapping for the SQLite-backed mappings
+from journal import Journal # Importing Journal for append-only persistence of mutations
+from route_index import RouteIndex  # Importing RouteIndex for indexed route searches
+from records import Train, Booking, assign_seats, intern_text, normalize_station, parse_departure  # Importing compact records and parsers
+from seatmap import mask_to_bytes, mask_from_bytes  # Importing seat bitmap (de)serialization for SQLite
+from bookings import BookingStore   # Importing BookingStore for indexed bookings
+
+
+DATA_FILE = "train_ticket_data.pkl"
+JOURNAL_FILE = "train_ticket_data.journal"
+SQLITE_FILE = "train_ticket_data.db"
+ADMIN_EMAIL = "admin@gmail.com"
+
+# Containers the reservation core reads and mutates, plus the next free train number
+StorageState = namedtuple("StorageState", "users trains bookings route_index next_train_id")
+
+
+def default_users():
+    return {ADMIN_EMAIL: {"password": "12345", "profile": {}}}
+
+
+def train_number(train_id):
+    if isinstance(train_id, str) and train_id.startswith("Train-") and train_id[6:].isdigit():
+        return int(train_id[6:])
+    return None
+
+
+class Storage:
+    """Where TrainTicketManagementSystem keeps its users, trains and bookings.
+
+    ``open`` hands the core its containers: mappings of users and trains, a
+    booking store and a route index. The core applies each mutation to those
+    containers and then passes the (op, args) records to ``persist`` while
+    holding its commit lock; ``sync`` is called after the lock is released.
+    ``bytes_written`` counts the bytes handed to disk, for instrumentation.
+    ``next_train_id`` is the next free train number; the core keeps it
+    current so backends can store it instead of scanning train IDs on open.
+    """
+
+    bytes_written = 0
+    next_train_id = 1
+    transactional = False   # True when the containers are views of stored rows that rollback() restores
+
+    def open(self):
+        raise NotImplementedError
+
+    def recover(self):
+        """(op, args) records that must be re-applied after open (e.g. a journal)."""
+        return []
+
+    def persist(self, records):
+        raise NotImplementedError
+
+    def rollback(self):
+        """Drops the writes of a failed commit; the core undoes its in-memory changes unless ``transactional``."""
+
+    def sync(self):
+        pass
+
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PickleStorage(Storage):
+    """The original pickle snapshot, optionally fronted by an append-only journal."""
+
+    def __init__(self, data_file=DATA_FILE, journal_file=JOURNAL_FILE, fsync_every=1, compact_every=1000):
+        self.data_file = data_file
+        # In journal mode each mutation appends one record; the snapshot is only
+        # rewritten when the journal is compacted every `compact_every` records.
+        self.journal = Journal(journal_file, fsync_every) if journal_file else None
+        self.compact_every = compact_every
+        self.journal_seq = 0
+
+    def open(self):
+        self.load_snapshot()
+        route_index = RouteIndex()
+        route_index.rebuild(self.trains)
+        return StorageState(self.users, self.trains, self.bookings, route_index, self.next_train_id)
+
+    def compute_next_train_id(self):
+        numbers = [number for number in map(train_number, self.trains) if number is not None]
+        return max(numbers) + 1 if numbers else 1  # No trains exist, start from 1
+
+    def load_snapshot(self):
+        self.users = default_users()
+        self.trains = {}
+        self.bookings = BookingStore()
+        self.next_train_id = 1
+        self.journal_seq = 0    # Every journal record is newer than a missing snapshot
+        if not os.path.exists(self.data_file):
+            return
+        try:
+            with open(self.data_file, "rb") as file:
+                data = pickle.load(file)
+        except EOFError:
+            return
+        self.users = {intern_text(email): user for email, user in data.get("users", default_users()).items()}
+        # Older pickles hold plain dicts; they are converted to compact records.
+        self.trains = {intern_text(train_id): Train.from_details(details)
+                       for train_id, details in data.get("trains", {}).items()}
+        # Older pickles store a plain booking list without IDs; the
+        # store assigns IDs and rebuilds its indexes either way.
+        self.bookings = BookingStore.from_snapshot(data.get("bookings", []))
+        assign_seats(self.trains, self.bookings)
+        self.journal_seq = data.get("journal_seq", 0)
+        # Snapshots written before the counter was stored need one scan of the train IDs
+        self.next_train_id = data.get("next_train_id") or self.compute_next_train_id()
+
+    def recover(self):
+        if self.journal is None:
+            return []
+        # Replay records newer than the snapshot; older ones were already folded
+        # in by a compaction that crashed before the journal was emptied.
+        records = []
+        for seq, op, args in self.journal.replay():
+            if seq > self.journal_seq:
+                records.append((op, args))
+                self.journal_seq = seq
+        self.journal.open()
+        return records
+
+    def persist(self, records):
+        if self.journal is None:
+            self.save_snapshot()
+            return
+        self.journal_seq += 1
+        # Several mutations are journaled as one "batch" record, so a crash
+        # either keeps or drops the whole batch and it costs a single fsync.
+        op, args = records[0] if len(records) == 1 else ("batch", (records,))
+        self.bytes_written += self.journal.write((self.journal_seq, op, args))
+        if self.compact_every and self.journal.records >= self.compact_every:
+            try:
+                self.compact()
+            except OSError:
+                pass    # The records are journaled either way; compaction is tried again on the next write
+
+    def rollback(self):
+        pass    # Nothing was journaled; the core undoes the in-memory containers
+
+    def sync(self):
+        if self.journal is not None:
+            self.journal.sync_if_due()
+
+    def compact(self):
+        """Folds the journal into a fresh snapshot and empties it."""
+        self.save_snapshot()
+        if self.journal is not None:
+            self.journal.reset()
+
+    def save_snapshot(self):
+        # Write to a temporary file and swap it in so a crash never leaves a
+        # half-written snapshot behind.
+        tmp_file = self.data_file + ".tmp"
+        with open(tmp_file, "wb") as file:
+            pickle.dump({"users": self.users, "trains": self.trains, "bookings": self.bookings.snapshot(),
+                         "journal_seq": self.journal_seq, "next_train_id": self.next_train_id}, file)
+            file.flush()
+            os.fsync(file.fileno())
+            self.bytes_written += file.tell()
+        os.replace(tmp_file, self.data_file)
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    profile BLOB
+);
+CREATE TABLE IF NOT EXISTS trains (
+    train_id TEXT PRIMARY KEY,
+    train_number INTEGER,
+    source TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    source_key TEXT NOT NULL,
+    destination_key TEXT NOT NULL,
+    departure INTEGER NOT NULL,
+    availability INTEGER NOT NULL,
+    timings TEXT,
+    price TEXT,
+    price_value REAL,
+    stops BLOB,
+    seat_map BLOB,
+    schedule BLOB
+);
+CREATE INDEX IF NOT EXISTS trains_route ON trains (source_key, destination_key, departure);
+CREATE INDEX IF NOT EXISTS trains_number ON trains (train_number);
+CREATE INDEX IF NOT EXISTS trains_departure ON trains (departure);
+CREATE INDEX IF NOT EXISTS trains_price ON trains (price_value);
+CREATE INDEX IF NOT EXISTS trains_availability ON trains (availability);
+CREATE TABLE IF NOT EXISTS bookings (
+    booking_id INTEGER PRIMARY KEY,
+    user_email TEXT NOT NULL,
+    train_id TEXT NOT NULL,
+    seats INTEGER NOT NULL,
+    seat_mask BLOB,
+    leg_start INTEGER,
+    leg_stop INTEGER
+);
+CREATE INDEX IF NOT EXISTS bookings_user ON bookings (user_email, train_id);
+CREATE INDEX IF NOT EXISTS bookings_train ON bookings (train_id);
+"""
+
+
+class SQLiteStorage(Storage):
+    """Indexed SQLite backend.
+
+    Nothing is loaded at startup: the containers handed to the core are thin
+    views that read single rows through primary keys and indexes and write
+    targeted row updates. All writes of one commit share a transaction that
+    ``persist`` commits.
+    """
+
+    transactional = True
+
+    def __init__(self, db_file=SQLITE_FILE):
+        self.db_file = db_file
+        self.connection = None
+        self.lock = threading.RLock()
+
+    def open(self):
+        import sqlite3  # Imported here so the pickle backend does not pay for it at startup
+        self.connection = sqlite3.connect(self.db_file, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+            self.upgrade_schema()
+            if self.query_one("SELECT COUNT(*) FROM users WHERE email = ?", (ADMIN_EMAIL,))[0] == 0:
+                self.execute("INSERT INTO users (email, password, profile) VALUES (?, ?, ?)",
+                             (ADMIN_EMAIL, "12345", pickle.dumps({})))
+            self.connection.commit()
+        last_train = self.query_one("SELECT MAX(train_number) FROM trains")[0]
+        return StorageState(SQLiteUsers(self), SQLiteTrains(self), SQLiteBookingStore(self),
+                            SQLiteRouteIndex(self), (last_train or 0) + 1)
+
+    def upgrade_schema(self):
+        """Adds columns missing from databases created by older versions."""
+        columns = {table: {row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")}
+                   for table in ("trains", "bookings")}
+        for table, column in ADDED_COLUMNS:
+            if column.split()[0] not in columns[table]:
+                self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+        if "seat_map" not in columns["trains"]:
+            # Bookings made before seat maps existed get concrete seats
+            self.import_data({}, dict(SQLiteTrains(self).items()), SQLiteBookingStore(self).snapshot())
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            # Writes go through here; their row data approximates the bytes persisted
+            self.bytes_written += sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in params)
+            return self.connection.execute(sql, params)
+
+    def query_one(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchone()
+
+    def query_all(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def persist(self, records):
+        with self.lock:
+            self.connection.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.connection.rollback()
+
+    def close(self):
+        if self.connection is not None:
+            with self.lock:
+                self.connection.commit()
+                self.connection.close()
+            self.connection = None
+
+    def import_data(self, users, trains, bookings):
+        """Bulk-loads already-built containers in a single transaction."""
+        trains = {train_id: Train.from_details(details) for train_id, details in trains.items()}
+        bookings = [Booking.from_details(booking) for booking in bookings]
+        assign_seats(trains, bookings)
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO users (email, password, profile) VALUES (?, ?, ?)",
+                ((email, user["password"], pickle.dumps(user.get("profile", {}))) for email, user in users.items()))
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO trains ({TRAIN_COLUMNS}) VALUES ({TRAIN_PLACEHOLDERS})",
+                (train_row(train_id, details) for train_id, details in trains.items()))
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO bookings ({BOOKING_COLUMNS}) VALUES ({BOOKING_PLACEHOLDERS})",
+                map(booking_row, bookings))
+            self.connection.commit()
+
+
+# Columns added after the first SQLite release, as (table, column definition)
+ADDED_COLUMNS = (("trains", "stops BLOB"), ("trains", "seat_map BLOB"), ("trains", "schedule BLOB"),
+                 ("bookings", "seat_mask BLOB"), ("bookings", "leg_start INTEGER"), ("bookings", "leg_stop INTEGER"))
+TRAIN_COLUMNS = ("train_id, train_number, source, destination, source_key, destination_key, departure, "
+                 "availability, timings, price, price_value, stops, seat_map, schedule")
+TRAIN_PLACEHOLDERS = ", ".join("?" * 14)
+TRAIN_FIELDS = "source, destination, availability, timings, price, stops, seat_map, schedule"
+BOOKING_COLUMNS = "booking_id, user_email, train_id, seats, seat_mask, leg_start, leg_stop"
+BOOKING_PLACEHOLDERS = ", ".join("?" * 7)
+
+
+def train_row(train_id, train):
+    train = Train.from_details(train)
+    return (train_id, train_number(train_id), train.source, train.destination, normalize_station(train.source),
+            normalize_station(train.destination), train.departure, train.availability, train.timings,
+            train.price, train.price_value, pickle.dumps(train.stops), pickle.dumps(train.seat_map),
+            pickle.dumps(train.schedule) if train.schedule else None)
+
+
+def train_record(row):
+    source, destination, availability, timings, price, stops, seat_map, schedule = row
+    # Rows written before seat maps existed have neither column set
+    return Train(source, destination, availability, timings, price, pickle.loads(stops) if stops else None,
+                 pickle.loads(seat_map) if seat_map else None, pickle.loads(schedule) if schedule else None)
+
+
+def booking_row(booking):
+    return (booking.booking_id, booking.user_email, booking.train_id, booking.seats,
+            mask_to_bytes(booking.seat_mask), booking.leg_start, booking.leg_stop)
+
+
+def booking_record(row):
+    booking_id, user_email, train_id, seats, seat_mask, leg_start, leg_stop = row
+    return Booking(booking_id, user_email, train_id, seats, mask_from_bytes(seat_mask),
+                   None if leg_start is None else (leg_start, leg_stop))
+
+
+class SQLiteUsers(MutableMapping):
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getitem__(self, email):
+        row = self.storage.query_one("SELECT password, profile FROM users WHERE email = ?", (email,))
+        if row is None:
+            raise KeyError(email)
+        return {"password": row[0], "profile": pickle.loads(row[1]) if row[1] else {}}
+
+    def __setitem__(self, email, user):
+        self.storage.execute("INSERT OR REPLACE INTO users (email, password, profile) VALUES (?, ?, ?)",
+                             (email, user["password"], pickle.dumps(user.get("profile", {}))))
+
+    def __delitem__(self, email):
+        self.storage.execute("DELETE FROM users WHERE email = ?", (email,))
+
+    def __contains__(self, email):
+        return self.storage.query_one("SELECT 1 FROM users WHERE email = ?", (email,)) is not None
+
+    def __iter__(self):
+        return (row[0] for row in self.storage.query_all("SELECT email FROM users"))
+
+    def __len__(self):
+        return self.storage.query_one("SELECT COUNT(*) FROM users")[0]
+
+
+class SQLiteTrains(MutableMapping):
+    """train_id -> Train record view; assigning a train writes its row (and seat map) back."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getitem__(self, train_id):
+        row = self.storage.query_one(f"SELECT {TRAIN_FIELDS} FROM trains WHERE train_id = ?", (train_id,))
+        if row is None:
+            raise KeyError(train_id)
+        return train_record(row)
+
+    def __setitem__(self, train_id, details):
+        self.storage.execute(f"INSERT OR REPLACE INTO trains ({TRAIN_COLUMNS}) VALUES ({TRAIN_PLACEHOLDERS})",
+                             train_row(train_id, details))
+
+    def __delitem__(self, train_id):
+        self.storage.execute("DELETE FROM trains WHERE train_id = ?", (train_id,))
+
+    def __contains__(self, train_id):
+        return self.storage.query_one("SELECT 1 FROM trains WHERE train_id = ?", (train_id,)) is not None
+
+    def __iter__(self):
+        return (row[0] for row in self.storage.query_all("SELECT train_id FROM trains ORDER BY rowid"))
+
+    def __len__(self):
+        return self.storage.query_one("SELECT COUNT(*) FROM trains")[0]
+
+    def items(self):
+        rows = self.storage.query_all(f"SELECT train_id, {TRAIN_FIELDS} FROM trains ORDER BY rowid")
+        return [(row[0], train_record(row[1:])) for row in rows]
+
+
+class SQLiteRouteIndex:
+    """RouteIndex counterpart answered by the (route, departure) index of the trains table."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def rebuild(self, trains):
+        pass  # The table is the index
+
+    def add(self, train_id, details):
+        pass  # Route columns are written with the row
+
+    def remove(self, train_id):
+        pass  # Deleting the row removes it from the index
+
+    def update_availability(self, train_id, availability):
+        pass  # Availability is read from the row itself
+
+    def query(self, source, destination, min_seats=0, min_price=None, max_price=None,
+              depart_after=None, depart_before=None, limit=None, offset=0):
+        where = ["source_key = ?", "destination_key = ?", "availability >= ?"]
+        params = [normalize_station(source), normalize_station(destination), min_seats]
+        depart_after = parse_departure(depart_after) if depart_after is not None else None
+        depart_before = parse_departure(depart_before) if depart_before is not None else None
+        for clause, value in (("departure >= ?", depart_after), ("departure <= ?", depart_before),
+                              ("price_value >= ?", min_price), ("price_value <= ?", max_price)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        where = " AND ".join(where)
+        total = self.storage.query_one(f"SELECT COUNT(*) FROM trains WHERE {where}", params)[0]
+        rows = self.storage.query_all(
+            f"SELECT train_id FROM trains WHERE {where} ORDER BY departure, rowid LIMIT ? OFFSET ?",
+            params + [-1 if limit is None else limit, offset])
+        return total, [row[0] for row in rows]
+
+    def page(self, sort_by="train_id", descending=False, station=None, limit=None, offset=0):
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort trains by {sort_by!r}.")
+        where, params = "", []
+        if station:
+            where = "WHERE source_key LIKE ? OR destination_key LIKE ?"
+            pattern = normalize_station(station).replace("%", "").replace("_", "") + "%"
+            params = [pattern, pattern]
+        direction = "DESC" if descending else "ASC"
+        order = ", ".join(f"{column} {direction}" for column in SORT_COLUMNS[sort_by] + ("rowid",))
+        total = self.storage.query_one(f"SELECT COUNT(*) FROM trains {where}", params)[0]
+        rows = self.storage.query_all(f"SELECT train_id FROM trains {where} ORDER BY {order} LIMIT ? OFFSET ?",
+                                      params + [-1 if limit is None else limit, offset])
+        return total, [row[0] for row in rows]
+
+
+# Columns behind RouteIndex.page sort keys (NULL prices sort last ascending, like the in-memory index)
+SORT_COLUMNS = {"train_id": ("train_number",), "departure": ("departure",),
+                "price": ("price_value IS NULL", "price_value"), "availability": ("availability",)}
+
+
+class SQLiteBookingStore:
+    """BookingStore counterpart backed by the bookings table and its indexes."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        last_booking = storage.query_one("SELECT MAX(booking_id) FROM bookings")[0]
+        self.next_booking_id = (last_booking or 0) + 1
+
+    def rows(self, where, params):
+        return [booking_record(row) for row in self.storage.query_all(
+            f"SELECT {BOOKING_COLUMNS} FROM bookings {where} ORDER BY booking_id", params)]
+
+    def snapshot(self):
+        return self.rows("", ())
+
+    def insert(self, booking):
+        booking = Booking.from_details(booking)
+        with self.storage.lock:
+            if booking.booking_id is None:
+                booking.booking_id = self.next_booking_id
+            self.next_booking_id = max(self.next_booking_id, booking.booking_id + 1)
+            self.storage.execute(f"INSERT INTO bookings ({BOOKING_COLUMNS}) VALUES ({BOOKING_PLACEHOLDERS})",
+                                 booking_row(booking))
+        return booking
+
+    def add(self, user_email, train_id, seats):
+        return self.insert({"user_email": user_email, "train_id": train_id, "seats": seats})
+
+    def update(self, booking):
+        self.storage.execute("UPDATE bookings SET seats = ?, seat_mask = ? WHERE booking_id = ?",
+                             (booking.seats, mask_to_bytes(booking.seat_mask), booking.booking_id))
+
+    def remove(self, booking_id):
+        booking = self.get(booking_id)
+        self.storage.execute("DELETE FROM bookings WHERE booking_id = ?", (booking_id,))
+        return booking
+
+    def get(self, booking_id):
+        rows = self.rows("WHERE booking_id = ?", (booking_id,))
+        return rows[0] if rows else None
+
+    def for_user(self, user_email):
+        return self.rows("WHERE user_email = ?", (user_email,))
+
+    def for_train(self, train_id):
+        return self.rows("WHERE train_id = ?", (train_id,))
+
+    def find(self, user_email, train_id, seats):
+        rows = self.rows("WHERE user_email = ? AND train_id = ? AND seats >= ?", (user_email, train_id, seats))
+        return rows[0] if rows else None
+
+    def __len__(self):
+        return self.storage.query_one("SELECT COUNT(*) FROM bookings")[0]
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+
+def migrate_pickle_to_sqlite(data_file=DATA_FILE, db_file=SQLITE_FILE, journal_file=JOURNAL_FILE):
+    """Imports an existing pickle snapshot (plus its journal) into a SQLite database."""
+    # Imported here to avoid a circular import: the core imports this module.
+    from reservation import TrainTicketManagementSystem
+    if journal_file and not os.path.exists(journal_file):
+        journal_file = None
+    source = TrainTicketManagementSystem(storage=PickleStorage(data_file, journal_file))
+    target = SQLiteStorage(db_file)
+    target.open()
+    try:
+        target.import_data(source.users, source.trains, source.bookings)
+    finally:
+        target.close()
+        source.close()
+    return len(source.users), len(source.trains), len(source.bookings)
+
+
+if __name__ == "__main__":
+    import argparse # Importing argparse for the migration command
+
+    parser = argparse.ArgumentParser(description="Storage maintenance for the train reservation data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="Import a pickle snapshot (and journal) into SQLite.")
+    migrate.add_argument("--pickle", default=DATA_FILE)
+    migrate.add_argument("--journal", default=JOURNAL_FILE)
+    migrate.add_argument("--db", default=SQLITE_FILE)
+    arguments = parser.parse_args()
+    users, trains, bookings = migrate_pickle_to_sqlite(arguments.pickle, arguments.db, arguments.journal)
+    print(f"Imported {users} users, {trains} trains and {bookings} bookings into {arguments.db}.")
@@ -0,0 +1,4 @@
+import os   # Importing os for locating the repository root
+import sys  # Importing sys for putting the flat modules on the import path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
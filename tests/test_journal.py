@@ -0,0 +1,34 @@
+from journal import Journal, RECORD_HEADER   # Importing the journal under test
+
+
+def test_replay_drops_torn_tail(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = Journal(path)
+    for number in range(3):
+        journal.write(("book_ticket", number))
+    journal.close()
+    size = (tmp_path / "journal.log").stat().st_size
+    with open(path, "ab") as file:
+        file.write(RECORD_HEADER.pack(100, 0) + b"partial")
+
+    journal = Journal(path)
+    assert journal.replay() == [("book_ticket", number) for number in range(3)]
+    assert (tmp_path / "journal.log").stat().st_size == size
+    journal.write(("cancel_ticket", 0))
+    journal.close()
+    assert Journal(path).replay()[-1] == ("cancel_ticket", 0)
+
+
+def test_replay_stops_at_corrupt_record(tmp_path):
+    path = str(tmp_path / "journal.log")
+    journal = Journal(path)
+    size = journal.write("first")
+    journal.write("second")
+    journal.close()
+    with open(path, "r+b") as file:
+        file.seek(-1, 2)
+        last = file.read(1)
+        file.seek(-1, 2)
+        file.write(bytes([last[0] ^ 0xFF]))
+    assert Journal(path).replay() == ["first"]
+    assert (tmp_path / "journal.log").stat().st_size == size
@@ -0,0 +1,129 @@
+import random   # Importing random for seeded random timetables
+import pytest   # Importing pytest for parametrized cases
+from journey import HORIZON_DAYS, OPTIMIZE, JourneyPlanner  # Importing the planner under test
+from records import DAY_MINUTES, Train, normalize_station   # Importing train records
+
+
+def priority(optimize, arrival, trips, cost):
+    return {"earliest": (arrival, trips, cost), "cheapest": (cost, arrival, trips),
+            "fewest_transfers": (trips, arrival, cost)}[optimize]
+
+
+def brute_force(trains, source, destination, depart_after, optimize, min_connection, max_transfers, seats=0):
+    """Priority of the best journey found by trying every sequence of legs, or None."""
+    source, destination = normalize_station(source), normalize_station(destination)
+    runs = []
+    for train in trains.values():
+        times = train.stop_times()
+        keys = [normalize_station(stop) for stop in train.stops]
+        for day in range(HORIZON_DAYS):
+            runs.append((keys, [time + day * DAY_MINUTES for time in times], train.price_value, train.seat_map))
+    best = None
+
+    def search(station, arrival, trips, cost):
+        nonlocal best
+        ready = arrival + (min_connection if trips else 0)
+        for keys, times, price, seat_map in runs:
+            for board in range(len(keys) - 1):
+                if keys[board] != station or not ready <= times[board] <= ready + DAY_MINUTES:
+                    continue
+                for alight in range(board + 1, len(keys)):
+                    if seats and seat_map.available(board, alight) < seats:
+                        break
+                    rank = priority(optimize, times[alight], trips + 1, cost + price)
+                    if keys[alight] == destination:
+                        best = rank if best is None else min(best, rank)
+                    elif trips + 1 <= max_transfers:
+                        search(keys[alight], times[alight], trips + 1, cost + price)
+
+    if source != destination:
+        search(source, depart_after, 0, 0.0)
+    return best
+
+
+def random_trains(rng, stations=5, count=8):
+    trains = {}
+    for number in range(1, count + 1):
+        stops = rng.sample([f"s{index}" for index in range(stations)], rng.randint(2, 4))
+        schedule = [0]
+        for _ in stops[1:]:
+            schedule.append(schedule[-1] + rng.choice((0, 30, 60, 90, 240, 600)))
+        train = Train(stops[0], stops[-1], rng.randint(1, 3), f"{rng.randrange(24):02d}:{rng.choice((0, 30)):02d}",
+                      rng.randint(1, 9) * 10, stops, schedule=schedule)
+        for segment in range(train.segment_count):
+            if rng.random() < 0.3:
+                train.seat_map.segments[segment] = train.seat_map.all_seats() & rng.getrandbits(3)
+        train.update_availability()
+        trains[f"Train-{number}"] = train
+    return trains
+
+
+def planner_for(trains):
+    planner = JourneyPlanner()
+    planner.rebuild(trains.items())
+    return planner
+
+
+def journey_priority(optimize, journey):
+    return None if journey is None else priority(optimize, journey.arrival, journey.transfers + 1, journey.price)
+
+
+@pytest.mark.parametrize("seed", range(1500))
+def test_plan_matches_brute_force(seed):
+    rng = random.Random(seed)
+    stations = rng.randint(4, 6)
+    trains = random_trains(rng, stations, rng.randint(6, 10))
+    source, destination = rng.sample([f"s{index}" for index in range(stations)], 2)
+    arguments = (rng.randrange(DAY_MINUTES), rng.choice(OPTIMIZE), rng.choice((0, 10, 30)), rng.randint(0, 2),
+                 rng.choice((0, 0, 1, 2)))
+    journey = planner_for(trains).plan(source, destination, *arguments, lambda train_id: trains[train_id].seat_map)
+    expected = brute_force(trains, source, destination, *arguments)
+    # Fares only break ties exactly when they are what is optimized
+    criteria = 3 if arguments[1] == "cheapest" else 2
+    assert (journey_priority(arguments[1], journey) or ())[:criteria] == (expected or ())[:criteria]
+
+
+def test_connection_left_for_fewer_trains():
+    # s3 is reached first by two trains, which max_transfers=1 leaves no
+    # connection from; the later direct arrival must still get to Train-8.
+    trains = {
+        "Train-1": Train("s2", "s3", 10, "09:00", 50, schedule=(0, 180)),
+        "Train-2": Train("s2", "s4", 10, "04:00", 10),
+        "Train-3": Train("s4", "s3", 10, "06:00", 10),
+        "Train-8": Train("s3", "s1", 10, "20:00", 50, schedule=(0, 720)),
+    }
+    planner = planner_for(trains)
+    journey = planner.plan("s2", "s1", depart_after=173, optimize="earliest", max_transfers=1)
+    assert journey is not None
+    assert [leg.train_id for leg in journey.legs] == ["Train-1", "Train-8"]
+    assert (journey.arrival, journey.transfers) == (1920, 1)
+    assert planner.plan("s2", "s1", 173, "fewest_transfers", max_transfers=1) == journey
+
+
+def test_earlier_arrival_through_fewer_trains():
+    trains = {
+        "Train-1": Train("s0", "s1", 10, "04:00", 10),
+        "Train-2": Train("s1", "s2", 10, "05:30", 10),
+        "Train-3": Train("s0", "s2", 10, "06:00", 10, schedule=(0, 120)),
+        "Train-4": Train("s2", "s5", 10, "10:00", 10, schedule=(0, 660)),
+        "Train-5": Train("s0", "s5", 10, "07:00", 10, schedule=(0, 900)),
+    }
+    journey = planner_for(trains).plan("s0", "s5", 0, "earliest", max_transfers=1)
+    assert [leg.train_id for leg in journey.legs] == ["Train-3", "Train-4"]
+    assert journey.arrival == 1260
+
+
+def test_later_boarding_when_earlier_stop_is_sold_out():
+    # Boarding Train-4 at s3 finds s3-s4 sold out; that must not stop a
+    # passenger who boards it at s4 from riding on to s1.
+    trains = {
+        "Train-2": Train("s3", "s4", 3, "21:00", 70, ["s3", "s2", "s4"], schedule=(0, 60, 660)),
+        "Train-4": Train("s2", "s1", 3, "10:30", 10, ["s2", "s3", "s4", "s1"], schedule=(0, 240, 300, 360)),
+    }
+    trains["Train-4"].seat_map.segments[1] = 0b110
+    trains["Train-4"].update_availability()
+    seat_map = lambda train_id: trains[train_id].seat_map
+    journey = planner_for(trains).plan("s3", "s1", 936, "fewest_transfers", 30, 2, 2, seat_map)
+    assert [(leg.train_id, leg.origin, leg.destination) for leg in journey.legs] == [
+        ("Train-2", "s3", "s4"), ("Train-4", "s4", "s1")]
+    assert journey.arrival == 2430
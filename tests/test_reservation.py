@@ -0,0 +1,64 @@
+import os   # Importing os for checking the journal size
+import pytest   # Importing pytest for expected errors
+import journal  # Importing the journal module to make its writes fail
+from reservation import TrainTicketManagementSystem, ADMIN_EMAIL   # Importing the system under test
+
+
+class FailingFile:
+    """Wraps the journal file so a write lands half a record and then fails."""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        self.file.write(data[:7])
+        raise OSError("disk full")
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def state(system):
+    return (len(system.bookings), system.trains["Train-1"].availability,
+            list(system.trains["Train-1"].seat_map.segments), system.bookings.next_booking_id,
+            system.next_train_id, sorted(system.users), system.query_trains("A", "B")["total"],
+            system.generate_report("u@x.com"))
+
+
+@pytest.mark.parametrize("call", [
+    lambda system: system.book_ticket("u@x.com", "Train-1", 1),
+    lambda system: system.cancel_ticket("u@x.com", "Train-1", 1),
+    lambda system: system.cancel_ticket("u@x.com", "Train-1", 2),
+    lambda system: system.add_train(ADMIN_EMAIL, "A", "B", 3, "09:00", "1"),
+    lambda system: system.register_user("v@x.com", "p"),
+    lambda system: system.book_many("u@x.com", [("Train-1", 1), ("Train-1", 1)]),
+])
+def test_failed_journal_write_is_undone(tmp_path, monkeypatch, call):
+    data_file, journal_file = str(tmp_path / "data.pkl"), str(tmp_path / "journal.log")
+    system = TrainTicketManagementSystem(data_file, journal_file)
+    system.add_train(ADMIN_EMAIL, "A", "B", 5, "08:00", "1")
+    system.register_user("u@x.com", "p")
+    system.book_ticket("u@x.com", "Train-1", 2)
+    before = state(system)
+    size = os.path.getsize(journal_file)
+
+    write = journal.Journal.write
+
+    def failing_write(self, record):
+        self.open()
+        self.file = FailingFile(self.file)
+        return write(self, record)
+
+    monkeypatch.setattr(journal.Journal, "write", failing_write)
+    with pytest.raises(OSError):
+        call(system)
+    monkeypatch.undo()
+    assert state(system) == before
+    assert os.path.getsize(journal_file) == size
+
+    system.book_ticket("u@x.com", "Train-1", 1)
+    after = state(system)
+    system.close()
+    system = TrainTicketManagementSystem(data_file, journal_file)
+    assert state(system) == after
+    system.close()
@@ -0,0 +1,45 @@
+from resultcache import INVALIDATED_TAGS_PER_ENTRY, ResultCache   # Importing the cache under test
+
+
+def test_put_refused_only_when_its_tags_changed():
+    cache = ResultCache()
+    _, generation = cache.get("search")
+    cache.invalidate(("train", "Train-2"), ("user", "b@example.com"))
+    cache.put("search", "fresh", [("train", "Train-1")], generation)
+    assert cache.get("search") == ("fresh", None)
+
+    _, generation = cache.get("report")
+    cache.invalidate(("user", "a@example.com"))
+    cache.put("report", "stale", [("user", "a@example.com")], generation)
+    assert cache.get("report")[0] is None
+
+
+def test_invalidate_drops_tagged_entries():
+    cache = ResultCache()
+    for key, tag in (("one", "a"), ("two", "b")):
+        cache.put(key, key, [tag], cache.get(key)[1])
+    cache.invalidate("a")
+    assert cache.get("one")[0] is None
+    assert cache.get("two") == ("two", None)
+
+
+def test_forgotten_tags_refuse_older_results():
+    cache = ResultCache(max_entries=2)
+    _, generation = cache.get("search")
+    cache.invalidate("route")
+    for number in range(INVALIDATED_TAGS_PER_ENTRY * 2):
+        cache.invalidate(("train", number))
+    assert len(cache.invalidated) <= INVALIDATED_TAGS_PER_ENTRY * 2
+    cache.put("search", "stale", ["route"], generation)
+    assert cache.get("search")[0] is None
+    _, generation = cache.get("search")
+    cache.put("search", "fresh", ["route"], generation)
+    assert cache.get("search") == ("fresh", None)
+
+
+def test_clear_refuses_results_computed_before_it():
+    cache = ResultCache()
+    _, generation = cache.get("search")
+    cache.clear()
+    cache.put("search", "stale", [], generation)
+    assert cache.get("search")[0] is None
@@ -0,0 +1,38 @@
+import io   # Importing io for in-memory timetables
+from reservation import TrainTicketManagementSystem, ADMIN_EMAIL   # Importing the system that imports timetables
+from timetable import normalize_row  # Importing the row normalizer under test
+
+
+TIMETABLE = """source,destination,availability,timings,price
+A,B,10,08:00,100
+A,B,10,08:00,nan
+A,B,10,08:00,inf
+A,B,-1,08:00,100
+A,B,10,25:00,100
+,B,10,08:00,100
+C,D,5,09:30,12.5
+"""
+
+
+def test_non_finite_prices_are_rejected():
+    row = {"source": "A", "destination": "B", "availability": "1", "timings": "08:00"}
+    for price in ("nan", "inf", "-inf"):
+        try:
+            normalize_row(dict(row, price=price))
+        except ValueError as error:
+            assert "price" in str(error)
+        else:
+            raise AssertionError(f"{price} was accepted")
+    assert normalize_row(dict(row, price="7"))["price"] == 7
+
+
+def test_import_rejects_bad_rows_one_by_one(tmp_path):
+    system = TrainTicketManagementSystem(str(tmp_path / "data.pkl"), str(tmp_path / "journal.log"))
+    file = io.StringIO(TIMETABLE)
+    file.name = "timetable.csv"
+    result = system.import_timetable(ADMIN_EMAIL, file)
+    assert (result.imported, result.failed) == (2, 5)
+    assert [line for line, _ in result.errors] == [3, 4, 5, 6, 7]
+    assert system.query_trains("A", "B")["total"] == 1
+    assert system.query_trains("C", "D")["total"] == 1
+    system.close()
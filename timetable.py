@@ -0,0 +1,115 @@
+import os   # Importing os for telling timetable formats apart by extension
+import csv  # Importing csv for reading CSV timetables
+import json # Importing json for reading JSONL timetables
+import math # Importing math for rejecting prices that are not finite
+from records import parse_departure, parse_price # Importing the timetable parsers
+
+
+FORMATS = ("csv", "jsonl")
+# Columns of a timetable row; stops and arrival are optional
+COLUMNS = ("source", "destination", "availability", "timings", "price", "stops", "arrival")
+
+
+def timetable_format(path, format=None):
+    if format is None:
+        format = "jsonl" if os.path.splitext(str(path))[1].lower() in (".jsonl", ".json", ".ndjson") else "csv"
+    if format not in FORMATS:
+        raise ValueError(f"Unknown timetable format {format!r}.")
+    return format
+
+
+def read_timetable(file, format="csv"):
+    """Yields (line number, raw row or error message) from an open CSV or JSONL timetable, one row at a time."""
+    if format == "csv":
+        reader = csv.DictReader(file)
+        missing = [column for column in COLUMNS[:5] if column not in (reader.fieldnames or ())]
+        if missing:
+            yield 1, f"Missing columns: {', '.join(missing)}."
+            return
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield number, f"Invalid JSON: {error}."
+            continue
+        yield number, row if isinstance(row, dict) else "Expected a JSON object."
+
+
+def parse_stops(stops):
+    """Intermediate stops as names or (name, "HH:MM") pairs.
+
+    CSV cells list them as "Multan; Sukkur@14:30"; JSONL rows may also use a
+    list of names or [name, time] pairs. Raises ValueError for anything else.
+    """
+    if not stops:
+        return []
+    if isinstance(stops, str):
+        stops = [stop for stop in stops.split(";") if stop.strip()]
+    if not isinstance(stops, list):
+        raise ValueError(f"Invalid stops {stops!r}; expected a list of stations.")
+    parsed = []
+    for stop in stops:
+        if isinstance(stop, str):
+            name, _, time = stop.partition("@")
+            stop = (name, time.strip() or None)
+        elif isinstance(stop, list) and len(stop) in (1, 2):
+            stop = (stop[0], stop[1] if len(stop) == 2 else None)
+        else:
+            raise ValueError(f"Invalid stop {stop!r}; expected a name or a [name, time] pair.")
+        name, time = stop
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError(f"Invalid stop name {name!r}.")
+        if time is not None and (not isinstance(time, (str, int)) or parse_departure(time) is None):
+            raise ValueError(f"Invalid time {time!r} for stop {name.strip()!r}; expected HH:MM.")
+        parsed.append((name.strip(), time))
+    return parsed
+
+
+def normalize_row(row):
+    """add_train arguments from a raw timetable row; raises ValueError describing the first bad field."""
+    def text(column):
+        value = row.get(column)
+        return "" if value is None else str(value).strip()
+
+    source, destination = text("source"), text("destination")
+    if not source or not destination:
+        raise ValueError("Source and destination are required.")
+    try:
+        availability = int(text("availability"))
+    except ValueError:
+        raise ValueError(f"Invalid availability {text('availability')!r}.") from None
+    if availability < 0:
+        raise ValueError(f"Invalid availability {availability}.")
+    departure = parse_departure(text("timings"))
+    if departure is None:
+        raise ValueError(f"Invalid timings {text('timings')!r}; expected HH:MM.")
+    price = parse_price(text("price"))
+    if price is None or not math.isfinite(price) or price < 0:
+        raise ValueError(f"Invalid price {text('price')!r}.")
+    return {
+        "source": source,
+        "destination": destination,
+        "availability": availability,
+        "timings": f"{departure // 60:02d}:{departure % 60:02d}",
+        "price": int(price) if price.is_integer() else price,
+        "stops": parse_stops(row.get("stops")),
+        "arrival": text("arrival") or None,
+    }
+
+
+def timetable_rows(rows):
+    """Yields (line number, add_train arguments, None) or (line number, None, error) for raw rows."""
+    for line, row in rows:
+        if isinstance(row, str):
+            yield line, None, row
+            continue
+        try:
+            yield line, normalize_row(row), None
+        except ValueError as error:
+            yield line, None, str(error)
+
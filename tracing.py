@@ -0,0 +1,285 @@
+import json # Importing json for the JSONL trace format
+import time # Importing time for trace timestamps and replay pacing
+import zlib # Importing zlib for spreading users over replay workers
+import queue    # Importing queue for handing operations to replay workers
+import threading    # Importing threading for the recorder lock and replay workers
+import functools    # Importing functools for preserving wrapped method metadata
+from collections import namedtuple  # Importing namedtuple for the replay result
+from metrics import percentiles # Importing the latency summary
+
+
+# Requests recorded in traces and accepted on replay; the file-handling and lifecycle ones are left out
+TRACED_OPERATIONS = ("register_user", "login_user", "add_train", "search_trains", "query_trains", "list_trains",
+                     "plan_journey", "seat_availability", "book_ticket", "cancel_ticket", "book_many",
+                     "cancel_many", "generate_report", "analytics_report")
+# Requests whose first argument is the caller's email (recorded as "user")
+USER_OPERATIONS = frozenset(("register_user", "login_user", "add_train", "book_ticket", "cancel_ticket", "book_many",
+                             "cancel_many", "generate_report", "analytics_report"))
+PASSWORD_OPERATIONS = frozenset(("register_user", "login_user"))    # Passwords are recorded as null
+REPLAY_PASSWORD = "replayed"    # Password of users a replayed trace registers
+TRACE_VARIABLE = "TRAIN_RESERVATION_TRACE"  # Trace file the GUI records to when set
+REPLAY_QUEUE_SIZE = 1000    # Operations waiting per replay worker before the reader blocks
+
+# latency and delay are percentiles() summaries: latency per operation (and "all"), delay of paced
+# operations behind their schedule; problems lists what check_consistency found afterwards
+ReplayResult = namedtuple("ReplayResult", "operations elapsed throughput errors mismatches latency delay problems")
+
+
+class TraceRecorder:
+    """Appends one JSONL line per request a TrainTicketManagementSystem serves.
+
+    A line is {"ts": seconds since this recorder started, "user": caller or
+    null, "op": method name, "args": [...], "kwargs": {...}, "error":
+    ReservationError class name or null}, written when the request returns,
+    so the file is in completion order. Passwords are never written.
+    ``enable`` wraps the system's traced methods on that instance, like
+    Metrics does; requests made inside another traced request are not
+    recorded again.
+    """
+
+    def __init__(self, file):
+        self.file = open(file, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.perf_counter()
+
+    def enable(self, system):
+        for name in TRACED_OPERATIONS:
+            setattr(system, name, self.wrap(getattr(system, name), name))
+
+    def wrap(self, function, operation):
+        local = self.local
+
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            if getattr(local, "active", False):
+                return function(*args, **kwargs)
+            local.active = True
+            start = time.perf_counter()
+            error = None
+            try:
+                return function(*args, **kwargs)
+            except Exception as exception:
+                error = type(exception).__name__
+                raise
+            finally:
+                local.active = False
+                self.record(start - self.started, operation, args, kwargs, error)
+        return traced
+
+    def record(self, ts, operation, args, kwargs, error=None):
+        user = None
+        if operation in USER_OPERATIONS and args:
+            user, args = args[0], args[1:]
+        if operation in PASSWORD_OPERATIONS:
+            args = (None,) + tuple(args[1:])
+        entry = {"ts": round(ts, 6), "user": user, "op": operation, "args": list(args)}
+        if kwargs:
+            entry["kwargs"] = kwargs
+        entry["error"] = error
+        line = json.dumps(entry, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_trace(file):
+    """Trace entries of a path or open text file, one at a time; rejects operations that are not traced."""
+    if isinstance(file, str):
+        with open(file, encoding="utf-8") as opened:
+            yield from read_trace(opened)
+        return
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as error:
+            raise ValueError(f"line {number}: {error}") from None
+        if not isinstance(entry, dict) or entry.get("op") not in TRACED_OPERATIONS:
+            raise ValueError(f"line {number}: not a traced operation")
+        yield entry
+
+
+def call(system, entry):
+    """Runs one trace entry against `system`."""
+    operation, args = entry["op"], list(entry.get("args", ()))
+    if operation in USER_OPERATIONS:
+        args.insert(0, entry.get("user"))
+    if operation in PASSWORD_OPERATIONS and len(args) > 1 and args[1] is None:
+        email = args[0]
+        if operation == "register_user":
+            args[1] = REPLAY_PASSWORD
+        elif entry.get("error") is None and email in system.users:
+            args[1] = system.users[email]["password"]
+        else:
+            args[1] = ""    # The recorded login failed, so this one should too
+    return getattr(system, operation)(*args, **entry.get("kwargs", {}))
+
+
+def replay(system, trace, rate=None, speed=None, concurrency=1):
+    """Replays a trace against `system` and checks its seat state afterwards.
+
+    Operations start as fast as possible, at `rate` per second, or at their
+    recorded times divided by `speed`. `concurrency` worker threads serve
+    them; each user's operations go to the same worker, so they run in
+    trace order. ``mismatches`` counts operations whose outcome (success or
+    error class) differs from the recorded one, which is only expected to
+    be zero when replaying against the data the trace was recorded on.
+    """
+    queues = [queue.Queue(REPLAY_QUEUE_SIZE) for _ in range(concurrency)]
+    lock = threading.Lock()
+    latency, delay, errors = {}, [], {}
+    mismatches = 0
+
+    def work(pending):
+        nonlocal mismatches
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            due, entry = item
+            start = time.perf_counter()
+            error = None
+            try:
+                call(system, entry)
+            except Exception as exception:
+                error = type(exception).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                latency.setdefault(entry["op"], []).append(elapsed)
+                if due is not None:
+                    delay.append(max(0.0, start - due))
+                if error is not None:
+                    errors[error] = errors.get(error, 0) + 1
+                if error != entry.get("error"):
+                    mismatches += 1
+
+    workers = [threading.Thread(target=work, args=(pending,), daemon=True) for pending in queues]
+    for worker in workers:
+        worker.start()
+    operations = 0
+    start = time.perf_counter()
+    try:
+        for operations, entry in enumerate(read_trace(trace), 1):
+            due = None
+            if rate:
+                due = start + (operations - 1) / rate
+            elif speed:
+                due = start + entry.get("ts", 0) / speed
+            if due is not None:
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            user = entry.get("user")
+            worker = zlib.crc32(user.encode()) % concurrency if user else operations % concurrency
+            queues[worker].put((due, entry))
+    finally:
+        for pending in queues:
+            pending.put(None)
+        for worker in workers:
+            worker.join()
+    elapsed = time.perf_counter() - start
+    summary = {operation: percentiles(samples) for operation, samples in sorted(latency.items())}
+    summary["all"] = percentiles([sample for samples in latency.values() for sample in samples])
+    return ReplayResult(operations, elapsed, operations / elapsed if elapsed else float("inf"), errors,
+                        mismatches, summary, percentiles(delay), check_consistency(system))
+
+
+def check_consistency(system):
+    """Problems in the seat state (an empty list when consistent).
+
+    Checks that no train has negative or stale availability, every booking
+    holds as many seats as it records, within the train's capacity, no seat
+    is held twice on a segment, and each train's seat map is exactly the
+    union of its bookings.
+    """
+    problems = []
+    held = {}   # train ID -> bookings holding seats on it
+    for booking in system.bookings:
+        if booking.seat_mask is None:
+            continue
+        if booking.seat_mask.bit_count() != booking.seats:
+            problems.append(f"Booking {booking.booking_id} records {booking.seats} seats but holds "
+                            f"{booking.seat_mask.bit_count()}.")
+        held.setdefault(booking.train_id, []).append(booking)
+    for train_id, train in system.trains.items():
+        seat_map = train.seat_map
+        if train.availability < 0:
+            problems.append(f"{train_id} has negative availability ({train.availability}).")
+        elif train.availability != seat_map.available():
+            problems.append(f"{train_id} reports {train.availability} seats available but has "
+                            f"{seat_map.available()} free.")
+        segments = [0] * seat_map.segment_count
+        for booking in held.pop(train_id, ()):
+            start, stop = booking.leg or (0, seat_map.segment_count)
+            if booking.seat_mask & ~seat_map.all_seats():
+                problems.append(f"Booking {booking.booking_id} holds seats beyond {train_id}'s capacity "
+                                f"({seat_map.capacity}).")
+            for segment in range(start, stop):
+                if segments[segment] & booking.seat_mask:
+                    problems.append(f"Booking {booking.booking_id} holds seats already taken on {train_id}.")
+                segments[segment] |= booking.seat_mask
+        if segments != seat_map.segments:
+            problems.append(f"{train_id}'s seat map does not match its bookings.")
+    for train_id, bookings in held.items():
+        problems.append(f"{len(bookings)} bookings hold seats on unknown train {train_id}.")
+    return problems
+
+
+if __name__ == "__main__":
+    import os   # Importing os for the scratch copy paths
+    import sys  # Importing sys for the exit code
+    import shutil   # Importing shutil for copying the data before replaying
+    import argparse # Importing argparse for the replay command
+    import tempfile # Importing tempfile for the scratch copy
+    from reservation import TrainTicketManagementSystem  # Importing the headless reservation core
+    from storage import DATA_FILE, JOURNAL_FILE, SQLiteStorage  # Importing the storage backends
+
+    parser = argparse.ArgumentParser(description="Replay a request trace against a copy of the reservation data.")
+    parser.add_argument("trace")
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--journal", default=JOURNAL_FILE)
+    parser.add_argument("--db", help="Replay against a copy of this SQLite database instead.")
+    pacing = parser.add_mutually_exclusive_group()
+    pacing.add_argument("--rate", type=float, help="Operations started per second (default: as fast as possible).")
+    pacing.add_argument("--speed", type=float, help="Follow the recorded timing, this many times faster.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Worker threads.")
+    parser.add_argument("--output", help="Also write the results as JSON to this file.")
+    arguments = parser.parse_args()
+    if arguments.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    workdir = tempfile.mkdtemp(prefix="train-replay-")
+    try:
+        if arguments.db:
+            db_file = os.path.join(workdir, "replay.db")
+            if os.path.exists(arguments.db):
+                shutil.copy(arguments.db, db_file)
+            system = TrainTicketManagementSystem(storage=SQLiteStorage(db_file))
+        else:
+            data_file, journal_file = os.path.join(workdir, "replay.pkl"), os.path.join(workdir, "replay.journal")
+            for source, copy in ((arguments.data_file, data_file), (arguments.journal, journal_file)):
+                if os.path.exists(source):
+                    shutil.copy(source, copy)
+            system = TrainTicketManagementSystem(data_file, journal_file)
+        try:
+            result = replay(system, arguments.trace, arguments.rate, arguments.speed, arguments.concurrency)
+        except (OSError, ValueError) as error:
+            parser.exit(1, f"{error}\n")
+        finally:
+            system.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    document = result._asdict()
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(document, file, indent=2)
+    print(json.dumps(document, indent=2))
+    sys.exit(1 if result.problems else 0)
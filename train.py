@@ -1,165 +1,32 @@
-
 import tkinter as tk    # Importing Tkinter for GUI elements
 from tkinter import messagebox  # Importing messagebox module from Tkinter for displaying messages
 from tkinter import ttk # Importing ttk module from Tkinter for themed widgets
-import re   # Importing re for regular expressions
-import pickle   # Importing pickle for object serialization
-import os   # Importing os for interacting with the operating system
+from tkinter import filedialog  # Importing filedialog for exporting metrics and choosing timetables
 from PIL import Image, ImageTk  # Importing PIL's Image and ImageTk modules for image handling
-import urllib.request   # Importing urllib.request for handling URLs
-
-
-class TrainTicketManagementSystem:
-    def __init__(self):
-        self.load_data()
-        # Compute the next train ID dynamically
-        self.next_train_id = self.compute_next_train_id()
-        self.current_user = None
+import os   # Importing os for checking the cached background image
+import time # Importing time for the background cache age
+import threading    # Importing threading for refreshing the background off the UI thread
+import json # Importing json for reading metrics snapshots
+import csv  # Importing csv for the errors of unreadable timetables (already loaded by the core)
+from collections import OrderedDict # Importing OrderedDict for the resized-background LRU cache
+from reservation import TrainTicketManagementSystem, ReservationError, ADMIN_EMAIL  # Importing the headless reservation core
+from tracing import TRACE_VARIABLE  # Importing the variable naming the optional request trace
 
-    def compute_next_train_id(self):
-        if not self.trains:
-            return 1  # No trains exist, start from 1
-        max_id = max(
-            int(train_id.split('-')[1]) for train_id in self.trains.keys() if train_id.startswith("Train-")
-        )
-        return max_id + 1
-
-    def is_valid_email(self, email):
-        return re.match(r"[^@]+@[^@]+\.[^@]+", email) is not None
-
-    def register_user(self, email, password):
-        if not self.is_valid_email(email):
-            messagebox.showerror("Error", "Invalid email format.")
-            return
-        if email in self.users:
-            messagebox.showerror("Error", "Email is already registered.")
-            return
-        self.users[email] = {"password": password, "profile": {}}
-        self.save_data()
-        messagebox.showinfo("Success", f"User registered successfully with email: {email}")
-
-    def login_user(self, email, password):
-        if not self.is_valid_email(email):
-            messagebox.showerror("Error", "Invalid email format.")
-            return False
-        if email not in self.users:
-            messagebox.showerror("Error", "Email is not registered.")
-            return False
-        if self.users[email]["password"] == password:
-            self.current_user = email
-            messagebox.showinfo("Success", "User logged in successfully!")
-            return True
-        else:
-            messagebox.showerror("Error", "Incorrect password.")
-            return False
-
-    def add_train(self, source, destination, availability, timings, price):
-        if self.current_user != "admin@gmail.com":
-            messagebox.showerror("Error", "Only admin can add trains.")
-            return
-        train_id = f"Train-{self.next_train_id}"
-        self.trains[train_id] = {
-            "route": (source, destination),
-            "availability": int(availability),
-            "timings": timings,
-            "price": price,
-        }
-        self.next_train_id += 1  # Increment for the next train
-        self.save_data()
-        messagebox.showinfo("Success", f"Train {train_id} added successfully!")
-
-    def search_trains(self, source, destination):
-        available_trains = []
-        for train_id, details in self.trains.items():
-            if details["route"] == (source, destination):
-                available_trains.append(f"{train_id}: {details}")
-        if not available_trains:
-            return "No trains available for this route."
-        return "\n".join(available_trains)
-
-    def book_ticket(self, train_id, seats):
-        try:
-            seats = int(seats)
-        except ValueError:
-            messagebox.showerror("Error", "Please enter a valid number of seats.")
-            return
-
-        if train_id not in self.trains:
-            messagebox.showerror("Error", "Invalid train ID.")
-            return
-
-        availability = int(self.trains[train_id]["availability"])
-
-        if availability < seats:
-            messagebox.showerror("Error", "Not enough seats available.")
-            return
-
-        self.trains[train_id]["availability"] = availability - seats
-        self.bookings.append({"user_email": self.current_user, "train_id": train_id, "seats": seats})
-        self.save_data()
-        messagebox.showinfo("Success", f"Booking successful for {seats} seats on {train_id}.")
-
-    def cancel_ticket(self, train_id, seats):
-        try:
-            seats = int(seats)
-        except ValueError:
-            messagebox.showerror("Error", "Please enter a valid number of seats.")
-            return
-
-        for booking in self.bookings:
-            if booking["user_email"] == self.current_user and booking["train_id"] == train_id:
-                if booking["seats"] >= seats:
-                    self.trains[train_id]["availability"] += seats
-                    booking["seats"] -= seats
-                    if booking["seats"] == 0:
-                        self.bookings.remove(booking)
-                    self.save_data()
-                    messagebox.showinfo("Success", f"Successfully cancelled {seats} seats on {train_id}.")
-                    return
-        messagebox.showerror("Error", "Booking not found or invalid number of seats to cancel.")
-
-    def generate_report(self):
-        report_lines = []
-        for booking in self.bookings:
-            if booking["user_email"] == self.current_user:
-                train_id = booking["train_id"]
-                train_details = self.trains.get(train_id)
-                if train_details:
-                    source, destination = train_details["route"]
-                    timings = train_details["timings"]
-                    seats = booking["seats"]
-                    report_lines.append(f"Train ID: {train_id}, Source: {source}, Destination: {destination}, "f"Timings: {timings}, Seats Booked: {seats}")
-        if not report_lines:
-            return "No bookings found."
-        return "\n".join(report_lines)
-
-    def save_data(self):
-        with open("train_ticket_data.pkl", "wb") as file:
-            pickle.dump({"users": self.users, "trains": self.trains, "bookings": self.bookings}, file)
-
-    def load_data(self):
-        if not os.path.exists("train_ticket_data.pkl"):
-            self.users = {"admin@gmail.com": {"password": "12345", "profile": {}}}
-            self.trains = {}
-            self.bookings = []
-            return
-        try:
-            with open("train_ticket_data.pkl", "rb") as file:
-                data = pickle.load(file)
-                self.users = data.get("users", {"admin@gmail.com": {"password": "12345", "profile": {}}})
-                self.trains = data.get("trains", {})
-                self.bookings = data.get("bookings", [])
-        except EOFError:
-            self.users = {"admin@gmail.com": {"password": "12345", "profile": {}}}
-            self.trains = {}
-            self.bookings = []
 
+BACKGROUND_URL = "https://img.freepik.com/free-photo/view-3d-modern-train-with-nature-scenery_23-2150905519.jpg"
+BACKGROUND_FILE = "background.jpg"
+BACKGROUND_MAX_AGE = 7 * 24 * 60 * 60  # Seconds before the cached image is refreshed (in the background)
+BACKGROUND_CACHE_SIZE = 8   # Resized backgrounds kept, keyed by window size
+RESIZE_DEBOUNCE_MS = 150    # Quiet time after the last <Configure> before the full-quality resize
+TRAIN_PAGE_SIZE = 100   # Rows fetched per page in the All Trains view
+FILTER_DEBOUNCE_MS = 250    # Pause in typing before the All Trains filter is applied
 
 
 class TrainTicketManagementGUI:
     def __init__(self, root, system):
         self.root = root
         self.system = system
+        self.current_user = None  # The core is headless; the GUI tracks who is logged in
         self.root.title("Train Ticket Management System")
         self.root.geometry("800x600")
         self.load_background_image()
@@ -176,18 +43,97 @@ class TrainTicketManagementGUI:
         style.configure("Large.TButton", font=("Helvetica", 14), padding=(5, 5))
 
     def load_background_image(self):
-        url = "https://img.freepik.com/free-photo/view-3d-modern-train-with-nature-scenery_23-2150905519.jpg"
-        image_path = "background.jpg"
-        urllib.request.urlretrieve(url, image_path)
-        self.bg_image = Image.open(image_path)
+        self.bg_image = None
+        self.bg_cache = OrderedDict()   # (width, height) -> PhotoImage, least recently used first
+        self.bg_item = None     # Canvas image item reused across resizes
+        self.bg_drawn_size = None
+        self.resize_job = None
+        self.bg_downloaded = False
+        # Use the image on disk when there is one; the network is only touched
+        # in the background, so startup never waits for it and works offline.
+        if os.path.exists(BACKGROUND_FILE):
+            self.set_background_image(Image.open(BACKGROUND_FILE))
+            if time.time() - os.path.getmtime(BACKGROUND_FILE) > BACKGROUND_MAX_AGE:
+                self.refresh_background_image()
+        else:
+            self.refresh_background_image()
+
+    def set_background_image(self, image):
+        image.load()
+        self.bg_image = image
+        # Small copy used for fast previews while the window is being dragged
+        self.bg_preview = image.copy()
+        self.bg_preview.thumbnail((480, 360))
+        self.bg_cache.clear()
+        self.bg_drawn_size = None
+
+    def refresh_background_image(self):
+        def download():
+            import urllib.request   # Imported on first download; it pulls in the whole HTTP/SSL stack
+            part_file = BACKGROUND_FILE + ".part"
+            try:
+                urllib.request.urlretrieve(BACKGROUND_URL, part_file)
+                os.replace(part_file, BACKGROUND_FILE)
+                self.bg_downloaded = True
+            except OSError:
+                pass    # Offline: keep the cached image (or the plain background)
+
+        self.download_thread = threading.Thread(target=download, daemon=True)
+        self.download_thread.start()
+        self.root.after(500, self.poll_background_download)
+
+    def poll_background_download(self):
+        # Tk is not thread-safe, so the new image is picked up from the UI thread.
+        if self.download_thread.is_alive():
+            self.root.after(500, self.poll_background_download)
+        elif self.bg_downloaded:
+            self.set_background_image(Image.open(BACKGROUND_FILE))
+            self.resize_background()
 
     def resize_background(self, event=None):
+        if event is not None and event.widget is not self.root:
+            return  # Child widgets report <Configure> through the root binding too
+        if self.bg_image is None or not hasattr(self, 'canvas') or not self.canvas.winfo_exists():
+            return
+        size = (max(1, self.root.winfo_width()), max(1, self.root.winfo_height()))
+        if event is None:
+            # A new page (new canvas) or a new image: draw at full quality now.
+            self.draw_background(size, final=True)
+            return
+        if size == self.bg_drawn_size:
+            return
+        # While the window is being dragged show a cheap preview and only run
+        # the LANCZOS resize once the size has settled.
+        self.draw_background(size, final=size in self.bg_cache)
+        if self.resize_job is not None:
+            self.root.after_cancel(self.resize_job)
+        self.resize_job = self.root.after(RESIZE_DEBOUNCE_MS, self.finish_resize)
+
+    def finish_resize(self):
+        self.resize_job = None
         if hasattr(self, 'canvas') and self.canvas.winfo_exists():
-            width = self.root.winfo_width()
-            height = self.root.winfo_height()
-            resized_bg = self.bg_image.resize((width, height), Image.LANCZOS)
-            self.bg_photo = ImageTk.PhotoImage(resized_bg)
-            self.canvas.create_image(0, 0, image=self.bg_photo, anchor="nw")
+            self.draw_background((max(1, self.root.winfo_width()), max(1, self.root.winfo_height())), final=True)
+
+    def draw_background(self, size, final):
+        if final:
+            photo = self.bg_cache.get(size)
+            if photo is None:
+                photo = ImageTk.PhotoImage(self.bg_image.resize(size, Image.LANCZOS))
+                self.bg_cache[size] = photo
+                if len(self.bg_cache) > BACKGROUND_CACHE_SIZE:
+                    self.bg_cache.popitem(last=False)
+            else:
+                self.bg_cache.move_to_end(size)
+        else:
+            photo = ImageTk.PhotoImage(self.bg_preview.resize(size, Image.BILINEAR))
+        self.bg_photo = photo   # Keep a reference so Tk does not drop the image
+        self.bg_drawn_size = size
+        if self.bg_item is not None and self.bg_item_canvas is self.canvas:
+            self.canvas.itemconfig(self.bg_item, image=photo)
+        else:
+            self.bg_item = self.canvas.create_image(0, 0, image=photo, anchor="nw")
+            self.bg_item_canvas = self.canvas
+            self.canvas.tag_lower(self.bg_item)
 
     def setup_page_with_background(self):
         for widget in self.root.winfo_children():
@@ -201,7 +147,7 @@ class TrainTicketManagementGUI:
 
         # Create the frame with increased width, height, and rounded corners
         frame = ttk.Frame(self.root, style="Rounded.TFrame")
-        frame.place(relx=0.5, rely=0.5, anchor="center", width=500, height=400)  # Adjust the width and height here
+        frame.place(relx=0.5, rely=0.5, anchor="center", width=500, height=550)  # Adjust the width and height here
 
         # Apply border radius effect using rounded corners
         ttk.Label(frame, text="Train Ticket Reservation System", font=("Times New Roman", 28)).pack(pady=20)
@@ -220,16 +166,19 @@ class TrainTicketManagementGUI:
             ttk.Button(frame, text="Booking Report", command=self.view_report, style="Large.TButton").pack(pady=5)
             ttk.Button(frame, text="Show All Trains", command=self.show_all_trains, style="Large.TButton").pack(pady=5)
 
-            if self.system.current_user == "admin@gmail.com":
+            if self.current_user == ADMIN_EMAIL:
                 # Add train option for admin
                 ttk.Button(frame, text="Add Train (Admin)", command=self.add_train, style="Large.TButton").pack(pady=5)
+                ttk.Button(frame, text="Import Timetable (Admin)", command=self.import_timetable, style="Large.TButton").pack(pady=5)
+                ttk.Button(frame, text="Metrics (Admin)", command=self.show_metrics, style="Large.TButton").pack(pady=5)
+                ttk.Button(frame, text="Analytics (Admin)", command=self.show_analytics, style="Large.TButton").pack(pady=5)
             else:
                 # Logout option for non-admin users
                 ttk.Button(frame, text="Logout", command=self.logout_user, style="Large.TButton").pack(pady=5)
 
     def logout_user(self):
         """Logs out the current user and returns to the main menu."""
-        self.system.current_user = None  # Clear the current user
+        self.current_user = None  # Clear the current user
         messagebox.showinfo("Logout", "You have been logged out.")
         self.main_menu(logged_in=False)
 
@@ -260,7 +209,7 @@ class TrainTicketManagementGUI:
         show_password_checkbox.pack(pady=5)
 
         # Register and Back buttons with larger padding
-        ttk.Button(frame, text="Register",command=lambda: self.system.register_user(email_entry.get(), password_entry.get())).pack(pady=10)
+        ttk.Button(frame, text="Register",command=lambda: self.register_user(email_entry.get(), password_entry.get())).pack(pady=10)
         ttk.Button(frame, text="Back to Main Menu", command=lambda: self.main_menu(logged_in=False)).pack(pady=10)
 
     def login(self):
@@ -295,15 +244,78 @@ class TrainTicketManagementGUI:
     def toggle_password_visibility(self, entry, show_var):
         entry.config(show="" if show_var.get() else "*")
 
+    def run_request(self, request, *args):
+        """Calls the reservation core and reports typed errors in a message box."""
+        try:
+            return request(*args)
+        except ReservationError as error:
+            messagebox.showerror("Error", str(error))
+            return None
+
+    def register_user(self, email, password):
+        if self.run_request(self.system.register_user, email, password):
+            messagebox.showinfo("Success", f"User registered successfully with email: {email}")
+
     def login_user(self, email, password):
-        if self.system.login_user(email, password):
+        user = self.run_request(self.system.login_user, email, password)
+        if user:
+            self.current_user = user
+            messagebox.showinfo("Success", "User logged in successfully!")
             self.main_menu(logged_in=True)
 
+    def save_train(self, source, destination, availability, timings, price, stops=""):
+        train_id = self.run_request(self.system.add_train, self.current_user, source, destination,
+                                    availability, timings, price, stops.split(","))
+        if train_id:
+            messagebox.showinfo("Success", f"Train {train_id} added successfully!")
+
+    def import_timetable(self):
+        """Bulk-imports a CSV/JSONL timetable on the core's thread pool and reports when it is done."""
+        if self.current_user != ADMIN_EMAIL:
+            messagebox.showerror("Error", "Only admin can add trains.")
+            return
+        path = filedialog.askopenfilename(filetypes=[("Timetables", "*.csv *.jsonl"), ("All files", "*.*")])
+        if not path:
+            return
+        future = self.system.submit("import_timetable", self.current_user, path)
+        self.root.after(200, self.poll_import, future)
+
+    def poll_import(self, future):
+        # Tk is not thread-safe, so the result is picked up from the UI thread.
+        if not future.done():
+            self.root.after(200, self.poll_import, future)
+            return
+        try:
+            result = future.result()
+        except (ReservationError, OSError) as error:
+            messagebox.showerror("Error", str(error))
+            return
+        except (UnicodeDecodeError, csv.Error) as error:
+            messagebox.showerror("Error", f"Cannot read the timetable: {error}")
+            return
+        summary = f"Imported {result.imported} trains and rejected {result.failed} rows in {result.elapsed:.1f}s."
+        if result.errors:
+            summary += "\n\n" + "\n".join(f"Line {line}: {message}" for line, message in result.errors[:10])
+        messagebox.showinfo("Import Timetable", summary)
+
+    def confirm_booking(self, train_id, seats, origin="", destination=""):
+        result = self.run_request(self.system.book_ticket, self.current_user, train_id, seats,
+                                  origin.strip() or None, destination.strip() or None)
+        if result:
+            seat_numbers = ", ".join(map(str, result.seat_numbers))
+            messagebox.showinfo("Success", f"Booking successful for {result.seats} seats on {result.train_id} "
+                                           f"(seat numbers: {seat_numbers}).")
+
+    def confirm_cancellation(self, train_id, seats):
+        result = self.run_request(self.system.cancel_ticket, self.current_user, train_id, seats)
+        if result:
+            messagebox.showinfo("Success", f"Successfully cancelled {result.seats} seats on {result.train_id}.")
+
     def add_train(self):
         self.setup_page_with_background()
 
         # Create a larger frame and prevent resizing
-        frame = ttk.Frame(self.root, width=500, height=500)
+        frame = ttk.Frame(self.root, width=500, height=570)
         frame.place(relx=0.5, rely=0.5, anchor="center")
         frame.pack_propagate(False)  # Prevent frame from shrinking to fit content
 
@@ -335,8 +347,13 @@ class TrainTicketManagementGUI:
         price_entry = ttk.Entry(frame, width=35)
         price_entry.pack(pady=5)
 
+        # Optional intermediate stops, in running order
+        ttk.Label(frame, text="Stops (comma-separated, optional):").pack(pady=(5, 2))
+        stops_entry = ttk.Entry(frame, width=35)
+        stops_entry.pack(pady=5)
+
         # Buttons with extra padding
-        ttk.Button(frame, text="Add Train", command=lambda: self.system.add_train(source_entry.get(), destination_entry.get(), availability_entry.get(), timings_entry.get(),price_entry.get())).pack(pady=10)
+        ttk.Button(frame, text="Add Train", command=lambda: self.save_train(source_entry.get(), destination_entry.get(), availability_entry.get(), timings_entry.get(),price_entry.get(), stops_entry.get())).pack(pady=10)
 
         ttk.Button(frame, text="Back to Main Menu", command=lambda: self.main_menu(logged_in=True)).pack(pady=10)
 
@@ -374,7 +391,7 @@ class TrainTicketManagementGUI:
         self.setup_page_with_background()
 
         # Create a larger frame and fix its size
-        frame = ttk.Frame(self.root, width=400, height=300)
+        frame = ttk.Frame(self.root, width=400, height=420)
         frame.place(relx=0.5, rely=0.5, anchor="center")
         frame.pack_propagate(False)  # Prevent resizing to content
 
@@ -391,8 +408,16 @@ class TrainTicketManagementGUI:
         seats_entry = ttk.Entry(frame, width=30)
         seats_entry.pack(pady=5)
 
+        # Optional boarding and alighting stops (default: the whole route)
+        ttk.Label(frame, text="From stop (optional):").pack(pady=(5, 2))
+        origin_entry = ttk.Entry(frame, width=30)
+        origin_entry.pack(pady=5)
+        ttk.Label(frame, text="To stop (optional):").pack(pady=(5, 2))
+        destination_entry = ttk.Entry(frame, width=30)
+        destination_entry.pack(pady=5)
+
         # Book button with padding
-        ttk.Button(frame, text="Book",command=lambda: self.system.book_ticket(train_id_entry.get(), seats_entry.get())).pack(pady=7)
+        ttk.Button(frame, text="Book",command=lambda: self.confirm_booking(train_id_entry.get(), seats_entry.get(), origin_entry.get(), destination_entry.get())).pack(pady=7)
 
         # Back button with padding
         ttk.Button(frame, text="Back to Main Menu", command=lambda: self.main_menu(logged_in=True)).pack(pady=7)
@@ -419,7 +444,7 @@ class TrainTicketManagementGUI:
         seats_entry.pack(pady=5)
 
         # Cancel button with padding
-        ttk.Button(frame, text="Cancel",command=lambda: self.system.cancel_ticket(train_id_entry.get(), seats_entry.get())).pack(pady=10)
+        ttk.Button(frame, text="Cancel",command=lambda: self.confirm_cancellation(train_id_entry.get(), seats_entry.get())).pack(pady=10)
 
         # Back button with padding
         ttk.Button(frame, text="Back to Main Menu", command=lambda: self.main_menu(logged_in=True)).pack(pady=10)
@@ -427,46 +452,40 @@ class TrainTicketManagementGUI:
     def show_all_trains(self):
         self.setup_page_with_background()
 
-        # Create a frame with a scrollable canvas
-        outer_frame = ttk.Frame(self.root, width=500, height=400)
-        outer_frame.place(relx=0.5, rely=0.5, anchor="center")
-
-        # Canvas to hold the scrollable content
-        canvas = tk.Canvas(outer_frame, width=400, height=400)
-        scrollbar = ttk.Scrollbar(outer_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        # Pack the canvas and scrollbar
-        canvas.pack(side="left", fill="both", expand=True)
+        # Frame holding the filter, the train table and its scrollbar
+        outer_frame = ttk.Frame(self.root, width=700, height=430)
+        outer_frame.place(relx=0.5, rely=0.47, anchor="center")
+        outer_frame.pack_propagate(False)  # Keep the frame size fixed
+
+        # Title centered above the table
+        ttk.Label(outer_frame, text="All Trains", font=("Times New Roman", 30)).pack(pady=5)
+
+        # Station filter narrows the list as the user types
+        filter_frame = ttk.Frame(outer_frame)
+        filter_frame.pack(fill="x", padx=10)
+        ttk.Label(filter_frame, text="Station:").pack(side="left")
+        filter_entry = ttk.Entry(filter_frame, width=30)
+        filter_entry.pack(side="left", padx=5)
+        count_label = ttk.Label(filter_frame, text="")
+        count_label.pack(side="right")
+
+        # The table only ever holds the pages the user has scrolled through
+        table_frame = ttk.Frame(outer_frame)
+        table_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        tree = ttk.Treeview(table_frame, columns=TrainListView.COLUMNS, show="headings", height=12)
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+        tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
-        # Title centered above the scrollable content
-        title_label = ttk.Label(scrollable_frame, text="All Trains", font=("Times New Roman", 30))
-        title_label.pack(pady=10, anchor="center")
-
-        # Display each train's details in the scrollable frame (centered)
-        for train_id, train in self.system.trains.items():
-            train_details = (
-                f"Train ID: {train_id}\n"
-                f"Source: {train['route'][0]} | Destination: {train['route'][1]}\n"
-                f"Availability: {train['availability']} | Timings: {train['timings']} | Price: {train['price']}\n"
-            )
-            train_label = ttk.Label(scrollable_frame, text=train_details, justify="center", wraplength=650)
-            train_label.pack(pady=5, anchor="center")
-
-        # Frame for the back button (placed below the scrollable area)
+        self.train_list = TrainListView(self.root, self.system, tree, scrollbar, count_label)
+        filter_entry.bind("<KeyRelease>", lambda e: self.train_list.set_station(filter_entry.get()))
+        self.train_list.reload()
+
+        # Frame for the back button (placed below the table)
         back_button_frame = ttk.Frame(self.root)
-        back_button_frame.place(relx=0.5, rely=0.86, anchor="center")
+        back_button_frame.place(relx=0.5, rely=0.88, anchor="center")
 
-        # Back button (separated from the scrollable content)
+        # Back button (separated from the table)
         back_button = ttk.Button(back_button_frame, text="Back to Main Menu",
                                  command=lambda: self.main_menu(logged_in=True))
         back_button.pack(pady=0)
@@ -483,17 +502,220 @@ class TrainTicketManagementGUI:
         ttk.Label(frame, text="Booking Report", font=("Times New Roman", 30)).pack(pady=20)
 
         # Display the generated report content with wrapping and padding
-        report = self.system.generate_report()
+        report = self.system.generate_report(self.current_user)
         ttk.Label(frame, text=report, wraplength=550, justify="left").pack(pady=15)
 
         # Add a Back button with padding
         ttk.Button(frame, text="Back to Main Menu", command=lambda: self.main_menu(logged_in=True)).pack(pady=25)
 
+    def show_metrics(self):
+        """Admin view of the core's instrumentation: one row per timed operation."""
+        if self.current_user != ADMIN_EMAIL:
+            messagebox.showerror("Error", "Only admin can view metrics.")
+            return
+        self.setup_page_with_background()
+
+        frame = ttk.Frame(self.root, width=760, height=520)
+        frame.place(relx=0.5, rely=0.5, anchor="center")
+        frame.pack_propagate(False)
+
+        ttk.Label(frame, text="Metrics", font=("Times New Roman", 30)).pack(pady=10)
+
+        columns = ("operation", "count", "errors", "mean", "p50", "p99", "bytes")
+        headings = ("Operation", "Count", "Errors", "Mean (ms)", "p50 (ms)", "p99 (ms)", "Bytes")
+        tree = ttk.Treeview(frame, columns=columns, show="headings", height=14)
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=190 if column == "operation" else 85, anchor="w" if column == "operation" else "e")
+        tree.pack(pady=5, fill="x", padx=10)
+        cache_label = ttk.Label(frame, text="")
+        cache_label.pack(pady=2)
+
+        def refresh():
+            snapshot = json.loads(self.run_request(self.system.metrics_snapshot, self.current_user) or "{}")
+            tree.delete(*tree.get_children())
+            for name, stats in snapshot.get("operations", {}).items():
+                def ms(seconds):
+                    return "" if seconds is None else f"{seconds * 1000:.2f}"
+                tree.insert("", "end", values=(name, stats["count"], sum(stats["errors"].values()),
+                                               ms(stats["mean_seconds"]), ms(stats["p50_seconds"]),
+                                               ms(stats["p99_seconds"]), stats["bytes_persisted"]))
+            cache = snapshot.get("counters", {}).get("result_cache")
+            if cache:
+                cache_label.config(text=f"Result cache: {cache['entries']}/{cache['max_entries']} entries, "
+                                        f"{cache['hits']} hits, {cache['misses']} misses "
+                                        f"({cache['hit_ratio']:.0%}), {cache['invalidations']} invalidated")
+            toggle.config(text="Disable" if self.system.metrics.enabled else "Enable")
+
+        def toggle_instrumentation():
+            if self.system.metrics.enabled:
+                self.system.metrics.disable()
+            else:
+                self.system.metrics.enable(self.system)
+            refresh()
+
+        def export():
+            path = filedialog.asksaveasfilename(defaultextension=".json",
+                                                filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")])
+            if not path:
+                return
+            text = self.run_request(self.system.metrics_snapshot, self.current_user,
+                                    "prometheus" if path.endswith(".prom") else "json")
+            if text:
+                with open(path, "w") as file:
+                    file.write(text)
+                messagebox.showinfo("Success", f"Metrics exported to {path}.")
+
+        buttons = ttk.Frame(frame)
+        buttons.pack(pady=10)
+        toggle = ttk.Button(buttons, text="Enable", command=toggle_instrumentation)
+        toggle.pack(side="left", padx=5)
+        ttk.Button(buttons, text="Refresh", command=refresh).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Export", command=export).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Reset", command=lambda: (self.system.metrics.reset(), refresh())).pack(side="left", padx=5)
+        ttk.Button(frame, text="Back to Main Menu", command=lambda: self.main_menu(logged_in=True)).pack(pady=5)
+        refresh()
+
+    def show_analytics(self):
+        """Admin view of load factor, bookings and revenue, best sellers first, with CSV export."""
+        if self.current_user != ADMIN_EMAIL:
+            messagebox.showerror("Error", "Only admin can view analytics.")
+            return
+        self.setup_page_with_background()
+
+        frame = ttk.Frame(self.root, width=860, height=520)
+        frame.place(relx=0.5, rely=0.5, anchor="center")
+        frame.pack_propagate(False)
+
+        ttk.Label(frame, text="Analytics", font=("Times New Roman", 30)).pack(pady=10)
+        group = tk.StringVar(value="route")
+        groups = ttk.Frame(frame)
+        groups.pack(pady=5)
+        table = ttk.Frame(frame)
+        table.pack(pady=5, fill="x", padx=10)
+
+        def refresh():
+            report = self.run_request(self.system.analytics_report, self.current_user, group.get(), 100)
+            if report is None:
+                return
+            for child in table.winfo_children():
+                child.destroy()
+            tree = ttk.Treeview(table, columns=report["columns"], show="headings", height=14)
+            for column in report["columns"]:
+                tree.heading(column, text=column.replace("_", " ").title())
+                tree.column(column, width=95, anchor="w" if column in ("source", "destination", "station") else "e")
+            for row in report["rows"]:
+                tree.insert("", "end", values=tuple(f"{value:.1%}" if name == "load_factor" else
+                                                    f"{value:.2f}" if name == "revenue" else value
+                                                    for name, value in zip(report["columns"], row)))
+            tree.pack(fill="x")
+
+        def export():
+            path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+            if not path:
+                return
+            count = self.run_request(self.system.export_analytics, self.current_user, path, group.get())
+            if count is not None:
+                messagebox.showinfo("Success", f"Exported {count} rows to {path}.")
+
+        for name in ("route", "train", "hour", "station"):
+            ttk.Radiobutton(groups, text=f"By {name}", value=name, variable=group, command=refresh).pack(side="left", padx=5)
+        buttons = ttk.Frame(frame)
+        buttons.pack(pady=10)
+        ttk.Button(buttons, text="Refresh", command=refresh).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Export CSV", command=export).pack(side="left", padx=5)
+        ttk.Button(frame, text="Back to Main Menu", command=lambda: self.main_menu(logged_in=True)).pack(pady=5)
+        refresh()
+
+
+
+class TrainListView:
+    """Lazily paged train table for the All Trains screen.
+
+    Rows come from TrainTicketManagementSystem.list_trains one page at a time
+    as the user scrolls, so opening the screen costs one page no matter how
+    big the fleet is. Clicking a heading sorts on the server side.
+    """
+
+    COLUMNS = ("train_id", "source", "destination", "availability", "timings", "price")
+    HEADINGS = ("Train ID", "Source", "Destination", "Availability", "Timings", "Price")
+    # Column -> list_trains sort key (source/destination are not sortable)
+    SORT_KEYS = {"train_id": "train_id", "availability": "availability", "timings": "departure", "price": "price"}
+
+    def __init__(self, root, system, tree, scrollbar, count_label):
+        self.root = root
+        self.system = system
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.count_label = count_label
+        self.sort_by = "train_id"
+        self.descending = False
+        self.station = ""
+        self.loaded = 0
+        self.total = 0
+        self.filter_job = None
+        self.page_job = None
+        for column, heading in zip(self.COLUMNS, self.HEADINGS):
+            self.tree.heading(column, text=heading, command=lambda column=column: self.sort(column))
+            self.tree.column(column, width=100, anchor="center")
+        self.tree.configure(yscrollcommand=self.on_scroll)
+
+    def sort(self, column):
+        sort_by = self.SORT_KEYS.get(column)
+        if sort_by is None:
+            return
+        # Clicking the active column again flips the direction
+        self.descending = not self.descending if sort_by == self.sort_by else False
+        self.sort_by = sort_by
+        self.reload()
+
+    def set_station(self, station):
+        # Wait for a pause in typing before querying again
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(FILTER_DEBOUNCE_MS, self.apply_station, station.strip())
+
+    def apply_station(self, station):
+        self.filter_job = None
+        if station != self.station:
+            self.station = station
+            self.reload()
+
+    def reload(self):
+        self.tree.delete(*self.tree.get_children())
+        self.loaded = 0
+        self.total = 0
+        self.load_next_page()
+        self.tree.yview_moveto(0)
+
+    def load_next_page(self):
+        page = self.system.list_trains(self.sort_by, self.descending, self.station or None,
+                                       limit=TRAIN_PAGE_SIZE, offset=self.loaded)
+        for train in page["results"]:
+            details = train["details"]
+            self.tree.insert("", "end", values=(train["train_id"], details["route"][0], details["route"][1],
+                                                details["availability"], details["timings"], details["price"]))
+        self.loaded += len(page["results"])
+        self.total = page["total"]
+        self.count_label.config(text=f"Showing {self.loaded} of {self.total} trains")
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # Fetch the next page once the user nears the end of what is loaded
+        if float(last) > 0.9 and self.loaded < self.total and self.page_job is None:
+            self.page_job = self.root.after_idle(self.load_more)
+
+    def load_more(self):
+        self.page_job = None
+        if self.loaded < self.total:
+            self.load_next_page()
+
 
 if __name__ == "__main__":
     root = tk.Tk()
-    system = TrainTicketManagementSystem()
+    system = TrainTicketManagementSystem(trace_file=os.environ.get(TRACE_VARIABLE))
     app = TrainTicketManagementGUI(root, system)
     root.mainloop()
+    system.close()
 
 